@@ -17,18 +17,118 @@ def create_app():
     # Configuration
     app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'dev-secret-change-in-production')
     app.config['DATABASE'] = os.path.join(os.getcwd(), 'database.db')  # Changed filename
+    app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+    app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 268435456))  # 256MB
+    app.config['SQLITE_CACHED_STATEMENTS'] = int(os.environ.get('SQLITE_CACHED_STATEMENTS', 256))
     app.config['PUBLISHED_ROOT'] = os.environ.get('PUBLISHED_ROOT', os.path.join(os.getcwd(), 'published'))
     app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 16777216))  # 16MB
     app.config['UPLOAD_FOLDER'] = os.environ.get('UPLOAD_FOLDER', os.path.join(os.getcwd(), 'uploads'))
     app.config['WTF_CSRF_ENABLED'] = True
     app.config['ADMIN_SECRET_PATH'] = os.environ.get('ADMIN_SECRET_PATH', 'admin-panel-xyz123')
     app.config['WILDCARD_DOMAIN'] = os.environ.get('WILDCARD_DOMAIN', 'localhost:8080')
+    # Serve <sub>.<WILDCARD_DOMAIN> directly from a WSGI dispatcher (no Nginx wildcard block needed)
+    app.config['HOST_DISPATCH'] = os.environ.get('HOST_DISPATCH', 'false').lower() == 'true'
+    app.config['HOST_DISPATCH_RESERVED'] = [s.strip() for s in os.environ.get('HOST_DISPATCH_RESERVED', 'admin,www').split(',') if s.strip()]
+    app.config['ROUTING_REFRESH_INTERVAL'] = float(os.environ.get('ROUTING_REFRESH_INTERVAL', 2.0))  # seconds
+    app.config['ASGI_THREADS'] = int(os.environ.get('ASGI_THREADS', 32))  # asgi.py: pool for file lookups and admin views
+    # Landing assets: 'sendfile' (wsgi.file_wrapper, Range/If-Range handled here), or hand the file to the
+    # front server with 'x-accel-redirect' (Nginx internal location ASSET_ACCEL_PREFIX -> PUBLISHED_ROOT) / 'x-sendfile'
+    app.config['ASSET_DELIVERY'] = os.environ.get('ASSET_DELIVERY', 'sendfile').lower()
+    app.config['ASSET_ACCEL_PREFIX'] = os.environ.get('ASSET_ACCEL_PREFIX', '/_published/')
+    # Click/conversion beacons: ring buffer flushed to SQLite in batches
+    app.config['EVENT_BUFFER_SIZE'] = int(os.environ.get('EVENT_BUFFER_SIZE', 65536))
+    app.config['EVENT_FLUSH_BATCH'] = int(os.environ.get('EVENT_FLUSH_BATCH', 1000))
+    app.config['EVENT_FLUSH_INTERVAL_MS'] = int(os.environ.get('EVENT_FLUSH_INTERVAL_MS', 500))
+    # Analytics rollups (minute/hour/day) folded from raw events by a background aggregator
+    app.config['ROLLUP_INTERVAL'] = float(os.environ.get('ROLLUP_INTERVAL', 60))  # seconds, 0 = only via `flask rollup`
+    app.config['EVENT_RAW_RETENTION_HOURS'] = int(os.environ.get('EVENT_RAW_RETENTION_HOURS', 48))
+    app.config['ROLLUP_MINUTE_RETENTION_HOURS'] = int(os.environ.get('ROLLUP_MINUTE_RETENTION_HOURS', 48))
+    app.config['ROLLUP_HOUR_RETENTION_DAYS'] = int(os.environ.get('ROLLUP_HOUR_RETENTION_DAYS', 90))
+    # Each publish becomes published/<sub>/.v/<n>; older versions kept for rollback
+    app.config['PUBLISH_KEEP_VERSIONS'] = int(os.environ.get('PUBLISH_KEEP_VERSIONS', 5))
+    # Publish-time page optimization (app/optimizer.py): inline base64 images -> /_b/ files, HTML/CSS minified
+    app.config['HTML_OPTIMIZE'] = os.environ.get('HTML_OPTIMIZE', 'false').lower() == 'true'
+    app.config['PAGE_CACHE_MAX_ENTRIES'] = int(os.environ.get('PAGE_CACHE_MAX_ENTRIES', 256))
+    app.config['PAGE_CACHE_MAX_BYTES'] = int(os.environ.get('PAGE_CACHE_MAX_BYTES', 67108864))  # 64MB
+    # Uploaded image optimization (needs Pillow): EXIF strip + resized WebP/AVIF variants.
+    # Opt-in: uploaded JPEGs are re-encoded in place (q85)
+    app.config['IMAGE_OPTIMIZE'] = os.environ.get('IMAGE_OPTIMIZE', 'false').lower() == 'true'
+    app.config['IMAGE_WIDTHS'] = [int(w) for w in os.environ.get('IMAGE_WIDTHS', '480,960,1440').split(',') if w.strip()]
+    app.config['IMAGE_AVIF'] = os.environ.get('IMAGE_AVIF', 'false').lower() == 'true'
+    app.config['IMAGE_REWRITE_HTML'] = os.environ.get('IMAGE_REWRITE_HTML', 'false').lower() == 'true'
+    app.config['IMAGE_WORKERS'] = int(os.environ['IMAGE_WORKERS']) if os.environ.get('IMAGE_WORKERS') else None
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 60))  # seconds
+    app.config['USER_CACHE_MAX_ENTRIES'] = int(os.environ.get('USER_CACHE_MAX_ENTRIES', 128))
+    app.config['DASHBOARD_PAGE_SIZE'] = int(os.environ.get('DASHBOARD_PAGE_SIZE', 50))
+    app.config['API_PAGE_SIZE'] = int(os.environ.get('API_PAGE_SIZE', 100))
+    app.config['IMPORT_MAX_BYTES'] = int(os.environ.get('IMPORT_MAX_BYTES', 4 * 1024 ** 3))  # raw ZIP upload limit
+    app.config['BULK_WORKERS'] = int(os.environ['BULK_WORKERS']) if os.environ.get('BULK_WORKERS') else None
+    # Durable background jobs (publish, re-inject, import, cleanup) in SQLite, see app/jobs.py
+    app.config['JOB_WORKERS'] = int(os.environ.get('JOB_WORKERS', 2))  # threads per process, 0 = only `flask jobs-worker`
+    app.config['JOB_MAX_ATTEMPTS'] = int(os.environ.get('JOB_MAX_ATTEMPTS', 5))
+    app.config['JOB_RETRY_BASE'] = float(os.environ.get('JOB_RETRY_BASE', 2))  # seconds, doubled per attempt (max 300)
+    app.config['JOB_TIMEOUT'] = float(os.environ.get('JOB_TIMEOUT', 600))  # a job running longer is assumed dead
+    app.config['JOB_POLL_INTERVAL'] = float(os.environ.get('JOB_POLL_INTERVAL', 1))
+    app.config['JOB_RETENTION_HOURS'] = int(os.environ.get('JOB_RETENTION_HOURS', 168))
+    # Serving nodes kept in sync with PUBLISHED_ROOT by `flask replicate` (paths or file:// URLs, comma-separated)
+    app.config['REPLICA_TARGETS'] = [t.strip() for t in os.environ.get('REPLICA_TARGETS', '').split(',') if t.strip()]
+    app.config['REPLICA_SYNC_WORKERS'] = int(os.environ.get('REPLICA_SYNC_WORKERS', 8))
+    app.config['REPLICA_SYNC_INTERVAL'] = float(os.environ.get('REPLICA_SYNC_INTERVAL', 2))  # seconds, `replicate --watch`
+    # Request/SQL/bytes metrics at /metrics (Prometheus text, per worker process)
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN', '')  # Bearer token for scrapers; empty = admin login only
+    app.config['SLOW_REQUEST_MS'] = float(os.environ.get('SLOW_REQUEST_MS', 0))  # log slower requests with a stage breakdown, 0 = off
     
     # Subdomain support (commented out for now)
     # app.config['SERVER_NAME'] = 'localhost:5000'
 
     # Ensure publish root exists
     os.makedirs(app.config['PUBLISHED_ROOT'], exist_ok=True)
+
+    # In-memory cache of published pages served by /landing/<subdomain>
+    from .page_cache import PageCache
+    app.extensions['page_cache'] = PageCache(
+        max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'],
+        max_bytes=app.config['PAGE_CACHE_MAX_BYTES'],
+    )
+    
+    from .serving import AssetDelivery
+    app.extensions['asset_delivery'] = AssetDelivery(app.config['ASSET_DELIVERY'], app.config['PUBLISHED_ROOT'],
+                                                     app.config['ASSET_ACCEL_PREFIX'])
+
+    # user_loader cache: resolves the logged-in user without a DB round trip
+    from .auth import UserCache
+    app.extensions['user_cache'] = UserCache(
+        max_entries=app.config['USER_CACHE_MAX_ENTRIES'],
+        ttl=app.config['USER_CACHE_TTL'],
+    )
+
+    # Beacon events are buffered in memory and written by a background flusher
+    from .db import _connection_options
+    from .events import EventBuffer
+    app.extensions['event_buffer'] = EventBuffer(
+        app.config['DATABASE'],
+        capacity=app.config['EVENT_BUFFER_SIZE'],
+        batch_size=app.config['EVENT_FLUSH_BATCH'],
+        flush_interval_ms=app.config['EVENT_FLUSH_INTERVAL_MS'],
+        connect_options=_connection_options(app.config),
+    )
+    from .analytics import RollupAggregator, _retention_options
+    aggregator = RollupAggregator(app.config['DATABASE'], app.config['ROLLUP_INTERVAL'],
+                                  connect_options=_connection_options(app.config), **_retention_options(app.config))
+    app.extensions['rollup_aggregator'] = aggregator
+    # Started from the first request so each (forked) worker process runs its own thread
+    app.before_request(aggregator.ensure_running)
+
+    from .jobs import JobQueue, JobRunner
+    job_queue = JobQueue(app.config['DATABASE'], _connection_options(app.config),
+                         max_attempts=app.config['JOB_MAX_ATTEMPTS'], retry_base=app.config['JOB_RETRY_BASE'],
+                         timeout=app.config['JOB_TIMEOUT'])
+    app.extensions['job_queue'] = job_queue
+    runner = JobRunner(app, job_queue, threads=app.config['JOB_WORKERS'], poll_interval=app.config['JOB_POLL_INTERVAL'],
+                       retention=app.config['JOB_RETENTION_HOURS'] * 3600)
+    app.extensions['job_runner'] = runner
+    app.before_request(runner.ensure_running)
     
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -47,14 +147,47 @@ def create_app():
     def inject_config():
         return {'config': app.config}
 
+    # Schema (incl. users table and default admin) is migrated once; later boots only read PRAGMA user_version
     from .db import init_db
     init_db(app)
-    
-    # Initialize users table
-    from .auth import init_users_table
-    init_users_table()
 
     from .routes import bp as main_bp
     app.register_blueprint(main_bp)
 
+    from .cli import register_cli
+    register_cli(app)
+
+    # subdomain -> status map consulted on every landing request (pause is enforced at serve time)
+    from .host_routing import HostDispatcher, RoutingTable
+    table = RoutingTable(app.config['DATABASE'], app.config['PUBLISHED_ROOT'],
+                         refresh_interval=app.config['ROUTING_REFRESH_INTERVAL'])
+    table.load()
+    app.extensions['routing_table'] = table
+
+    if app.config['HOST_DISPATCH']:
+        app.wsgi_app = HostDispatcher(app.wsgi_app, table, app.extensions['page_cache'],
+                                      app.config['WILDCARD_DOMAIN'], reserved=app.config['HOST_DISPATCH_RESERVED'],
+                                      events=app.extensions['event_buffer'], delivery=app.extensions['asset_delivery'])
+
+    if app.config['METRICS_ENABLED']:
+        from flask import request
+        from .metrics import Metrics, MetricsMiddleware, app_stats
+        metrics = Metrics(known_subdomain=lambda subdomain: table.lookup(subdomain) is not None)
+        metrics.add_collector(lambda: app_stats(app.extensions))
+        from .jobs import job_stats
+        metrics.add_collector(lambda: job_stats(app.extensions['job_queue']))
+        app.extensions['metrics'] = metrics
+
+        @app.before_request
+        def label_request():
+            # Read back by MetricsMiddleware once the response has started
+            if request.endpoint:
+                request.environ['metrics.endpoint'] = request.endpoint
+            subdomain = (request.view_args or {}).get('subdomain')
+            if subdomain:
+                request.environ['landing.subdomain'] = subdomain
+
+        # Outermost, so host-dispatched landings are measured too
+        app.wsgi_app = MetricsMiddleware(app.wsgi_app, metrics, slow_ms=app.config['SLOW_REQUEST_MS'])
+
     return app
@@ -0,0 +1,227 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .db import connect
+from .events import EVENT_TYPES
+
+# Bucket width in seconds per rollup granularity, coarsest first
+GRANULARITIES = (('day', 86400), ('hour', 3600), ('minute', 60))
+BUCKET_SECONDS = dict(GRANULARITIES)
+WATERMARK_KEY = 'landing_events_rolled_up'
+
+
+def aggregate_events(db, now: Optional[int] = None, raw_retention: int = 2 * 86400,
+                     minute_retention: int = 2 * 86400, hour_retention: int = 90 * 86400) -> Dict[str, int]:
+    """
+    Fold raw landing_events newer than the watermark into the minute/hour/day
+    rollups, then compact: raw events already rolled up and older than
+    `raw_retention`, and minute/hour buckets past their retention, are deleted.
+
+    Runs in one BEGIN IMMEDIATE transaction, so several workers may call it
+    concurrently without double counting. Returns counts for logging.
+    """
+    now = int(now if now is not None else time.time())
+    with db:
+        db.execute('BEGIN IMMEDIATE')
+        row = db.execute('SELECT value FROM rollup_state WHERE name=?', (WATERMARK_KEY,)).fetchone()
+        low = row[0] if row else 0
+        high = db.execute('SELECT COALESCE(MAX(id), 0) FROM landing_events').fetchone()[0]
+        folded = 0
+        if high > low:
+            folded = db.execute('SELECT COUNT(*) FROM landing_events WHERE id > ? AND id <= ?', (low, high)).fetchone()[0]
+            for granularity, seconds in GRANULARITIES:
+                db.execute(
+                    """INSERT INTO event_rollups(granularity, bucket, subdomain, event, count)
+                       SELECT ?, created_at / ? * ?, subdomain, event, COUNT(*)
+                       FROM landing_events WHERE id > ? AND id <= ?
+                       GROUP BY created_at / ?, subdomain, event
+                       ON CONFLICT(granularity, bucket, subdomain, event) DO UPDATE SET count = count + excluded.count""",
+                    (granularity, seconds, seconds, low, high, seconds),
+                )
+            db.execute('INSERT INTO rollup_state(name, value) VALUES (?, ?) '
+                       'ON CONFLICT(name) DO UPDATE SET value = excluded.value', (WATERMARK_KEY, high))
+        compacted = db.execute('DELETE FROM landing_events WHERE id <= ? AND created_at < ?',
+                               (high, now - raw_retention)).rowcount
+        db.execute("DELETE FROM event_rollups WHERE granularity='minute' AND bucket < ?", (now - minute_retention,))
+        db.execute("DELETE FROM event_rollups WHERE granularity='hour' AND bucket < ?", (now - hour_retention,))
+    return {'folded': folded, 'compacted': compacted}
+
+
+def _retention_options(config) -> dict:
+    return {
+        'raw_retention': config['EVENT_RAW_RETENTION_HOURS'] * 3600,
+        'minute_retention': config['ROLLUP_MINUTE_RETENTION_HOURS'] * 3600,
+        'hour_retention': config['ROLLUP_HOUR_RETENTION_DAYS'] * 86400,
+    }
+
+
+class RollupAggregator:
+    """Background thread running aggregate_events() every `interval` seconds (one per worker process)."""
+
+    def __init__(self, db_path: str, interval: float, connect_options: Optional[dict] = None, **retention):
+        self.db_path = db_path
+        self.interval = interval
+        self.connect_options = connect_options or {}
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._pid = None
+        self.last_run = None
+
+    def ensure_running(self):
+        pid = os.getpid()
+        if self.interval <= 0 or self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            threading.Thread(target=self._run, name='rollup-aggregator', daemon=True).start()
+            self._pid = pid
+
+    def _run(self):
+        conn = connect(self.db_path, check_same_thread=False, **self.connect_options)
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.last_run = aggregate_events(conn, **self.retention)
+            except Exception as e:  # a locked/busy database must not kill the thread
+                print(f"Rollup aggregation failed: {e}")
+
+
+def _floor(ts: int, seconds: int) -> int:
+    return ts - ts % seconds
+
+
+def plan_ranges(start: int, end: int, finest: str = 'minute') -> List[Tuple[str, int, int]]:
+    """
+    Cover [start, end) with as few rollup buckets as possible: whole days in
+    the middle, hours and then minutes at the edges. Edges are widened to the
+    `finest` granularity available.
+    """
+    finest_seconds = BUCKET_SECONDS[finest]
+    start = _floor(start, finest_seconds)
+    end = -_floor(-end, finest_seconds)
+    ranges = []
+
+    def cover(lo, hi, level):
+        if lo >= hi:
+            return
+        granularity, seconds = GRANULARITIES[level]
+        inner_lo, inner_hi = -_floor(-lo, seconds), _floor(hi, seconds)
+        if seconds == finest_seconds or inner_lo >= inner_hi:
+            if seconds == finest_seconds:
+                ranges.append((granularity, lo, hi))
+            else:
+                cover(lo, hi, level + 1)
+            return
+        ranges.append((granularity, inner_lo, inner_hi))
+        cover(lo, inner_lo, level + 1)
+        cover(inner_hi, hi, level + 1)
+
+    cover(start, end, 0)
+    return ranges
+
+
+def _range_clause(ranges) -> Tuple[str, List[Any]]:
+    clauses, params = [], []
+    for granularity, lo, hi in ranges:
+        clauses.append('(r.granularity=? AND r.bucket>=? AND r.bucket<?)')
+        params += [granularity, lo, hi]
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+def _empty_counts() -> Dict[str, int]:
+    return {event: 0 for event in EVENT_TYPES}
+
+
+def landing_totals(db, start: int, end: int, finest: str = 'minute', subdomains: Optional[Iterable[str]] = None,
+                   agent: str = '') -> Dict[str, Dict[str, int]]:
+    """{subdomain: {event: count}} over [start, end) from the rollups."""
+    ranges = plan_ranges(start, end, finest)
+    if not ranges:
+        return {}
+    where, params = _range_clause(ranges)
+    sql = 'SELECT r.subdomain, r.event, SUM(r.count) FROM event_rollups r'
+    if agent:
+        sql += ' JOIN landing_pages lp ON lp.subdomain = r.subdomain'
+        where += ' AND lp.agent=?'
+        params.append(agent)
+    if subdomains is not None:
+        subdomains = list(subdomains)
+        if not subdomains:
+            return {}
+        where += f" AND r.subdomain IN ({','.join('?' * len(subdomains))})"
+        params += subdomains
+    totals: Dict[str, Dict[str, int]] = {}
+    for subdomain, event, count in db.execute(f'{sql} WHERE {where} GROUP BY r.subdomain, r.event', params):
+        totals.setdefault(subdomain, _empty_counts())[event] = count
+    return totals
+
+
+def agent_totals(db, start: int, end: int, finest: str = 'minute') -> List[Dict[str, Any]]:
+    """Per-agent totals: rollups joined to landing_pages.agent and the agents table."""
+    ranges = plan_ranges(start, end, finest)
+    if not ranges:
+        return []
+    where, params = _range_clause(ranges)
+    rows = db.execute(
+        f"""SELECT lp.agent, a.id, a.phone, r.event, SUM(r.count), COUNT(DISTINCT r.subdomain)
+            FROM event_rollups r
+            JOIN landing_pages lp ON lp.subdomain = r.subdomain
+            LEFT JOIN (SELECT name, MIN(id) AS id, phone FROM agents GROUP BY name) a ON a.name = lp.agent
+            WHERE {where}
+            GROUP BY lp.agent, r.event""",
+        params,
+    ).fetchall()
+    agents: Dict[Any, Dict[str, Any]] = {}
+    for agent, agent_id, phone, event, count, landings in rows:
+        item = agents.setdefault(agent, {'agent': agent or '', 'agent_id': agent_id, 'phone': phone,
+                                         'landings': 0, **_empty_counts()})
+        item[event] = count
+        item['landings'] = max(item['landings'], landings)
+    return sorted(agents.values(), key=lambda a: -sum(a[e] for e in EVENT_TYPES))
+
+
+def series(db, start: int, end: int, granularity: str, subdomain: str = '') -> List[Dict[str, Any]]:
+    """Per-bucket totals of one granularity, for charts."""
+    seconds = BUCKET_SECONDS[granularity]
+    sql = ('SELECT bucket, event, SUM(count) FROM event_rollups '
+           'WHERE granularity=? AND bucket>=? AND bucket<?')
+    params: List[Any] = [granularity, _floor(start, seconds), end]
+    if subdomain:
+        sql += ' AND subdomain=?'
+        params.append(subdomain)
+    points: Dict[int, Dict[str, Any]] = {}
+    for bucket, event, count in db.execute(sql + ' GROUP BY bucket, event ORDER BY bucket', params):
+        points.setdefault(bucket, {'bucket': bucket, **_empty_counts()})[event] = count
+    return list(points.values())
+
+
+def finest_available(start: int, config, now: Optional[int] = None) -> str:
+    """Minute buckets only exist inside their retention window; older edges fall back to hours/days."""
+    now = int(now if now is not None else time.time())
+    if start >= now - config['ROLLUP_MINUTE_RETENTION_HOURS'] * 3600:
+        return 'minute'
+    if start >= now - config['ROLLUP_HOUR_RETENTION_DAYS'] * 86400:
+        return 'hour'
+    return 'day'
+
+
+def parse_time(value: Optional[str], default: int) -> int:
+    """Unix seconds from a query value: a number, YYYY-MM-DD or an ISO-8601 datetime (UTC if naive)."""
+    from datetime import datetime, timezone
+    if not value:
+        return default
+    value = value.strip()
+    if value.lstrip('-').isdigit():
+        return int(value)
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp())
+
+
+def get_aggregator() -> RollupAggregator:
+    from flask import current_app
+    return current_app.extensions['rollup_aggregator']
@@ -0,0 +1,367 @@
+import asyncio
+import io
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from werkzeug.wrappers import Response
+
+from .blobs import BLOB_URL_PREFIX
+from .events import BEACON_PATH, beacon_response, parse_beacon
+from .host_routing import HostDispatcher
+from .metrics import begin_request, end_request, finish_request
+from .page_cache import page_response
+from .publishing import INDEX_FILENAME, resolve_landing_dir, version_dir
+from .serving import asset_response, blob_response, is_page_file, paused_response
+
+FILE_CHUNK = 256 * 1024
+# Request bodies of admin calls are kept in memory up to this size, then spooled to disk
+BODY_SPOOL_SIZE = 1024 * 1024
+
+LANDING_PATH_RE = re.compile(r'^/landing/([^/]+)(?:/(.*))?$')
+VERSIONED_ASSET_RE = re.compile(r'^_v/([0-9]+)/(.+)$')
+
+
+class FileBody:
+    """
+    wsgi.file_wrapper handed to file_response(): lets the ASGI side read (or
+    sendfile) the file itself, from its current offset for Content-Length bytes.
+    """
+
+    def __init__(self, file, buffer_size: int = FILE_CHUNK):
+        self.file = file
+        self.buffer_size = buffer_size
+
+    def read(self, size: int = -1) -> bytes:
+        return self.file.read(size)
+
+    def __iter__(self):
+        while True:
+            chunk = self.file.read(self.buffer_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        self.file.close()
+
+
+def build_environ(scope, body) -> dict:
+    """WSGI environ for an ASGI http scope; `body` is a file-like object with the request body."""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    path = scope.get('path', '/')
+    root_path = scope.get('root_path', '')
+    if root_path and path.startswith(root_path):
+        path = path[len(root_path):]
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': root_path.encode('utf-8').decode('latin-1'),
+        'PATH_INFO': path.encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        'wsgi.input_terminated': True,  # the body is complete, with or without Content-Length
+        'wsgi.file_wrapper': FileBody,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+            continue
+        key = 'HTTP_' + name
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _encode_headers(headers) -> list:
+    return [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+
+class LandingASGI:
+    """
+    ASGI application serving public landing traffic without a thread per connection.
+
+    Landing pages, assets, versioned/blob URLs and beacons (host-based like
+    HostDispatcher, and the /landing/<sub>/... paths of the blueprint) are
+    answered here with the same routing table, page cache, pause check and
+    cache headers as the WSGI app. Only the short lookup/stat/open step runs
+    in a small thread pool; bodies are streamed with `await send()`, so a slow
+    client costs a coroutine, not a worker. File bodies are read in chunks off
+    the event loop, or handed to the server with the ASGI pathsend extension
+    when it offers one. Everything else (admin, API, login) is passed to the
+    Flask WSGI app through a thread-pool adapter.
+    """
+
+    def __init__(self, flask_app, threads: Optional[int] = None):
+        self.flask_app = flask_app
+        config = flask_app.config
+        self.pub_root = config['PUBLISHED_ROOT']
+        self.table = flask_app.extensions['routing_table']
+        self.page_cache = flask_app.extensions['page_cache']
+        self.events = flask_app.extensions['event_buffer']
+        self.delivery = flask_app.extensions['asset_delivery']
+        self.aggregator = flask_app.extensions['rollup_aggregator']
+        self.metrics = flask_app.extensions.get('metrics')  # Flask requests are counted by MetricsMiddleware
+        self.slow_ms = config.get('SLOW_REQUEST_MS', 0)
+        self.hosts = HostDispatcher(None, self.table, self.page_cache, config['WILDCARD_DOMAIN'],
+                                    reserved=config['HOST_DISPATCH_RESERVED'], events=self.events,
+                                    delivery=self.delivery) \
+            if config['HOST_DISPATCH'] else None
+        self.executor = ThreadPoolExecutor(max_workers=threads or config.get('ASGI_THREADS') or 32,
+                                           thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            return  # websockets are not used
+        self.aggregator.ensure_running()
+        route = self._public_handler(scope)
+        if route is None:
+            return await self._call_wsgi(scope, receive, send)
+        endpoint, subdomain, handler = route
+        body = io.BytesIO(await self._read_body(receive, limit=64 * 1024)) \
+            if scope['method'] == 'POST' else io.BytesIO()
+        environ = build_environ(scope, body)
+        environ['metrics.endpoint'] = endpoint
+        if subdomain:
+            environ['landing.subdomain'] = subdomain
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(self.executor, self._handle, handler, environ)
+        await self._send_response(response, environ, scope, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(None, self.events.flush)
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def _handle(self, handler, environ) -> Response:
+        """Run a native handler in the pool, timing it like MetricsMiddleware times Flask requests."""
+        if self.metrics is None:
+            return handler(environ)
+        started = time.perf_counter()
+        timings = begin_request()
+        try:
+            response = handler(environ)
+        finally:
+            end_request()
+        finish_request(self.metrics, environ, response.status, response.content_length or 0,
+                       time.perf_counter() - started, timings, self.slow_ms)
+        return response
+
+    def _public_handler(self, scope):
+        """
+        (metrics endpoint label, subdomain, sync function) answering this request
+        natively, or None to hand it to Flask. Labels match the blueprint endpoints.
+        """
+        method, path = scope['method'], scope.get('path', '/')
+        if self.hosts is not None:
+            host = next((v.decode('latin-1') for k, v in scope.get('headers', []) if k == b'host'), '')
+            subdomain = self.hosts.subdomain_for(host)
+            if subdomain is not None:
+                return 'host_dispatch', subdomain, lambda environ: self.hosts.serve(subdomain, environ)
+        if path == BEACON_PATH and method == 'POST':
+            return 'main.landing_event_beacon', None, self._beacon
+        if method not in ('GET', 'HEAD'):
+            return None
+        if path.startswith(BLOB_URL_PREFIX) and '/' not in path[len(BLOB_URL_PREFIX):]:
+            return 'main.serve_blob', None, lambda environ: self._blob(path[len(BLOB_URL_PREFIX):], environ)
+        m = LANDING_PATH_RE.match(path)
+        if m is None:
+            return None
+        subdomain, rest = m.group(1), m.group(2)
+        if rest is None:
+            return 'main.serve_landing_simple', subdomain, lambda environ: self._landing(subdomain, environ)
+        if not rest:
+            return None  # /landing/<sub>/: let Flask answer as it always did
+        versioned = VERSIONED_ASSET_RE.match(rest)
+        if versioned:
+            return 'main.serve_landing_versioned_asset', subdomain, \
+                lambda environ: self._asset(version_dir(self.pub_root, subdomain, int(versioned.group(1))),
+                                            versioned.group(2), environ, immutable=True, subdomain=subdomain)
+        return 'main.serve_landing_assets_simple', subdomain, \
+            lambda environ: self._asset(resolve_landing_dir(self.pub_root, subdomain), rest, environ,
+                                        subdomain=subdomain)
+
+    # The handlers below mirror the blueprint views in routes.py
+
+    def _landing(self, subdomain: str, environ) -> Response:
+        route = self.table.lookup(subdomain)
+        if route is not None and route.status == 'paused':
+            return paused_response(environ)
+        index_file = os.path.join(resolve_landing_dir(self.pub_root, subdomain), INDEX_FILENAME)
+        try:
+            entry = self.page_cache.get(subdomain, index_file)
+        except Exception as e:
+            return Response(f"<h1>Error loading landing page: {str(e)}</h1>", status=500, mimetype='text/html')
+        if entry is None:
+            return Response(f"<h1>Landing page '{subdomain}' not found</h1><p>Please check if the landing page "
+                            f"has been uploaded correctly.</p>", status=404, mimetype='text/html')
+        return page_response(entry, environ)
+
+    def _asset(self, directory: str, filename: str, environ, immutable: bool = False,
+               subdomain: Optional[str] = None) -> Response:
+        if subdomain is not None and is_page_file(filename):
+            route = self.table.lookup(subdomain)
+            if route is not None and route.status == 'paused':
+                return paused_response(environ)
+        response = asset_response(directory, filename, environ, immutable=immutable, delivery=self.delivery)
+        return response if response is not None else Response('File not found', status=404, mimetype='text/html')
+
+    def _blob(self, name: str, environ) -> Response:
+        response = blob_response(self.pub_root, name, environ, delivery=self.delivery)
+        return response if response is not None else Response('File not found', status=404, mimetype='text/html')
+
+    def _beacon(self, environ) -> Response:
+        subdomain, event = parse_beacon(environ)
+        if self.table.lookup(subdomain) is None:
+            subdomain = None
+        return beacon_response(self.events, subdomain, event)
+
+    async def _send_response(self, response: Response, environ, scope, send):
+        loop = asyncio.get_running_loop()
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                    'headers': _encode_headers(headers)})
+        in_memory = not response.direct_passthrough and response.is_sequence
+        try:
+            if isinstance(app_iter, FileBody):
+                # The file is positioned at the range start; Content-Length is what to send from there
+                file = app_iter.file
+                remaining = response.content_length
+                name = getattr(file, 'name', None)
+                if ('http.response.pathsend' in scope.get('extensions', {}) and isinstance(name, str)
+                        and file.tell() == 0 and remaining == os.fstat(file.fileno()).st_size):
+                    # Whole file: let the server sendfile it
+                    await send({'type': 'http.response.pathsend', 'path': os.path.abspath(name)})
+                    return
+                while remaining is None or remaining > 0:
+                    size = FILE_CHUNK if remaining is None else min(FILE_CHUNK, remaining)
+                    chunk = await loop.run_in_executor(self.executor, file.read, size)
+                    if not chunk:
+                        break
+                    if remaining is not None:
+                        remaining -= len(chunk)
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            elif in_memory:
+                # Cached pages, placeholders, errors: no I/O left, send from the event loop
+                for chunk in app_iter:
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            else:
+                iterator = iter(app_iter)
+                while True:
+                    chunk = await loop.run_in_executor(self.executor, next, iterator, None)
+                    if chunk is None:
+                        break
+                    if chunk:
+                        await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            close = getattr(app_iter, 'close', None)
+            if close is not None:
+                if in_memory:
+                    close()
+                else:
+                    await loop.run_in_executor(self.executor, close)
+
+    async def _read_body(self, receive, limit: Optional[int] = None) -> bytes:
+        chunks, size = [], 0
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if limit is None or size <= limit:
+                chunks.append(chunk)
+            if not message.get('more_body'):
+                break
+        return b''.join(chunks)
+
+    async def _call_wsgi(self, scope, receive, send):
+        """Run the Flask app in the thread pool; large request bodies are spooled to disk first."""
+        loop = asyncio.get_running_loop()
+        body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            chunk = message.get('body', b'')
+            if chunk:
+                if body._rolled or body.tell() + len(chunk) > BODY_SPOOL_SIZE:
+                    await loop.run_in_executor(self.executor, body.write, chunk)
+                else:
+                    body.write(chunk)
+            if not message.get('more_body'):
+                break
+        body.seek(0)
+        environ = build_environ(scope, body)
+
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        def run():
+            started = []
+
+            limit = []
+
+            def start_response(status, headers, exc_info=None):
+                if exc_info and started:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                started[:] = [(int(status.split(' ', 1)[0]), _encode_headers(headers))]
+                # Never send more than Content-Length (file bodies run from their offset to EOF)
+                limit[:] = [int(v) for k, v in headers if k.lower() == 'content-length' and v.isdigit()][:1]
+
+            def ensure_started():
+                if started and started[0] is not None:
+                    status, headers = started[0]
+                    send_sync({'type': 'http.response.start', 'status': status, 'headers': headers})
+                    started[0] = None
+
+            # Iterated in this one thread so Flask contexts pushed by streamed responses stay valid
+            app_iter = self.flask_app(environ, start_response)
+            try:
+                remaining = None
+                for chunk in app_iter:
+                    if remaining is None and limit:
+                        remaining = limit[0]
+                    if remaining is not None:
+                        chunk = chunk[:remaining]
+                        remaining -= len(chunk)
+                    if chunk:
+                        ensure_started()
+                        send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+                    if remaining == 0:
+                        break
+                ensure_started()
+                send_sync({'type': 'http.response.body', 'body': b'', 'more_body': False})
+            finally:
+                if hasattr(app_iter, 'close'):
+                    app_iter.close()
+                body.close()
+
+        await loop.run_in_executor(self.executor, run)
@@ -1,7 +1,64 @@
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
-import sqlite3
-import os
+from .db import get_db
+
+
+class UserCache:
+    """
+    Small TTL + LRU cache of User objects keyed by id, used by the Flask-Login
+    user_loader so authenticated requests do not hit SQLite. The TTL bounds how
+    long another worker can keep serving a user whose password was changed.
+    """
+
+    def __init__(self, max_entries=128, ttl=60):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id):
+        key = str(user_id)
+        with self._lock:
+            item = self._entries.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._entries[key]
+            self.misses += 1
+        return None
+
+    def put(self, user):
+        key = str(user.id)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id=None):
+        """Drop one user (or everything when user_id is None)."""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(str(user_id), None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+def get_user_cache():
+    return current_app.extensions['user_cache']
+
 
 class User(UserMixin):
     def __init__(self, id, username, password_hash):
@@ -11,27 +68,24 @@ class User(UserMixin):
     
     @staticmethod
     def get(user_id):
-        """Get user by ID"""
-        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database.db')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, username, password_hash FROM users WHERE id = ?', (user_id,))
-        row = cursor.fetchone()
-        conn.close()
+        """Get user by ID (served from the user cache when possible)"""
+        cache = get_user_cache()
+        user = cache.get(user_id)
+        if user is not None:
+            return user
+
+        row = get_db().execute('SELECT id, username, password_hash FROM users WHERE id = ?', (user_id,)).fetchone()
         
         if row:
-            return User(row[0], row[1], row[2])
+            user = User(row[0], row[1], row[2])
+            cache.put(user)
+            return user
         return None
     
     @staticmethod
     def get_by_username(username):
         """Get user by username"""
-        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database.db')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
-        cursor.execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,))
-        row = cursor.fetchone()
-        conn.close()
+        row = get_db().execute('SELECT id, username, password_hash FROM users WHERE username = ?', (username,)).fetchone()
         
         if row:
             return User(row[0], row[1], row[2])
@@ -40,55 +94,30 @@ class User(UserMixin):
     def check_password(self, password):
         """Check if provided password matches hash"""
         return check_password_hash(self.password_hash, password)
+
+    def set_password(self, new_password):
+        """Change password and drop the cached copy of this user"""
+        self.password_hash = generate_password_hash(new_password)
+        db = get_db()
+        db.execute('UPDATE users SET password_hash = ? WHERE id = ?', (self.password_hash, self.id))
+        db.commit()
+        get_user_cache().invalidate(self.id)
     
     @staticmethod
     def create_user(username, password):
         """Create new user"""
-        db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database.db')
-        conn = sqlite3.connect(db_path)
-        cursor = conn.cursor()
+        db = get_db()
         
         # Check if user already exists
-        cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
-        if cursor.fetchone():
-            conn.close()
+        if db.execute('SELECT id FROM users WHERE username = ?', (username,)).fetchone():
             return None
         
         password_hash = generate_password_hash(password)
-        cursor.execute(
+        cursor = db.execute(
             'INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, datetime("now"))',
             (username, password_hash)
         )
-        conn.commit()
-        user_id = cursor.lastrowid
-        conn.close()
+        db.commit()
+        get_user_cache().invalidate(cursor.lastrowid)
         
-        return User(user_id, username, password_hash)
-
-def init_users_table():
-    """Initialize users table if not exists"""
-    db_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database.db')
-    conn = sqlite3.connect(db_path)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            created_at TEXT DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Create default admin user if not exists
-    cursor.execute('SELECT id FROM users WHERE username = ?', ('admin',))
-    if not cursor.fetchone():
-        password_hash = generate_password_hash('admin123')  # Default password
-        cursor.execute(
-            'INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, datetime("now"))',
-            ('admin', password_hash)
-        )
-        print("✅ Created default admin user: admin/admin123")
-    
-    conn.commit()
-    conn.close()
\ No newline at end of file
+        return User(cursor.lastrowid, username, password_hash)
@@ -0,0 +1,168 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from typing import Dict, Optional
+
+BLOBS_DIR = '.blobs'
+BLOB_URL_PREFIX = '/_b/'
+BLOB_NAME_RE = re.compile(r'^[0-9a-f]{64}(\.[a-z0-9]{1,10})?$')
+
+# Content-addressed store shared by all landings:
+#   published/.blobs/ab/ab12...ef.jpg    one file per distinct (content, extension)
+# Every published file is a hardlink of its blob, so identical images/CSS of
+# cloned landings (and unchanged files across versions) take disk space once.
+# A blob whose link count drops to 1 is referenced by no version any more.
+
+
+def blobs_root(pub_root: str) -> str:
+    return os.path.join(pub_root, BLOBS_DIR)
+
+
+def blob_name(digest: str, filename: str) -> str:
+    ext = os.path.splitext(filename)[1].lower()
+    return digest + (ext if re.fullmatch(r'\.[a-z0-9]{1,10}', ext) else '')
+
+
+def blob_path(pub_root: str, name: str) -> str:
+    return os.path.join(blobs_root(pub_root), name[:2], name)
+
+
+def blob_url(name: str) -> str:
+    return BLOB_URL_PREFIX + name
+
+
+def file_digest(path: str) -> str:
+    # hashlib.file_digest() is 3.11+; the supported Ubuntu releases ship 3.8/3.10
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def intern_file(pub_root: str, path: str) -> Optional[str]:
+    """
+    Make `path` a hardlink of the blob holding its content, adding the blob if
+    it is new. Returns the blob name, or None when the store is on another
+    filesystem (the file is then left as it is).
+    """
+    name = blob_name(file_digest(path), path)
+    target = blob_path(pub_root, name)
+    for _ in range(3):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)  # first copy of these bytes: the file becomes the blob
+            return name
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            continue  # empty shard dir removed by a concurrent collect_garbage()
+        except OSError:
+            return None
+        if os.path.samefile(path, target):
+            return name
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.link(target, tmp)
+        except FileNotFoundError:
+            continue  # collected between the two links; store ours instead
+        os.replace(tmp, path)
+        return name
+    return None
+
+
+def intern_tree(pub_root: str, directory: str, only_new: bool = True,
+                digests: Optional[Dict[str, str]] = None) -> Dict[str, int]:
+    """
+    Intern every regular file below `directory`. With `only_new`, files that
+    already have other links (inherited from the previous version) are skipped
+    without hashing. `digests`, if given, is filled with {path: blob name} of
+    the files interned. Returns counts for logging.
+    """
+    stats = {'files': 0, 'deduplicated': 0, 'bytes_saved': 0}
+    for root, dirs, files in os.walk(directory):
+        # Skip the store itself and scratch dirs of publishes/optimizations in progress
+        dirs[:] = [d for d in dirs if d != BLOBS_DIR and not d.startswith(('.staging-', '.images-'))]
+        for filename in files:
+            path = os.path.join(root, filename)
+            if filename.endswith('.tmp') or filename == '.lock' or os.path.islink(path):
+                continue
+            st = os.stat(path)
+            if only_new and st.st_nlink > 1:
+                continue
+            name = intern_file(pub_root, path)
+            if name is None:
+                continue
+            if digests is not None:
+                digests[path] = name
+            stats['files'] += 1
+            if os.stat(path).st_ino != st.st_ino:
+                stats['deduplicated'] += 1
+                stats['bytes_saved'] += st.st_size
+    return stats
+
+
+def blob_urls(pub_root: str, directory: str) -> Dict[str, str]:
+    """{relative path: /_b/ URL} for the files of a published dir that are in the store."""
+    urls = {}
+    for root, _, files in os.walk(directory):
+        for filename in files:
+            path = os.path.join(root, filename)
+            target = blob_path(pub_root, blob_name(file_digest(path), filename))
+            if os.path.exists(target) and os.path.samefile(path, target):
+                urls[os.path.relpath(path, directory).replace(os.sep, '/')] = blob_url(os.path.basename(target))
+    return urls
+
+
+def collect_garbage(pub_root: str, grace: int = 3600, dry_run: bool = False,
+                    now: Optional[float] = None) -> Dict[str, int]:
+    """
+    Delete blobs no published version links to any more (link count 1).
+
+    Blobs whose links changed within `grace` seconds are kept, so a publish
+    that is linking one right now never loses it.
+    """
+    now = now if now is not None else time.time()
+    stats = {'blobs': 0, 'removed': 0, 'bytes_freed': 0}
+    root = blobs_root(pub_root)
+    if not os.path.isdir(root):
+        return stats
+    for shard in os.scandir(root):
+        if not shard.is_dir(follow_symlinks=False):
+            continue
+        for entry in os.scandir(shard.path):
+            st = entry.stat(follow_symlinks=False)
+            stats['blobs'] += 1
+            if st.st_nlink > 1 or now - st.st_ctime < grace:
+                continue
+            if not dry_run:
+                os.remove(entry.path)
+            stats['removed'] += 1
+            stats['bytes_freed'] += st.st_size
+        if not dry_run:
+            try:
+                os.rmdir(shard.path)  # only succeeds once the shard is empty
+            except OSError:
+                pass
+    return stats
+
+
+def store_stats(pub_root: str) -> Dict[str, int]:
+    """Distinct blobs and bytes on disk vs. the bytes all their links would take as copies."""
+    stats = {'blobs': 0, 'links': 0, 'stored_bytes': 0, 'linked_bytes': 0}
+    root = blobs_root(pub_root)
+    if not os.path.isdir(root):
+        return stats
+    for shard in os.scandir(root):
+        if not shard.is_dir(follow_symlinks=False):
+            continue
+        for entry in os.scandir(shard.path):
+            st = entry.stat(follow_symlinks=False)
+            stats['blobs'] += 1
+            stats['links'] += st.st_nlink - 1
+            stats['stored_bytes'] += st.st_size
+            stats['linked_bytes'] += st.st_size * (st.st_nlink - 1)
+    stats['saved_bytes'] = max(stats['linked_bytes'] - stats['stored_bytes'], 0)
+    return stats
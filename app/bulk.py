@@ -0,0 +1,150 @@
+import contextlib
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Callable, ContextManager, Dict, List, Optional
+
+from .publishing import publish
+from .utils import TRACKING_FIELDS, inject_tracking, render_tracking_snippets
+
+
+def reinject_site(pub_root: str, subdomain: str, tracking: Dict[str, str],
+                  keep: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Process-pool entry point: re-inject one landing's tracking codes as a new published version.
+
+    Works on index.paused.html when the landing is paused so the placeholder is
+    left alone.
+    """
+    started = time.perf_counter()
+    result = {'subdomain': subdomain, 'ok': False}
+    try:
+        head_snippet, body_snippet = render_tracking_snippets(*(tracking[k] for k in TRACKING_FIELDS))
+        # The page is read inside publish()'s lock, so an update landing meanwhile is not lost
+        result['version'] = publish(pub_root, subdomain, keep=keep,
+                                    transform=lambda html: inject_tracking(html, head_snippet, body_snippet))
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    result['ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def merge_tracking(landing: Dict[str, Any], new_values: Dict[str, str]) -> Dict[str, str]:
+    """Tracking values for one landing: the new ones where given, its current ones otherwise."""
+    return {k: (new_values[k] if k in new_values else (landing.get(k) or '')) for k in TRACKING_FIELDS}
+
+
+def reinject_landings(pub_root: str, landings: List[Dict[str, Any]], new_values: Dict[str, str],
+                      workers: Optional[int] = None,
+                      progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                      keep: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Re-inject tracking codes into every landing in `landings` using a process pool.
+
+    Returns {'results': [...per site...], 'updates': [...rows for
+    repository.bulk_update_landings...], 'elapsed_s': float}. Only landings
+    whose file was rewritten successfully appear in 'updates'.
+    """
+    started = time.perf_counter()
+    results, updates = [], []
+    by_subdomain = {l['subdomain']: l for l in landings}
+    if landings:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(reinject_site, pub_root, l['subdomain'], merge_tracking(l, new_values), keep)
+                for l in landings
+            ]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result['ok']:
+                    landing = by_subdomain[result['subdomain']]
+                    updates.append({'id': landing['id'], **merge_tracking(landing, new_values)})
+                if progress:
+                    progress(result)
+    return {
+        'results': results,
+        'updates': updates,
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+
+
+def run_reinject(filters: Dict[str, str], new_values: Dict[str, str], workers: Optional[int] = None,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 hold: Optional[Callable[[List[str]], ContextManager[List[str]]]] = None) -> Dict[str, Any]:
+    """
+    Select landings by filter, re-inject them in parallel and record the new values in one transaction.
+
+    With `hold` (JobQueue.hold_locks of the running job) landings are only
+    touched while locked against update/cleanup jobs; those busy are done in a
+    later round, and every round works on the rows as they are once locked.
+    """
+    from flask import current_app
+    from . import repository
+    from .page_cache import get_page_cache
+
+    landings = repository.find_landings(
+        agent=filters.get('agent', ''),
+        status=filters.get('status', ''),
+        subdomain_glob=filters.get('subdomain', ''),
+    )
+    pub_root, keep = current_app.config['PUBLISHED_ROOT'], current_app.config.get('PUBLISH_KEEP_VERSIONS')
+    started = time.perf_counter()
+    results, updated = [], 0
+    pending = [l['subdomain'] for l in landings]
+    while pending:
+        with hold(pending) if hold else contextlib.nullcontext(pending) as held:
+            if held:
+                # Re-read under the lock: a landing updated or deleted meanwhile is not reverted
+                rows = repository.landings_by_subdomain(held) if hold else landings
+                run = reinject_landings(pub_root, rows, new_values, workers, progress, keep)
+                repository.bulk_update_landings(run['updates'])
+                results += run['results']
+                updated += len(run['updates'])
+        if not held:
+            time.sleep(0.5)
+        done = set(held)
+        pending = [s for s in pending if s not in done]
+    cache = get_page_cache()
+    for result in results:
+        cache.invalidate(result['subdomain'])
+    failed = [r for r in results if not r['ok']]
+    return {
+        'matched': len(landings),
+        'updated': updated,
+        'failed': len(failed),
+        'elapsed_s': round(time.perf_counter() - started, 3),
+        'results': sorted(results, key=lambda r: r['subdomain']),
+    }
+
+
+def run_set_status(filters: Dict[str, str], new_status: str) -> Dict[str, Any]:
+    """
+    Pause/resume every landing matching {agent, subdomain glob} in one transaction.
+
+    This worker's status map is updated right away; the other workers pick the
+    change up from the landing_changes log within ROUTING_REFRESH_INTERVAL.
+    """
+    from flask import current_app
+    from . import repository
+    from .host_routing import get_routing_table
+    from .page_cache import get_page_cache
+    from .publishing import restore_paused_page
+
+    started = time.perf_counter()
+    changed = repository.bulk_set_status(new_status, agent=filters.get('agent', ''),
+                                         subdomain_glob=filters.get('subdomain', ''))
+    table = get_routing_table()
+    for landing in changed:
+        table.upsert(landing['subdomain'], new_status)
+    if new_status == 'active':
+        cache = get_page_cache()
+        for landing in changed:
+            if restore_paused_page(current_app.config['PUBLISHED_ROOT'], landing['subdomain'],
+                                   current_app.config.get('PUBLISH_KEEP_VERSIONS')) is not None:
+                cache.invalidate(landing['subdomain'])
+    return {
+        'changed': len(changed),
+        'subdomains': [l['subdomain'] for l in changed],
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
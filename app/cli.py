@@ -0,0 +1,312 @@
+import click
+from flask.cli import with_appcontext
+
+from .utils import TRACKING_FIELDS
+
+
+@click.command('reinject')
+@click.option('--agent', default='', help='Only landings of this agent (exact match)')
+@click.option('--status', default='', type=click.Choice(['', 'active', 'paused']), help='Only landings with this status')
+@click.option('--subdomain', default='', help="Subdomain glob, e.g. 'shop-*'")
+@click.option('--global-site-tag', default=None)
+@click.option('--phone-tracking', default=None)
+@click.option('--zalo-tracking', default=None)
+@click.option('--form-tracking', default=None)
+@click.option('--workers', default=None, type=int, help='Process pool size (default: CPU count)')
+@with_appcontext
+def reinject_command(agent, status, subdomain, workers, **tracking):
+    """Re-inject tracking codes into all matching landing pages in parallel."""
+    from .bulk import run_reinject
+
+    new_values = {k: v.strip() for k, v in tracking.items() if k in TRACKING_FIELDS and v is not None}
+    if not new_values:
+        raise click.UsageError('Cần ít nhất một mã tracking mới (--global-site-tag, --phone-tracking, ...)')
+
+    done = [0]
+
+    def progress(result):
+        done[0] += 1
+        state = 'OK' if result['ok'] else f"LỖI: {result.get('error')}"
+        click.echo(f"[{done[0]}] {result['subdomain']}: {state} ({result['ms']} ms)")
+
+    summary = run_reinject({'agent': agent, 'status': status, 'subdomain': subdomain}, new_values, workers, progress)
+    click.echo(f"Khớp {summary['matched']}, cập nhật {summary['updated']}, lỗi {summary['failed']} "
+               f"trong {summary['elapsed_s']}s")
+
+
+@click.command('rollback')
+@click.argument('subdomain')
+@click.option('--version', default=None, type=int, help='Version to restore (default: the one before current)')
+@click.option('--list', 'list_only', is_flag=True, help='Only list the published versions')
+@with_appcontext
+def rollback_command(subdomain, version, list_only):
+    """Point a landing back at one of its previously published versions."""
+    from flask import current_app
+    from .page_cache import get_page_cache
+    from .publishing import current_version, list_versions, rollback
+
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    if list_only:
+        current = current_version(pub_root, subdomain)
+        for v in list_versions(pub_root, subdomain):
+            click.echo(f"{v}{' (current)' if v == current else ''}")
+        return
+    try:
+        version = rollback(pub_root, subdomain, version)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    get_page_cache().invalidate(subdomain)
+    click.echo(f"{subdomain}: đã khôi phục phiên bản {version}")
+
+
+@click.command('set-status')
+@click.argument('status', type=click.Choice(['active', 'paused']))
+@click.option('--agent', default='', help='Landings of this agent (exact match)')
+@click.option('--subdomain', default='', help="Subdomain glob, e.g. 'shop-*'")
+@with_appcontext
+def set_status_command(status, agent, subdomain):
+    """Pause/resume all landings of an agent in one transaction."""
+    from .bulk import run_set_status
+
+    if not agent and not subdomain:
+        raise click.UsageError('Cần chọn --agent hoặc --subdomain')
+    summary = run_set_status({'agent': agent, 'subdomain': subdomain}, status)
+    for sub in summary['subdomains']:
+        click.echo(f"{sub}: {status}")
+    click.echo(f"Đã đổi trạng thái {summary['changed']} landing page trong {summary['elapsed_s']}s")
+
+
+@click.command('rollup')
+@with_appcontext
+def rollup_command():
+    """Fold raw beacon events into the minute/hour/day rollups and compact old data."""
+    from flask import current_app
+    from .analytics import _retention_options, aggregate_events
+    from .db import get_db
+
+    result = aggregate_events(get_db(), **_retention_options(current_app.config))
+    click.echo(f"Đã tổng hợp {result['folded']} sự kiện, xóa {result['compacted']} sự kiện thô cũ")
+
+
+@click.command('import-zip')
+@click.argument('archive', type=click.Path(exists=True, dir_okay=False))
+@click.option('--agent', default='', help='Agent for sites not listed in landings.csv')
+@click.option('--global-site-tag', default='')
+@click.option('--phone-tracking', default='')
+@click.option('--zalo-tracking', default='')
+@click.option('--form-tracking', default='')
+@click.option('--workers', default=None, type=int, help='Process pool size (default: CPU count)')
+@with_appcontext
+def import_zip_command(archive, workers, **defaults):
+    """Publish every site folder (<subdomain>/index.html ...) of a ZIP archive and register them."""
+    from .importer import run_import
+
+    def progress(result, done, total):
+        state = 'OK' if result['ok'] else f"LỖI: {result.get('error')}"
+        click.echo(f"[{done}/{total}] {result['subdomain']}: {state} ({result.get('ms', 0)} ms)")
+
+    summary = run_import(archive, {k: v.strip() for k, v in defaults.items()}, workers, progress)
+    for name in summary['skipped_unsafe']:
+        click.echo(f"Bỏ qua đường dẫn không an toàn: {name}")
+    click.echo(f"Nhập {summary['imported']}/{summary['sites']} site, lỗi {summary['failed']} "
+               f"trong {summary['elapsed_s']}s")
+
+
+@click.command('dedupe')
+@with_appcontext
+def dedupe_command():
+    """Move every already published file into the blob store (one-off for trees published before it)."""
+    from flask import current_app
+    from .blobs import intern_tree, store_stats
+    from .manifests import refresh_manifest
+    from .publishing import list_sites, site_dir
+
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    result = {'files': 0, 'deduplicated': 0, 'bytes_saved': 0}
+    for subdomain in list_sites(pub_root):
+        for key, value in intern_tree(pub_root, site_dir(pub_root, subdomain), only_new=False).items():
+            result[key] += value
+        refresh_manifest(pub_root, subdomain)  # relinked files have the blob's mtime now
+    stats = store_stats(pub_root)
+    click.echo(f"Đã xử lý {result['files']} file, gộp {result['deduplicated']} bản trùng "
+               f"({result['bytes_saved']} bytes)")
+    click.echo(f"Kho blob: {stats['blobs']} blob, {stats['stored_bytes']} bytes lưu, "
+               f"tiết kiệm {stats['saved_bytes']} bytes")
+
+
+@click.command('gc-blobs')
+@click.option('--grace', default=3600, type=int, help='Keep blobs whose links changed within this many seconds')
+@click.option('--purge-deleted', is_flag=True, help='First remove published dirs of landings no longer in the database')
+@click.option('--dry-run', is_flag=True, help='Only report what would be removed')
+@with_appcontext
+def gc_blobs_command(grace, purge_deleted, dry_run):
+    """Delete blobs that no published version links to any more."""
+    from flask import current_app
+    from . import repository
+    from .blobs import collect_garbage
+    from .publishing import list_sites, remove_site
+
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    if purge_deleted:
+        known = {landing['subdomain'] for landing in repository.find_landings()}
+        for subdomain in list_sites(pub_root):
+            if subdomain not in known:
+                click.echo(f"Xóa thư mục của landing đã xóa: {subdomain}")
+                if not dry_run:
+                    remove_site(pub_root, subdomain)
+    result = collect_garbage(pub_root, grace=grace, dry_run=dry_run)
+    click.echo(f"{'Sẽ xóa' if dry_run else 'Đã xóa'} {result['removed']}/{result['blobs']} blob, "
+               f"giải phóng {result['bytes_freed']} bytes")
+
+
+@click.command('optimize')
+@click.option('--agent', default='', help='Only landings of this agent (exact match)')
+@click.option('--subdomain', default='', help="Subdomain glob, e.g. 'shop-*'")
+@with_appcontext
+def optimize_command(agent, subdomain):
+    """Publish matching landings again through the page optimizer and report the savings."""
+    import os
+    from flask import current_app
+    from . import repository
+    from .optimizer import optimize_landing, page_weight_fields
+    from .page_cache import get_page_cache
+    from .publishing import publish, resolve_landing_dir, source_page
+
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    before = after = 0
+    for landing in repository.find_landings(agent=agent, subdomain_glob=subdomain):
+        sub = landing['subdomain']
+        page = source_page(resolve_landing_dir(pub_root, sub))
+        if not os.path.exists(page):
+            click.echo(f"{sub}: không có trang đã publish, bỏ qua")
+            continue
+        report = {}
+        publish(pub_root, sub, keep=current_app.config['PUBLISH_KEEP_VERSIONS'],
+                populate=lambda staging: report.update(optimize_landing(pub_root, staging, os.path.basename(page))))
+        get_page_cache().invalidate(sub)
+        repository.update_landing(landing['id'], page_weight_fields(report))
+        before, after = before + report['bytes_before'], after + report['bytes_after']
+        click.echo(f"{sub}: {report['bytes_before']} -> {report['bytes_after']} bytes (-{report['saved_pct']}%), "
+                   f"gzip {report['gzip_before']} -> {report['gzip_after']}, {report['inline_images']} ảnh inline "
+                   f"tách ra ({report['inline_image_bytes']} bytes)")
+    click.echo(f"Tổng: {before} -> {after} bytes")
+
+
+@click.command('jobs-worker')
+@click.option('--threads', default=4, type=int, help='Jobs run at the same time')
+@with_appcontext
+def jobs_worker_command(threads):
+    """Run background jobs until interrupted (e.g. a systemd service with JOB_WORKERS=0 on the web workers)."""
+    from flask import current_app
+
+    click.echo(f"Job worker: {threads} luồng, Ctrl+C để dừng")
+    try:
+        current_app.extensions['job_runner'].run_forever(threads)
+    except KeyboardInterrupt:
+        pass
+
+
+@click.command('build-manifests')
+@click.option('--workers', default=8, type=int, help='Threads hashing files')
+@with_appcontext
+def build_manifests_command(workers):
+    """Write the manifest of every published landing (one-off for trees published before manifests)."""
+    from flask import current_app
+    from .manifests import rebuild_manifests
+
+    count = rebuild_manifests(current_app.config['PUBLISHED_ROOT'], workers)
+    click.echo(f"Đã cập nhật manifest của {count} landing")
+
+
+@click.command('replicate')
+@click.option('--target', 'targets', multiple=True, help='Replica path or URL (default: REPLICA_TARGETS)')
+@click.option('--watch', is_flag=True, help='Keep syncing every REPLICA_SYNC_INTERVAL seconds')
+@click.option('--full', is_flag=True, help='Diff every landing, not only those changed since the last sync')
+@click.option('--workers', default=None, type=int, help='Landings synced in parallel (default: REPLICA_SYNC_WORKERS)')
+@with_appcontext
+def replicate_command(targets, watch, full, workers):
+    """Copy changed published files to the replicas (incremental, from the publish manifests)."""
+    import time
+    from flask import current_app
+    from .replication import Replicator
+
+    config = current_app.config
+    targets = targets or config['REPLICA_TARGETS']
+    if not targets:
+        raise click.UsageError('Chưa có replica (--target hoặc REPLICA_TARGETS)')
+    try:
+        replicators = [Replicator(config['PUBLISHED_ROOT'], t, workers or config['REPLICA_SYNC_WORKERS']) for t in targets]
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+    while True:
+        for replicator in replicators:
+            try:
+                totals = replicator.sync(full)
+            except Exception as e:  # an unreachable replica must not hold up the others
+                click.echo(f"{replicator.target}: LỖI {e}")
+                continue
+            if totals:
+                click.echo(f"{replicator.target}: {totals['landings']} landing, gửi {totals['sent']} file "
+                           f"({totals['bytes']} bytes, {totals['wire_bytes']} bytes nén), "
+                           f"xóa {totals['removed']}, lỗi {totals['failed']} trong {totals['ms']} ms")
+                for error in totals['errors']:
+                    click.echo(f"  {error}")
+        if not watch:
+            break
+        full = False
+        time.sleep(config['REPLICA_SYNC_INTERVAL'])
+
+
+@click.command('scan')
+@click.option('--verify', is_flag=True, help='Hash every file again instead of trusting unchanged dirs')
+@click.option('--reclaim', 'reclaim_space', is_flag=True,
+              help='Remove orphan dirs, restore stale paused pages of active landings and collect blobs')
+@click.option('--grace', default=3600, type=int, help='Keep orphan dirs/blobs changed within this many seconds')
+@click.option('--top', default=20, type=int, help='Landings listed by disk usage')
+@click.option('--workers', default=None, type=int, help='Threads scanning sites (default: BULK_WORKERS)')
+@with_appcontext
+def scan_command(verify, reclaim_space, grace, top, workers):
+    """Cross-check landing_pages against the published tree."""
+    from flask import current_app
+    from .consistency import run_scan
+
+    report = run_scan(verify, reclaim_space, grace, workers or current_app.config['BULK_WORKERS'])
+    click.echo(f"{report['landings']} landing trong DB, {report['sites']} thư mục, "
+               f"{report['disk']['files']} file / {report['disk']['bytes']} bytes, "
+               f"{report['changed_files']} file đổi từ lần quét trước, {report['elapsed_s']}s")
+    for orphan in report['orphans']:
+        click.echo(f"Thư mục thừa (không có trong DB): {orphan['subdomain']} "
+                   f"({orphan['exclusive_bytes']} bytes riêng, {orphan['age_s']}s)")
+    for missing in report['missing']:
+        reason = 'không có thư mục' if missing['reason'] == 'no_dir' else 'không có index.html'
+        click.echo(f"Thiếu trang: {missing['subdomain']} (id {missing['id']}, {reason})")
+    for paused in report['stale_paused']:
+        click.echo(f"Còn index.paused.html: {paused['subdomain']} ({paused['status']})")
+    for modified in report['modified']:
+        click.echo(f"File bị sửa sau khi publish: {modified['subdomain']}/{modified['path']}")
+    for subdomain in report['stale_manifests']:
+        click.echo(f"Manifest không còn thư mục: {subdomain}")
+    for usage in report['usage'][:top]:
+        click.echo(f"  {usage['subdomain']}: {usage['bytes']} bytes ({usage['exclusive_bytes']} riêng), "
+                   f"{usage['files']} file, {usage['versions']} phiên bản")
+    if reclaim_space:
+        reclaimed = report['reclaimed']
+        click.echo(f"Đã xóa {len(reclaimed['removed'])} thư mục thừa, khôi phục {len(reclaimed['restored'])} trang, "
+                   f"xóa {reclaimed['manifests_removed']} manifest, {reclaimed['blobs']['removed']} blob "
+                   f"({reclaimed['blobs']['bytes_freed']} bytes)")
+
+
+def register_cli(app):
+    app.cli.add_command(reinject_command)
+    app.cli.add_command(rollback_command)
+    app.cli.add_command(set_status_command)
+    app.cli.add_command(rollup_command)
+    app.cli.add_command(import_zip_command)
+    app.cli.add_command(dedupe_command)
+    app.cli.add_command(gc_blobs_command)
+    app.cli.add_command(optimize_command)
+    app.cli.add_command(jobs_worker_command)
+    app.cli.add_command(build_manifests_command)
+    app.cli.add_command(replicate_command)
+    app.cli.add_command(scan_command)
@@ -0,0 +1,147 @@
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from .manifests import load_manifest, manifest_path, manifests_root, refresh_manifest, remove_manifest
+from .publishing import (CURRENT_LINK, INDEX_FILENAME, PAUSED_FILENAME, VERSIONS_DIR, current_target, list_sites,
+                         remove_site, site_dir)
+
+# Cross-check of landing_pages against PUBLISHED_ROOT (`flask scan`, GET /api/consistency):
+#   orphans        site dirs without a row (deleted before deletes cleaned up, or half-done creates)
+#   missing        rows without a site dir, or whose live dir has no page (e.g. scripts/register_landing.py)
+#   stale_paused   live dirs still holding index.paused.html from the old file-shuffle pause
+#   modified       files whose bytes changed after publish (edited in place or corrupted)
+#   usage          per landing: bytes of its distinct files and bytes no other landing shares
+# Sites are scanned in a thread pool through their manifests (app/manifests.py), so a
+# dir unchanged since the last scan or publish costs one stat and no file is re-read.
+
+_VERSION_DIR_RE = re.compile(rf'^{re.escape(VERSIONS_DIR)}/\d+$')
+
+
+def _scan_site(pub_root: str, subdomain: str, verify: bool):
+    previous = load_manifest(pub_root, subdomain)
+    return subdomain, previous, refresh_manifest(pub_root, subdomain, verify)
+
+
+def _live_prefix(pub_root: str, subdomain: str, manifest: Dict[str, Any]) -> str:
+    # `current` is a symlink, or a pointer file where symlinks are not allowed
+    current = manifest['links'].get(CURRENT_LINK) or current_target(site_dir(pub_root, subdomain))
+    return current.rstrip('/') + '/' if current else ''
+
+
+def scan_published(pub_root: str, landings: Dict[str, Dict[str, Any]], workers: Optional[int] = None,
+                   verify: bool = False) -> Dict[str, Any]:
+    """
+    Compare the site dirs under pub_root with `landings` ({subdomain: row}).
+    With `verify` every file is hashed again instead of trusting unchanged
+    dirs/mtimes. Returns the report described at the top of this module.
+    """
+    started = time.perf_counter()
+    sites = list_sites(pub_root)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        scanned = list(pool.map(lambda sub: _scan_site(pub_root, sub, verify), sites))
+
+    report = {'landings': len(landings), 'sites': len(sites), 'orphans': [], 'missing': [], 'stale_paused': [],
+              'modified': [], 'stale_manifests': [], 'usage': [], 'changed_files': 0}
+    sizes, shared = {}, {}
+    for subdomain, previous, manifest in scanned:
+        if manifest is None:
+            continue  # removed meanwhile
+        for digest, size, _ in manifest['files'].values():
+            sizes[digest] = size
+        for digest in {entry[0] for entry in manifest['files'].values()}:
+            shared[digest] = shared.get(digest, 0) + 1
+
+    now = time.time()
+    for subdomain, previous, manifest in scanned:
+        if manifest is None:
+            continue
+        old_files = previous['files'] if previous else {}
+        for path, entry in manifest['files'].items():
+            old = old_files.get(path)
+            if old != entry:
+                report['changed_files'] += 1
+            if old and old[0] != entry[0]:
+                report['modified'].append({'subdomain': subdomain, 'path': path})
+        digests = {entry[0] for entry in manifest['files'].values()}
+        usage = {
+            'subdomain': subdomain,
+            'files': len(manifest['files']),
+            'versions': sum(1 for d in manifest['dirs'] if _VERSION_DIR_RE.match(d)),
+            'bytes': sum(sizes[d] for d in digests),
+            'exclusive_bytes': sum(sizes[d] for d in digests if shared[d] == 1),
+        }
+        report['usage'].append(usage)
+        landing = landings.get(subdomain)
+        live = _live_prefix(pub_root, subdomain, manifest)
+        if landing is None:
+            age = now - os.stat(site_dir(pub_root, subdomain)).st_mtime if os.path.isdir(site_dir(pub_root, subdomain)) else 0
+            report['orphans'].append({'subdomain': subdomain, 'bytes': usage['bytes'],
+                                      'exclusive_bytes': usage['exclusive_bytes'], 'age_s': round(age)})
+            continue
+        if live + PAUSED_FILENAME in manifest['files']:
+            report['stale_paused'].append({'subdomain': subdomain, 'id': landing['id'], 'status': landing['status']})
+        elif live + INDEX_FILENAME not in manifest['files']:
+            report['missing'].append({'subdomain': subdomain, 'id': landing['id'], 'status': landing['status'],
+                                      'reason': 'no_page'})
+
+    present = {subdomain for subdomain, _, manifest in scanned if manifest is not None}
+    for subdomain, landing in landings.items():
+        if subdomain not in present:
+            report['missing'].append({'subdomain': subdomain, 'id': landing['id'], 'status': landing['status'],
+                                      'reason': 'no_dir'})
+    root = manifests_root(pub_root)
+    if os.path.isdir(root):
+        for entry in os.scandir(root):
+            if entry.name.endswith('.json') and not entry.name.startswith('.') and entry.name[:-5] not in present:
+                report['stale_manifests'].append(entry.name[:-5])
+
+    report['usage'].sort(key=lambda u: u['bytes'], reverse=True)
+    report['disk'] = {'bytes': sum(sizes.values()), 'files': sum(u['files'] for u in report['usage'])}
+    report['elapsed_s'] = round(time.perf_counter() - started, 3)
+    return report
+
+
+def reclaim(pub_root: str, report: Dict[str, Any], grace: int = 3600, keep: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Act on a scan report: remove orphan site dirs older than `grace` seconds
+    (younger ones may be a create still in progress), give active landings
+    their page back from index.paused.html, drop manifests of vanished dirs
+    and collect blobs nothing links any more.
+    """
+    from .blobs import collect_garbage
+    from .publishing import restore_paused_page
+
+    result = {'removed': [], 'restored': [], 'manifests_removed': 0}
+    for orphan in report['orphans']:
+        if orphan['age_s'] >= grace and remove_site(pub_root, orphan['subdomain']):
+            result['removed'].append(orphan['subdomain'])
+    for paused in report['stale_paused']:
+        if paused['status'] == 'active' and restore_paused_page(pub_root, paused['subdomain'], keep) is not None:
+            result['restored'].append(paused['subdomain'])
+    for subdomain in report['stale_manifests']:
+        if not os.path.isdir(site_dir(pub_root, subdomain)) and os.path.exists(manifest_path(pub_root, subdomain)):
+            remove_manifest(pub_root, subdomain)
+            result['manifests_removed'] += 1
+    # Blobs of the dirs removed now are past `grace` only at a later run
+    result['blobs'] = collect_garbage(pub_root, grace=grace)
+    return result
+
+
+def run_scan(verify: bool = False, reclaim_space: bool = False, grace: int = 3600,
+             workers: Optional[int] = None) -> Dict[str, Any]:
+    """Scan against all landing_pages rows (one query), optionally reclaiming space."""
+    from flask import current_app
+    from . import repository
+    from .page_cache import get_page_cache
+
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    report = scan_published(pub_root, repository.landing_index(), workers, verify)
+    if reclaim_space:
+        report['reclaimed'] = reclaim(pub_root, report, grace, current_app.config.get('PUBLISH_KEEP_VERSIONS'))
+        cache = get_page_cache()
+        for subdomain in report['reclaimed']['removed'] + report['reclaimed']['restored']:
+            cache.invalidate(subdomain)
+    return report
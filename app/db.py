@@ -1,6 +1,12 @@
+import os
 import sqlite3
+import threading
+from typing import Optional
+
 from flask import current_app, g
 
+from .metrics import TimedConnection
+
 SCHEMA_SQL = """
 CREATE TABLE IF NOT EXISTS landing_pages (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -19,45 +25,357 @@ CREATE TABLE IF NOT EXISTS landing_pages (
     updated_at TEXT DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Dashboard/API listing is keyset-paginated on (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_landing_pages_created ON landing_pages(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_landing_pages_status ON landing_pages(status, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_landing_pages_agent ON landing_pages(agent, created_at DESC, id DESC);
+
+-- Change-notification channel for the per-worker subdomain -> status map: every
+-- insert/status change/delete of a landing appends its subdomain here in the same
+-- transaction, so workers only re-read what changed since the last seq they saw
+CREATE TABLE IF NOT EXISTS landing_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    subdomain TEXT NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS landing_changes_ai AFTER INSERT ON landing_pages BEGIN
+    INSERT INTO landing_changes(subdomain) VALUES (new.subdomain);
+END;
+CREATE TRIGGER IF NOT EXISTS landing_changes_au AFTER UPDATE OF subdomain, status ON landing_pages
+WHEN old.subdomain IS NOT new.subdomain OR old.status IS NOT new.status BEGIN
+    INSERT INTO landing_changes(subdomain) VALUES (old.subdomain);
+    INSERT INTO landing_changes(subdomain) SELECT new.subdomain WHERE new.subdomain IS NOT old.subdomain;
+END;
+CREATE TRIGGER IF NOT EXISTS landing_changes_ad AFTER DELETE ON landing_pages BEGIN
+    INSERT INTO landing_changes(subdomain) VALUES (old.subdomain);
+END;
+-- Keep the log bounded; a worker that fell further behind reloads the whole map
+CREATE TRIGGER IF NOT EXISTS landing_changes_trim AFTER INSERT ON landing_changes
+WHEN new.seq % 1000 = 0 BEGIN
+    DELETE FROM landing_changes WHERE seq <= new.seq - 10000;
+END;
+
+-- Raw click/conversion beacons (see app/events.py); created_at is a unix timestamp
+CREATE TABLE IF NOT EXISTS landing_events (
+    id INTEGER PRIMARY KEY,
+    subdomain TEXT NOT NULL,
+    event TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_landing_events_created ON landing_events(created_at);
+
+-- Event counts per minute/hour/day bucket (bucket = unix start), maintained by app/analytics.py
+CREATE TABLE IF NOT EXISTS event_rollups (
+    granularity TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    subdomain TEXT NOT NULL,
+    event TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (granularity, bucket, subdomain, event)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_event_rollups_subdomain ON event_rollups(granularity, subdomain, bucket);
+
+CREATE TABLE IF NOT EXISTS rollup_state (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS agents (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL,
     phone TEXT,
     created_at TEXT DEFAULT CURRENT_TIMESTAMP
 );
+-- Agent stats join agents.name = landing_pages.agent
+CREATE INDEX IF NOT EXISTS idx_agents_name ON agents(name);
+"""
+
+# Trigram full-text index over subdomain/agent so substring search does not scan the table.
+# Kept in sync by triggers; needs SQLite >= 3.34 built with FTS5.
+SEARCH_SCHEMA_SQL = """
+CREATE VIRTUAL TABLE landing_search USING fts5(
+    subdomain, agent, content='landing_pages', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER landing_search_ai AFTER INSERT ON landing_pages BEGIN
+    INSERT INTO landing_search(rowid, subdomain, agent) VALUES (new.id, new.subdomain, new.agent);
+END;
+CREATE TRIGGER landing_search_ad AFTER DELETE ON landing_pages BEGIN
+    INSERT INTO landing_search(landing_search, rowid, subdomain, agent) VALUES ('delete', old.id, old.subdomain, old.agent);
+END;
+CREATE TRIGGER landing_search_au AFTER UPDATE OF subdomain, agent ON landing_pages BEGIN
+    INSERT INTO landing_search(landing_search, rowid, subdomain, agent) VALUES ('delete', old.id, old.subdomain, old.agent);
+    INSERT INTO landing_search(rowid, subdomain, agent) VALUES (new.id, new.subdomain, new.agent);
+END;
+INSERT INTO landing_search(landing_search) VALUES ('rebuild');
+"""
+
+# Background jobs (app/jobs.py); times are unix timestamps
+JOBS_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    idempotency_key TEXT,
+    lock_key TEXT,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_after REAL NOT NULL,
+    locked_by TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    UNIQUE (kind, idempotency_key)
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_runnable ON jobs(status, run_after);
 """
 
+# Locks on single landings taken by a running job that spans many (bulk re-inject); see JobQueue.hold_locks
+JOB_LOCKS_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS job_locks (
+    lock_key TEXT PRIMARY KEY,
+    job_id INTEGER NOT NULL
+);
+"""
+
+# landing_events as rebuilt by _migrate_event_ids: ids are never reused
+EVENTS_SCHEMA_SQL = """
+CREATE TABLE landing_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    subdomain TEXT NOT NULL,
+    event TEXT NOT NULL,
+    created_at INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_landing_events_created ON landing_events(created_at);
+"""
+
+_search_index_available: Optional[bool] = None
+
+
+def has_search_index() -> bool:
+    """Whether the trigram index exists (checked once per process, on first search)."""
+    global _search_index_available
+    if _search_index_available is None:
+        _search_index_available = get_db().execute(
+            "SELECT 1 FROM sqlite_master WHERE type='table' AND name='landing_search'"
+        ).fetchone() is not None
+    return _search_index_available
+
+
+_local = threading.local()
+
+
+def connect(path: str, busy_timeout_ms: int = 5000, mmap_size: int = 268435456,
+            cached_statements: int = 256, check_same_thread: bool = True) -> sqlite3.Connection:
+    """
+    Open a connection tuned for many gunicorn workers sharing one database file:
+    WAL (readers never block the writer), synchronous=NORMAL, a busy timeout
+    instead of immediate 'database is locked', memory-mapped reads and a larger
+    prepared-statement cache.
+    """
+    conn = sqlite3.connect(
+        path,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        timeout=busy_timeout_ms / 1000,
+        cached_statements=cached_statements,
+        check_same_thread=check_same_thread,
+    )
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(busy_timeout_ms)}')
+    conn.execute(f'PRAGMA mmap_size={int(mmap_size)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
+def get_connection(path: str, **options) -> sqlite3.Connection:
+    """
+    Persistent connection for the current thread, opened on first use.
+
+    Connections are never shared across threads, and a forked worker (pid
+    change) starts with a fresh pool instead of reusing the parent's handles.
+    """
+    pid = os.getpid()
+    if getattr(_local, 'pid', None) != pid:
+        _local.pid = pid
+        _local.connections = {}
+    conn = _local.connections.get(path)
+    if conn is None:
+        conn = connect(path, **options)
+        _local.connections[path] = conn
+    return conn
+
+
+def _connection_options(config) -> dict:
+    return {
+        'busy_timeout_ms': config['SQLITE_BUSY_TIMEOUT_MS'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+        'cached_statements': config['SQLITE_CACHED_STATEMENTS'],
+    }
+
 
 def get_db():
     if 'db' not in g:
-        g.db = sqlite3.connect(
-            current_app.config['DATABASE'],
-            detect_types=sqlite3.PARSE_DECLTYPES
-        )
-        g.db.row_factory = sqlite3.Row
+        g.db = get_connection(current_app.config['DATABASE'], **_connection_options(current_app.config))
+        metrics = current_app.extensions.get('metrics')
+        if metrics is not None:
+            g.db = TimedConnection(g.db, metrics)  # per-request query count/time, see app/metrics.py
     return g.db
 
 
 def close_db(e=None):
     db = g.pop('db', None)
-    if db is not None:
-        db.close()
+    # The connection stays open for the next request on this thread; just make
+    # sure a failed request does not leave a transaction (and its locks) behind
+    if db is not None and db.in_transaction:
+        db.rollback()
+
+
+def close_all_connections():
+    """Close this thread's pooled connections (tests, worker shutdown)."""
+    for conn in getattr(_local, 'connections', {}).values():
+        conn.close()
+    _local.connections = {}
+
+
+def _statements(script: str):
+    """Split a schema script into statements (trigger bodies contain ';')."""
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement.strip()
+            statement = ''
+
+
+def _migrate_base_schema(db):
+    for statement in _statements(SCHEMA_SQL):
+        db.execute(statement)
+    # Databases created before these columns existed
+    existing_cols = {r[1] for r in db.execute("PRAGMA table_info(landing_pages)").fetchall()}
+    for col, ddl in [
+        ('hotline_phone', "ALTER TABLE landing_pages ADD COLUMN hotline_phone TEXT"),
+        ('zalo_phone', "ALTER TABLE landing_pages ADD COLUMN zalo_phone TEXT"),
+        ('google_form_link', "ALTER TABLE landing_pages ADD COLUMN google_form_link TEXT")
+    ]:
+        if col not in existing_cols:
+            db.execute(ddl)
+
+
+def _migrate_users(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Create default admin user if not exists (hashed once here, not on every boot)
+    if not db.execute('SELECT id FROM users WHERE username = ?', ('admin',)).fetchone():
+        from werkzeug.security import generate_password_hash
+        db.execute(
+            'INSERT INTO users (username, password_hash, created_at) VALUES (?, ?, datetime("now"))',
+            ('admin', generate_password_hash('admin123'))  # Default password
+        )
+        print("✅ Created default admin user: admin/admin123")
+
+
+def _migrate_search_index(db):
+    if db.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='landing_search'").fetchone():
+        return
+    db.execute('SAVEPOINT search_index')
+    try:
+        for statement in _statements(SEARCH_SCHEMA_SQL):
+            db.execute(statement)
+    except sqlite3.OperationalError as e:
+        # Old SQLite without FTS5/trigram: fall back to LIKE scans
+        db.execute('ROLLBACK TO search_index')
+        print(f"⚠️ Trigram search index unavailable ({e}); using LIKE search")
+    db.execute('RELEASE search_index')
+
+
+def _migrate_page_weight(db):
+    # Page size before/after the publish-time optimizer (app/optimizer.py); NULL = not optimized
+    existing_cols = {r[1] for r in db.execute("PRAGMA table_info(landing_pages)").fetchall()}
+    for col in ('page_bytes_original', 'page_bytes'):
+        if col not in existing_cols:
+            db.execute(f"ALTER TABLE landing_pages ADD COLUMN {col} INTEGER")
+
+
+def _migrate_jobs(db):
+    for statement in _statements(JOBS_SCHEMA_SQL):
+        db.execute(statement)
+
+
+def _migrate_event_ids(db):
+    # The rollup watermark is MAX(id): without AUTOINCREMENT, a table emptied by compaction
+    # hands out ids from 1 again and new events sit below the watermark, never rolled up
+    sql = db.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name='landing_events'").fetchone()[0]
+    if 'AUTOINCREMENT' in sql.upper():
+        return
+    db.execute('ALTER TABLE landing_events RENAME TO landing_events_old')
+    db.execute('DROP INDEX IF EXISTS idx_landing_events_created')
+    for statement in _statements(EVENTS_SCHEMA_SQL):
+        db.execute(statement)
+    db.execute('INSERT INTO landing_events(id, subdomain, event, created_at) '
+               'SELECT id, subdomain, event, created_at FROM landing_events_old')
+    db.execute('DROP TABLE landing_events_old')
+    # New ids continue above both the rows kept and the watermark
+    row = db.execute("SELECT value FROM rollup_state WHERE name='landing_events_rolled_up'").fetchone()
+    top = max(db.execute('SELECT COALESCE(MAX(id), 0) FROM landing_events').fetchone()[0], row[0] if row else 0)
+    db.execute("DELETE FROM sqlite_sequence WHERE name='landing_events'")
+    db.execute("INSERT INTO sqlite_sequence(name, seq) VALUES ('landing_events', ?)", (top,))
+
+
+def _migrate_job_locks(db):
+    for statement in _statements(JOB_LOCKS_SCHEMA_SQL):
+        db.execute(statement)
+
+
+# Applied in order; PRAGMA user_version stores how many have run, so a booting
+# worker on an up-to-date database only reads one integer. Append new steps at
+# the end and never change one that has shipped. Steps are idempotent so
+# databases from before versioning (user_version 0) migrate cleanly.
+MIGRATIONS = (
+    _migrate_base_schema,
+    _migrate_users,
+    _migrate_search_index,
+    _migrate_page_weight,
+    _migrate_jobs,
+    _migrate_event_ids,
+    _migrate_job_locks,
+)
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(db) -> int:
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(db) -> int:
+    """Bring the schema up to SCHEMA_VERSION; returns the number of steps applied."""
+    if schema_version(db) >= SCHEMA_VERSION:
+        return 0
+    # Workers booting together queue on the write lock; only the first one migrates
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        version = schema_version(db)
+        for step in MIGRATIONS[version:]:
+            step(db)
+        db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        db.commit()
+    except BaseException:
+        db.rollback()
+        raise
+    return max(SCHEMA_VERSION - version, 0)
 
 
 def init_db(app):
     with app.app_context():
-        db = get_db()
-        db.executescript(SCHEMA_SQL)
-        # Simple idempotent ALTERs in case table existed before
-        existing_cols = {r[1] for r in db.execute("PRAGMA table_info(landing_pages)").fetchall()}
-        for col, ddl in [
-            ('hotline_phone', "ALTER TABLE landing_pages ADD COLUMN hotline_phone TEXT"),
-            ('zalo_phone', "ALTER TABLE landing_pages ADD COLUMN zalo_phone TEXT"),
-            ('google_form_link', "ALTER TABLE landing_pages ADD COLUMN google_form_link TEXT")
-        ]:
-            if col not in existing_cols:
-                db.execute(ddl)
-        db.commit()
+        migrate(get_db())
 
     @app.teardown_appcontext
     def teardown_db(exception):  # noqa: F811
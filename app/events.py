@@ -0,0 +1,132 @@
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Optional
+
+from werkzeug.wrappers import Request, Response
+
+from .db import connect
+
+EVENT_TYPES = ('view', 'call', 'zalo', 'form')
+BEACON_PATH = '/_e'
+
+INSERT_SQL = 'INSERT INTO landing_events(subdomain, event, created_at) VALUES (?, ?, ?)'
+
+
+class EventBuffer:
+    """
+    In-memory ring buffer of landing events flushed to SQLite in batches.
+
+    record() only appends to a bounded deque, so the beacon response never
+    waits for disk. A background thread writes everything buffered with one
+    executemany per transaction every `flush_interval_ms`, or as soon as
+    `batch_size` events are waiting. When the buffer is full the oldest events
+    are dropped (and counted) rather than blocking or growing without bound.
+    """
+
+    def __init__(self, db_path: str, capacity: int = 65536, batch_size: int = 1000,
+                 flush_interval_ms: int = 500, connect_options: Optional[dict] = None):
+        self.db_path = db_path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000
+        self.connect_options = connect_options or {}
+        self._events = deque(maxlen=capacity)
+        self._wakeup = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._conn = None
+        self._thread = None
+        self._pid = None
+        self.recorded = 0
+        self.dropped = 0
+        self.written = 0
+
+    def record(self, subdomain: str, event: str, ts: Optional[int] = None):
+        self._ensure_flusher()
+        if len(self._events) >= self.capacity:
+            self.dropped += 1
+        self._events.append((subdomain, event, int(ts if ts is not None else time.time())))
+        self.recorded += 1
+        if len(self._events) >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """Write everything buffered so far. Returns the number of events written."""
+        with self._flush_lock:
+            batch = []
+            while True:
+                try:
+                    batch.append(self._events.popleft())
+                except IndexError:
+                    break
+            if not batch:
+                return 0
+            try:
+                conn = self._connection()
+                with conn:
+                    conn.executemany(INSERT_SQL, batch)
+            except sqlite3.Error as e:
+                # Keep the batch for the next tick; the deque bound still caps memory
+                self._events.extendleft(reversed(batch))
+                print(f"Event flush failed ({len(batch)} events kept): {e}")
+                return 0
+            self.written += len(batch)
+            return len(batch)
+
+    def stats(self) -> dict:
+        return {'buffered': len(self._events), 'recorded': self.recorded,
+                'written': self.written, 'dropped': self.dropped}
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = connect(self.db_path, check_same_thread=False, **self.connect_options)
+        return self._conn
+
+    def _ensure_flusher(self):
+        # Started lazily and per process: a thread started before gunicorn forks does not survive the fork
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._flush_lock:
+            if self._pid == pid:
+                return
+            self._conn = None
+            self._events = deque(maxlen=self.capacity)
+            self._thread = threading.Thread(target=self._run, name='event-flusher', daemon=True)
+            self._thread.start()
+            self._pid = pid
+            atexit.register(self.flush)
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def parse_beacon(environ):
+    """(subdomain, event) from a sendBeacon POST (form-encoded, text/plain or query string)."""
+    request = Request(environ)
+    values = request.form if request.form else request.args
+    if not values and request.mimetype == 'text/plain':
+        from urllib.parse import parse_qs
+        values = {k: v[0] for k, v in parse_qs(request.get_data(as_text=True)).items()}
+    return (values.get('s') or '').strip().lower(), (values.get('e') or '').strip().lower()
+
+
+def beacon_response(events: EventBuffer, subdomain: Optional[str], event: str) -> Response:
+    """204 for a recorded event, 400 for an unknown event type or landing."""
+    if not subdomain or event not in EVENT_TYPES:
+        return Response(status=400)
+    events.record(subdomain, event)
+    response = Response(status=204)
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+def get_event_buffer() -> EventBuffer:
+    from flask import current_app
+    return current_app.extensions['event_buffer']
@@ -0,0 +1,217 @@
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from werkzeug.wrappers import Response
+
+from .blobs import BLOB_URL_PREFIX
+from .db import connect
+from .events import BEACON_PATH, beacon_response, parse_beacon
+from .page_cache import page_response
+from .publishing import INDEX_FILENAME, resolve_landing_dir, version_dir
+from .serving import asset_response, blob_response, is_page_file, paused_response
+
+NOT_FOUND_HTML = "<h1>Landing page không tồn tại</h1>"
+VERSIONED_PREFIX = '/_v/'
+
+
+class RouteEntry:
+    __slots__ = ('status', 'etag')
+
+    def __init__(self, status: str, etag: Optional[str] = None):
+        self.status = status
+        self.etag = etag
+
+
+class RoutingTable:
+    """
+    In-memory subdomain -> (status, ETag) map loaded from landing_pages.
+
+    Writes in this process update it directly (upsert/discard). Changes made by
+    other workers are noticed through PRAGMA data_version, checked at most every
+    `refresh_interval` seconds, and then applied incrementally from the
+    landing_changes log (filled by triggers), so a lookup normally costs one
+    dict access and a bulk pause reaches every worker within that interval.
+    """
+
+    def __init__(self, db_path: str, pub_root: str, refresh_interval: float = 2.0):
+        self.db_path = db_path
+        self.pub_root = pub_root
+        self.refresh_interval = refresh_interval
+        self._routes: Dict[str, RouteEntry] = {}
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+        self._data_version = None
+        self._last_seq = 0
+        self._next_check = 0.0
+
+    def _connection(self):
+        if self._conn is None or self._conn_pid != os.getpid():
+            self._conn = connect(self.db_path, check_same_thread=False)
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def load(self):
+        with self._lock:
+            conn = self._connection()
+            self._data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            # Read the log position first: a change racing the load is re-applied later, never lost
+            self._last_seq = conn.execute('SELECT COALESCE(MAX(seq), 0) FROM landing_changes').fetchone()[0]
+            rows = conn.execute('SELECT subdomain, status FROM landing_pages').fetchall()
+            old = self._routes
+            routes = {}
+            for subdomain, status in rows:
+                entry = RouteEntry(status)
+                previous = old.get(subdomain)
+                if previous is not None:
+                    entry.etag = previous.etag
+                routes[subdomain] = entry
+            self._routes = routes
+            self._next_check = time.monotonic() + self.refresh_interval
+
+    def refresh_if_stale(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return
+        with self._lock:
+            if now < self._next_check:
+                return
+            self._next_check = now + self.refresh_interval
+            conn = self._connection()
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if version == self._data_version:
+                return
+            self._data_version = version
+            oldest = conn.execute('SELECT MIN(seq) FROM landing_changes').fetchone()[0]
+            if oldest is not None and oldest > self._last_seq + 1 and self._last_seq:
+                changes = None  # log trimmed past our position
+            else:
+                changes = conn.execute('SELECT seq, subdomain FROM landing_changes WHERE seq > ? ORDER BY seq',
+                                       (self._last_seq,)).fetchall()
+            if changes:
+                self._apply_changes(conn, changes)
+        if changes is None:
+            self.load()
+
+    def _apply_changes(self, conn, changes):
+        subdomains = list({subdomain for _, subdomain in changes})
+        statuses = {}
+        for i in range(0, len(subdomains), 500):
+            chunk = subdomains[i:i + 500]
+            statuses.update(conn.execute(
+                f"SELECT subdomain, status FROM landing_pages WHERE subdomain IN ({','.join('?' * len(chunk))})",
+                chunk).fetchall())
+        routes = dict(self._routes)
+        for subdomain in subdomains:
+            if subdomain in statuses:
+                previous = routes.get(subdomain)
+                routes[subdomain] = RouteEntry(statuses[subdomain], previous.etag if previous else None)
+            else:
+                routes.pop(subdomain, None)
+        self._routes = routes
+        self._last_seq = changes[-1][0]
+
+    def __len__(self):
+        return len(self._routes)
+
+    def lookup(self, subdomain: str) -> Optional[RouteEntry]:
+        self.refresh_if_stale()
+        return self._routes.get(subdomain)
+
+    def upsert(self, subdomain: str, status: str):
+        with self._lock:
+            routes = dict(self._routes)
+            previous = routes.get(subdomain)
+            routes[subdomain] = RouteEntry(status, previous.etag if previous else None)
+            self._routes = routes
+
+    def discard(self, subdomain: str):
+        with self._lock:
+            if subdomain in self._routes:
+                routes = dict(self._routes)
+                del routes[subdomain]
+                self._routes = routes
+
+
+class HostDispatcher:
+    """
+    WSGI middleware answering `Host: <sub>.<WILDCARD_DOMAIN>` requests straight
+    from the routing table and page cache. Anything else (admin host, reserved
+    subdomains, other domains) goes to the wrapped Flask app untouched.
+    """
+
+    def __init__(self, wsgi_app, table: RoutingTable, page_cache, wildcard_domain: str, reserved=('admin', 'www'),
+                 events=None, delivery=None):
+        self.wsgi_app = wsgi_app
+        self.table = table
+        self.page_cache = page_cache
+        self.events = events
+        self.delivery = delivery
+        self.suffix = '.' + wildcard_domain.lower().split(':')[0]
+        self.reserved = set(reserved)
+
+    def subdomain_for(self, host: str) -> Optional[str]:
+        host = host.lower().split(':')[0]
+        if not host.endswith(self.suffix):
+            return None
+        sub = host[:-len(self.suffix)]
+        if not sub or '.' in sub or sub in self.reserved:
+            return None
+        return sub
+
+    def __call__(self, environ, start_response):
+        subdomain = self.subdomain_for(environ.get('HTTP_HOST', ''))
+        if subdomain is None:
+            return self.wsgi_app(environ, start_response)
+        environ['metrics.endpoint'] = 'host_dispatch'
+        environ['landing.subdomain'] = subdomain
+        return self.serve(subdomain, environ)(environ, start_response)
+
+    def serve(self, subdomain: str, environ) -> Response:
+        if environ.get('PATH_INFO') == BEACON_PATH and self.events is not None:
+            if environ.get('REQUEST_METHOD') != 'POST':
+                return Response('Method Not Allowed', status=405, headers={'Allow': 'POST'})
+            _, event = parse_beacon(environ)
+            known = self.table.lookup(subdomain) is not None
+            return beacon_response(self.events, subdomain if known else None, event)
+        if environ.get('REQUEST_METHOD', 'GET') not in ('GET', 'HEAD'):
+            return Response('Method Not Allowed', status=405, headers={'Allow': 'GET, HEAD'})
+        route = self.table.lookup(subdomain)
+        if route is None:
+            return Response(NOT_FOUND_HTML, status=404, mimetype='text/html')
+
+        path = environ.get('PATH_INFO') or '/'
+        # Before the version/asset lookups: the page of a paused landing is still on disk
+        if route.status == 'paused' and (path == '/' or is_page_file(path)):
+            return paused_response(environ)
+        if path.startswith(BLOB_URL_PREFIX):
+            response = blob_response(self.table.pub_root, path[len(BLOB_URL_PREFIX):], environ, self.delivery)
+            return response if response is not None else Response('File not found', status=404)
+        if path.startswith(VERSIONED_PREFIX):
+            version, _, filename = path[len(VERSIONED_PREFIX):].partition('/')
+            if not version.isdigit():
+                return Response('File not found', status=404)
+            response = asset_response(version_dir(self.table.pub_root, subdomain, int(version)), filename,
+                                      environ, immutable=True, delivery=self.delivery)
+            return response if response is not None else Response('File not found', status=404)
+
+        # Resolved per request: `current` is swapped by publishes in any worker
+        landing_dir = resolve_landing_dir(self.table.pub_root, subdomain)
+        if path in ('/', '/index.html'):
+            entry = self.page_cache.get(subdomain, os.path.join(landing_dir, INDEX_FILENAME))
+            if entry is None:
+                return Response(NOT_FOUND_HTML, status=404, mimetype='text/html')
+            route.etag = entry.etag
+            return page_response(entry, environ)
+
+        response = asset_response(landing_dir, path.lstrip('/'), environ, delivery=self.delivery)
+        if response is None:
+            return Response('File not found', status=404)
+        return response
+
+
+def get_routing_table() -> RoutingTable:
+    from flask import current_app
+    return current_app.extensions['routing_table']
@@ -0,0 +1,206 @@
+import os
+import re
+import shutil
+import tempfile
+import threading
+from importlib.util import find_spec
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from .publishing import VERSIONS_DIR, publish, resolve_landing_dir, version_dir
+
+OPTIMIZABLE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp'}
+DEFAULT_WIDTHS = (480, 960, 1440)
+
+if TYPE_CHECKING:
+    from concurrent.futures import ProcessPoolExecutor
+
+_executor: Optional['ProcessPoolExecutor'] = None
+_executor_lock = threading.Lock()
+
+
+def is_available() -> bool:
+    # Pillow is optional (uploads are then published as-is) and only imported by the pool processes
+    return find_spec('PIL') is not None
+
+
+def get_executor(max_workers: Optional[int] = None) -> 'ProcessPoolExecutor':
+    """Lazily started process pool shared by all requests of this worker."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Started from request/job threads: forking a multi-threaded process can copy held locks
+            _executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def variant_name(filename: str, width: Optional[int], fmt: str) -> str:
+    stem = os.path.splitext(filename)[0]
+    return f"{stem}-{width}.{fmt}" if width else f"{stem}.{fmt}"
+
+
+def optimize_image(path: str, widths=DEFAULT_WIDTHS, avif: bool = False, quality: int = 80) -> Dict:
+    """
+    Strip EXIF from `path` in place and write resized WebP (and AVIF) variants.
+
+    Variants are named anh1-480.webp, anh1-960.webp ... plus a full-size
+    anh1.webp; widths larger than the source are skipped. Returns a manifest
+    entry: {'width': w, 'height': h, 'webp': [(w, name)], 'avif': [(w, name)]}.
+    """
+    from PIL import Image, ImageOps
+
+    directory, filename = os.path.split(path)
+    ext = os.path.splitext(filename)[1].lower()
+    with Image.open(path) as src:
+        img = ImageOps.exif_transpose(src)
+        img.load()
+        src_format = src.format
+
+    # Re-save the original without EXIF/GPS metadata (orientation already applied)
+    tmp = path + '.tmp'
+    if src_format == 'JPEG' or ext in ('.jpg', '.jpeg'):
+        img.convert('RGB').save(tmp, 'JPEG', quality=85, optimize=True, progressive=True)
+    elif src_format == 'PNG':
+        img.save(tmp, 'PNG', optimize=True)
+    else:
+        img.save(tmp, src_format)
+    os.replace(tmp, path)
+
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA' if 'A' in img.getbands() or 'transparency' in img.info else 'RGB')
+
+    formats = ['webp'] + (['avif'] if avif else [])
+    manifest = {'width': img.width, 'height': img.height}
+    for fmt in formats:
+        manifest[fmt] = []
+        for width in sorted({w for w in widths if w < img.width} | {img.width}):
+            if width == img.width:
+                resized, name = img, variant_name(filename, None, fmt)
+            else:
+                height = max(1, round(img.height * width / img.width))
+                resized, name = img.resize((width, height), Image.LANCZOS), variant_name(filename, width, fmt)
+            if name == filename:
+                # A full-size variant in the upload's own format is the re-saved original
+                manifest[fmt].append((width, name))
+                continue
+            try:
+                resized.save(os.path.join(directory, name), fmt.upper(), quality=quality)
+            except (KeyError, OSError):
+                break  # this Pillow build cannot encode the format
+            manifest[fmt].append((width, name))
+    return manifest
+
+
+def _picture_tag(img_tag: str, entry: Dict) -> str:
+    sources = []
+    for fmt in ('avif', 'webp'):
+        candidates = entry.get(fmt)
+        if candidates:
+            srcset = ', '.join(f"{name} {width}w" for width, name in candidates)
+            sources.append(f'<source type="image/{fmt}" srcset="{srcset}" sizes="100vw">')
+    img = img_tag
+    if not re.search(r'\bloading\s*=', img, re.IGNORECASE):
+        img = re.sub(r'^<img\b', '<img loading="lazy"', img, flags=re.IGNORECASE)
+    if not re.search(r'\b(width|height)\s*=', img, re.IGNORECASE):
+        img = re.sub(r'^<img\b', f'<img width="{entry["width"]}" height="{entry["height"]}"', img, flags=re.IGNORECASE)
+    img = re.sub(r'^<img\b', '<img data-optimized="1"', img, flags=re.IGNORECASE)
+    return '<picture>' + ''.join(sources) + img + '</picture>'
+
+
+IMG_TAG_RE = re.compile(r"<img\b[^>]*>", re.IGNORECASE)
+IMG_SRC_RE = re.compile(r"""\bsrc\s*=\s*(["'])(?:\./)?([^"'/]+)\1""", re.IGNORECASE)
+
+
+def rewrite_img_tags(html: str, manifest: Dict[str, Dict]) -> str:
+    """Wrap <img src="anhN.ext"> of optimized images in <picture> with srcset and lazy loading."""
+    def replace(m):
+        tag = m.group(0)
+        if 'data-optimized' in tag:
+            return tag
+        src = IMG_SRC_RE.search(tag)
+        entry = manifest.get(src.group(2)) if src else None
+        if not entry:
+            return tag
+        return _picture_tag(tag, entry)
+    return IMG_TAG_RE.sub(replace, html)
+
+
+def process_landing_images(pub_root: str, subdomain: str, version: int, filenames: List[str],
+                           widths=DEFAULT_WIDTHS, avif: bool = False, rewrite_html: bool = False,
+                           keep: Optional[int] = None) -> Dict[str, Dict]:
+    """
+    Process-pool entry point: optimize the uploaded images of one published version.
+
+    Images are re-encoded in a scratch dir and published as a new version. An
+    image replaced by a newer publish while we were encoding is left alone:
+    only files whose inode still matches the one in `version` are swapped in.
+    """
+    source_dir = version_dir(pub_root, subdomain, version)
+    work = tempfile.mkdtemp(prefix='.images-', dir=os.path.join(pub_root, subdomain, VERSIONS_DIR))
+    try:
+        manifest, inodes = {}, {}
+        for name in filenames:
+            if os.path.splitext(name)[1].lower() not in OPTIMIZABLE_EXTENSIONS:
+                continue
+            try:
+                source = os.path.join(source_dir, name)
+                inodes[name] = os.stat(source).st_ino
+                shutil.copyfile(source, os.path.join(work, name))
+                manifest[name] = optimize_image(os.path.join(work, name), widths=widths, avif=avif)
+            except Exception as e:  # a broken upload must not block the other images
+                print(f"Image optimization failed for {name}: {e}")
+
+        def unchanged(directory, name):
+            try:
+                return os.stat(os.path.join(directory, name)).st_ino == inodes[name]
+            except FileNotFoundError:
+                return False
+
+        live = resolve_landing_dir(pub_root, subdomain)
+        if not any(unchanged(live, name) for name in manifest):
+            return {}
+
+        applied = {}
+
+        def populate(staging):
+            for name, entry in manifest.items():
+                if not unchanged(staging, name):
+                    continue  # republished meanwhile
+                # dict.fromkeys: anhN.webp is both the upload and its full-size webp variant
+                outputs = dict.fromkeys([name] + [n for fmt in ('webp', 'avif') for _, n in entry.get(fmt, [])])
+                for output in outputs:
+                    os.replace(os.path.join(work, output), os.path.join(staging, output))
+                applied[name] = entry
+
+        transform = (lambda html: rewrite_img_tags(html, applied)) if rewrite_html else None
+        publish(pub_root, subdomain, populate=populate, transform=transform, keep=keep)
+        return applied
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def schedule_optimization(config, subdomain: str, version: int, filenames: List[str]):
+    """Queue image optimization for a freshly published version without blocking the request."""
+    if not config.get('IMAGE_OPTIMIZE') or not is_available() or not filenames:
+        return None
+    future = get_executor(config.get('IMAGE_WORKERS')).submit(
+        process_landing_images,
+        config['PUBLISHED_ROOT'],
+        subdomain,
+        version,
+        list(filenames),
+        tuple(config.get('IMAGE_WIDTHS') or DEFAULT_WIDTHS),
+        bool(config.get('IMAGE_AVIF')),
+        bool(config.get('IMAGE_REWRITE_HTML')),
+        config.get('PUBLISH_KEEP_VERSIONS'),
+    )
+    future.add_done_callback(lambda f: _log_failure(f, subdomain, version))
+    return future
+
+
+def _log_failure(future, subdomain: str, version: int):
+    # Nobody waits for the future, so a failure would otherwise go unnoticed
+    error = None if future.cancelled() else future.exception()
+    if error is not None:
+        print(f"Image optimization of {subdomain} v{version} failed: {error!r}")
@@ -0,0 +1,228 @@
+import csv
+import io
+import os
+import posixpath
+import shutil
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .optimizer import optimize_landing, page_weight_fields
+from .precompress import precompress_if_compressible
+from .publishing import INDEX_FILENAME, publish, write_index
+from .utils import TRACKING_FIELDS, inject_tracking, render_tracking_snippets, sanitize_subdomain
+
+# Optional per-site settings next to the site folders: one row per subdomain
+MANIFEST_NAME = 'landings.csv'
+MANIFEST_FIELDS = ('agent',) + TRACKING_FIELDS + ('hotline_phone', 'zalo_phone', 'google_form_link')
+COPY_CHUNK = 1024 * 1024
+
+
+def _is_junk(name: str) -> bool:
+    parts = name.split('/')
+    return any(p in ('__MACOSX', '.DS_Store', 'Thumbs.db') for p in parts)
+
+
+def scan_archive(zf: zipfile.ZipFile) -> Tuple[Dict[str, List[str]], List[str]]:
+    """
+    Find the site folders of a LadiPage export archive from its central directory only.
+
+    A site is the shallowest folder holding an index.html; everything below it
+    belongs to that site. Returns ({folder: [member names]}, [unsafe names skipped]).
+    """
+    names = [i.filename for i in zf.infolist() if not i.is_dir() and not _is_junk(i.filename)]
+    unsafe = [n for n in names if n.startswith('/') or '\\' in n or '..' in n.split('/')]
+    skipped = set(unsafe)
+    names = [n for n in names if n not in skipped]
+
+    roots = sorted({posixpath.dirname(n) for n in names if posixpath.basename(n).lower() == INDEX_FILENAME},
+                   key=lambda r: (r.count('/'), r))
+    sites: Dict[str, List[str]] = {}
+    for root in roots:
+        if not root or any(root.startswith(s + '/') for s in sites):
+            continue  # archive-level index.html or a sub-page of a site already found
+        sites[root] = []
+    for name in names:
+        for root in sites:
+            if name.startswith(root + '/'):
+                sites[root].append(name)
+                break
+    return sites, unsafe
+
+
+def read_manifest(zf: zipfile.ZipFile) -> Dict[str, Dict[str, str]]:
+    """Per-site settings from the shallowest landings.csv (archive root or the export's wrapper folder)."""
+    candidates = sorted((n for n in zf.namelist() if posixpath.basename(n) == MANIFEST_NAME and not _is_junk(n)),
+                        key=lambda n: n.count('/'))
+    if not candidates:
+        return {}
+    raw = zf.read(candidates[0])
+    rows = csv.DictReader(io.StringIO(raw.decode('utf-8-sig')))
+    manifest = {}
+    for row in rows:
+        sub = sanitize_subdomain(row.get('subdomain') or '')
+        if sub:
+            manifest[sub] = {k: (row.get(k) or '').strip() for k in MANIFEST_FIELDS if row.get(k) is not None}
+    return manifest
+
+
+def import_site(archive: str, root: str, members: List[str], subdomain: str, values: Dict[str, str],
+                pub_root: str, keep: Optional[int] = None, optimize: bool = False) -> Dict[str, Any]:
+    """
+    Process-pool entry point: publish one site folder of the archive as a new version.
+
+    Entries are streamed from the ZIP in chunks straight into the staging dir;
+    only index.html is held in memory for tracking injection. With `optimize`
+    the page goes through app/optimizer.py once all files are in place.
+    """
+    started = time.perf_counter()
+    result = {'subdomain': subdomain, 'folder': root, 'ok': False, 'files': 0, 'bytes': 0}
+    try:
+        with zipfile.ZipFile(archive) as zf:
+            index_member = next(m for m in members if m == f'{root}/{INDEX_FILENAME}' or
+                                m.lower() == f'{root}/{INDEX_FILENAME}'.lower())
+            html = zf.read(index_member).decode('utf-8', errors='ignore')
+            head_snippet, body_snippet = render_tracking_snippets(*(values.get(k, '') for k in TRACKING_FIELDS))
+            final_html = inject_tracking(html, head_snippet, body_snippet)
+
+            def populate(staging):
+                for member in members:
+                    if member == index_member:
+                        continue
+                    target = os.path.join(staging, *member[len(root) + 1:].split('/'))
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with zf.open(member) as src, open(target, 'wb') as dst:
+                        shutil.copyfileobj(src, dst, COPY_CHUNK)
+                    precompress_if_compressible(target)
+                    result['files'] += 1
+                    result['bytes'] += os.path.getsize(target)
+                write_index(staging, final_html)
+                result['files'] += 1
+                result['bytes'] += len(final_html.encode('utf-8'))
+                if optimize:
+                    result['optimization'] = optimize_landing(pub_root, staging)
+
+            result['version'] = publish(pub_root, subdomain, populate=populate, keep=keep, inherit=False)
+        result['ok'] = True
+    except Exception as e:
+        result['error'] = str(e)
+    result['ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+
+def import_archive(archive: str, pub_root: str, defaults: Dict[str, str], workers: Optional[int] = None,
+                   progress: Optional[Callable[[Dict[str, Any], int, int], None]] = None,
+                   keep: Optional[int] = None, optimize: bool = False) -> Dict[str, Any]:
+    """
+    Publish every site folder of `archive` using a process pool.
+
+    At most 2 x workers sites are in flight, so memory stays bounded however
+    many sites the archive holds. Returns per-site results and the rows for
+    repository.upsert_landings (successful sites only).
+    """
+    started = time.perf_counter()
+    with zipfile.ZipFile(archive) as zf:
+        sites, unsafe = scan_archive(zf)
+        manifest = read_manifest(zf)
+
+    results, rows, jobs = [], [], []
+    for root, members in sites.items():
+        subdomain = sanitize_subdomain(posixpath.basename(root))
+        if not subdomain:
+            results.append({'subdomain': posixpath.basename(root), 'folder': root, 'ok': False,
+                            'error': 'Subdomain không hợp lệ'})
+            continue
+        jobs.append((root, members, subdomain, {**defaults, **manifest.get(subdomain, {})}))
+
+    total = len(results) + len(jobs)
+    if progress:
+        for done, result in enumerate(results, 1):
+            progress(result, done, total)
+    if jobs:
+        max_workers = workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            queue = iter(jobs)
+            pending, by_future = set(), {}
+            while True:
+                while len(pending) < 2 * max_workers:
+                    job = next(queue, None)
+                    if job is None:
+                        break
+                    future = pool.submit(import_site, archive, job[0], job[1], job[2], job[3], pub_root, keep, optimize)
+                    by_future[future] = job
+                    pending.add(future)
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    root, _, subdomain, values = by_future.pop(future)
+                    result = future.result()
+                    results.append(result)
+                    if result['ok']:
+                        rows.append({'subdomain': subdomain, 'original_filename': INDEX_FILENAME,
+                                     **{k: values.get(k, '') for k in MANIFEST_FIELDS},
+                                     **page_weight_fields(result.get('optimization'))})
+                    if progress:
+                        progress(result, len(results), total)
+    return {
+        'results': results,
+        'rows': rows,
+        'skipped_unsafe': unsafe,
+        'elapsed_s': round(time.perf_counter() - started, 3),
+    }
+
+
+def run_import(archive: str, defaults: Dict[str, str], workers: Optional[int] = None,
+               progress: Optional[Callable[[Dict[str, Any], int, int], None]] = None) -> Dict[str, Any]:
+    """Import an archive, then register all imported landings in one batched upsert."""
+    from flask import current_app
+    from . import repository
+    from .host_routing import get_routing_table
+    from .page_cache import get_page_cache
+
+    run = import_archive(archive, current_app.config['PUBLISHED_ROOT'], defaults, workers, progress,
+                         current_app.config.get('PUBLISH_KEEP_VERSIONS'), current_app.config.get('HTML_OPTIMIZE', False))
+    repository.upsert_landings(run['rows'])
+    cache, table = get_page_cache(), get_routing_table()
+    for row in run['rows']:
+        cache.invalidate(row['subdomain'])
+        landing = table.lookup(row['subdomain'])
+        table.upsert(row['subdomain'], landing.status if landing else 'active')
+    failed = [r for r in run['results'] if not r['ok']]
+    return {
+        'sites': len(run['results']),
+        'imported': len(run['rows']),
+        'failed': len(failed),
+        'skipped_unsafe': run['skipped_unsafe'],
+        'elapsed_s': run['elapsed_s'],
+        'results': sorted(run['results'], key=lambda r: r['subdomain']),
+    }
+
+
+def save_stream(stream, directory: str, max_bytes: int, length: Optional[int] = None,
+                chunk_size: int = COPY_CHUNK) -> str:
+    """
+    Spool an uploaded archive to a temp file in `directory` chunk by chunk,
+    reading at most `length` bytes when given (raw WSGI input). Raises
+    ValueError past max_bytes.
+    """
+    import tempfile
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='import-', suffix='.zip', dir=directory)
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while length is None or size < length:
+                want = chunk_size if length is None else min(chunk_size, length - size)
+                chunk = stream.read(want)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise ValueError(f'File ZIP vượt quá giới hạn {max_bytes} bytes')
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
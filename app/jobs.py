@@ -0,0 +1,313 @@
+import contextlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from importlib import import_module
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .db import get_connection
+
+# Durable background jobs in the `jobs` table of the main database:
+#   queued -> running -> done
+#                     -> queued again after a failure, run_after = now + backoff
+#                     -> failed once max_attempts is reached (or on PermanentJobError)
+# Any process may run jobs (web workers with JOB_WORKERS threads each, or
+# `flask jobs-worker`); a job is claimed in a BEGIN IMMEDIATE transaction, so it
+# runs once. Jobs sharing a lock_key (one landing) never run concurrently; a job
+# spanning many landings (bulk re-inject) holds theirs in job_locks while it works on them.
+# A job running longer than JOB_TIMEOUT is assumed dead and queued again.
+
+# Handlers are the functions of the same name in app/tasks.py: handler(payload, job) -> result dict
+JOB_KINDS = ('create_landing', 'update_landing', 'restore_paused', 'reinject', 'import_zip', 'cleanup_landing',
+             'reclaim_space')
+JOB_STATUSES = ('queued', 'running', 'done', 'failed')
+
+
+class PermanentJobError(Exception):
+    """A failure retrying cannot fix (invalid input, conflict): the job fails right away."""
+
+
+def _job_dict(row) -> Optional[Dict[str, Any]]:
+    if row is None:
+        return None
+    job = dict(row)
+    job['payload'] = json.loads(job['payload'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+class JobQueue:
+    def __init__(self, db_path: str, connect_options: Optional[dict] = None, max_attempts: int = 5,
+                 retry_base: float = 2.0, retry_max: float = 300.0, timeout: float = 600.0):
+        self.db_path = db_path
+        self.connect_options = connect_options or {}
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.timeout = timeout
+
+    def _conn(self):
+        return get_connection(self.db_path, **self.connect_options)
+
+    def enqueue(self, kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+                lock_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+        """
+        Add a job; returns (job, created). With an idempotency key already used
+        for this kind, the existing job is returned instead and created is False.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f'Unknown job kind: {kind}')
+        conn = self._conn()
+        now = time.time()
+        with conn:
+            cur = conn.execute(
+                "INSERT INTO jobs(kind, payload, idempotency_key, lock_key, max_attempts, run_after, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(kind, idempotency_key) DO NOTHING",
+                (kind, json.dumps(payload), idempotency_key, lock_key, self.max_attempts, now, now))
+        if cur.rowcount:
+            return self.get(cur.lastrowid), True
+        row = conn.execute('SELECT * FROM jobs WHERE kind=? AND idempotency_key=?', (kind, idempotency_key)).fetchone()
+        return _job_dict(row), False
+
+    def get(self, job_id: int) -> Optional[Dict[str, Any]]:
+        return _job_dict(self._conn().execute('SELECT * FROM jobs WHERE id=?', (job_id,)).fetchone())
+
+    def list(self, status: str = '', kind: str = '', limit: int = 50) -> List[Dict[str, Any]]:
+        clauses, params = [], []
+        if status:
+            clauses.append('status=?')
+            params.append(status)
+        if kind:
+            clauses.append('kind=?')
+            params.append(kind)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+        rows = self._conn().execute(f'SELECT * FROM jobs {where} ORDER BY id DESC LIMIT ?', params + [limit]).fetchall()
+        return [_job_dict(r) for r in rows]
+
+    def claim(self, worker: str) -> Optional[Dict[str, Any]]:
+        """Take the oldest runnable job, or None. Idle polls only read; the write lock is taken when there is work."""
+        conn = self._conn()
+        runnable = ("SELECT * FROM jobs WHERE status='queued' AND run_after<=? AND (lock_key IS NULL OR (lock_key NOT IN "
+                    "(SELECT lock_key FROM jobs WHERE status='running' AND lock_key IS NOT NULL) "
+                    "AND lock_key NOT IN (SELECT lock_key FROM job_locks))) ORDER BY id LIMIT 1")
+        now = time.time()
+        if conn.execute(runnable, (now,)).fetchone() is None:
+            return None
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(runnable, (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE jobs SET status='running', attempts=attempts+1, locked_by=?, started_at=? WHERE id=?",
+                         (worker, now, row['id']))
+        return self.get(row['id'])
+
+    @contextlib.contextmanager
+    def hold_locks(self, job: Dict[str, Any], keys: List[str]) -> Iterator[List[str]]:
+        """
+        Lock the `keys` no running job or other holder has, for the duration of
+        the block; yields those taken. Queued jobs with one of them as lock_key
+        wait until the block ends.
+        """
+        conn = self._conn()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            busy = {r[0] for r in conn.execute("SELECT lock_key FROM jobs WHERE status='running' AND lock_key IS NOT NULL "
+                                               "AND id<>?", (job['id'],))}
+            busy.update(r[0] for r in conn.execute('SELECT lock_key FROM job_locks'))
+            taken = [key for key in dict.fromkeys(keys) if key not in busy]
+            conn.executemany('INSERT INTO job_locks(lock_key, job_id) VALUES (?, ?)', [(key, job['id']) for key in taken])
+        try:
+            yield taken
+        finally:
+            with conn:
+                conn.executemany('DELETE FROM job_locks WHERE lock_key=? AND job_id=?', [(key, job['id']) for key in taken])
+
+    def complete(self, job: Dict[str, Any], result: Optional[Dict[str, Any]]):
+        with self._conn() as conn:
+            conn.execute('DELETE FROM job_locks WHERE job_id=?', (job['id'],))
+            conn.execute("UPDATE jobs SET status='done', result=?, error=NULL, locked_by=NULL, finished_at=? WHERE id=?",
+                         (json.dumps(result), time.time(), job['id']))
+
+    def fail(self, job: Dict[str, Any], error: str, permanent: bool = False) -> bool:
+        """Record a failed attempt; returns True if the job will be retried."""
+        now = time.time()
+        retry = not permanent and job['attempts'] < job['max_attempts']
+        with self._conn() as conn:
+            conn.execute('DELETE FROM job_locks WHERE job_id=?', (job['id'],))
+            if retry:
+                # Exponential backoff with jitter so jobs failing together do not retry together
+                delay = min(self.retry_max, self.retry_base * 2 ** (job['attempts'] - 1)) * random.uniform(0.8, 1.2)
+                conn.execute("UPDATE jobs SET status='queued', error=?, locked_by=NULL, run_after=? WHERE id=?",
+                             (error, now + delay, job['id']))
+            else:
+                conn.execute("UPDATE jobs SET status='failed', error=?, locked_by=NULL, finished_at=? WHERE id=?",
+                             (error, now, job['id']))
+        return retry
+
+    def requeue_stale(self) -> int:
+        """Queue again jobs whose worker died mid-run (running for longer than `timeout`)."""
+        now = time.time()
+        with self._conn() as conn:
+            # Locks of a dead worker's job are freed with it
+            conn.execute("DELETE FROM job_locks WHERE job_id IN (SELECT id FROM jobs WHERE status='running' AND started_at<?)",
+                         (now - self.timeout,))
+            conn.execute("UPDATE jobs SET status='failed', error='timed out', locked_by=NULL, finished_at=? "
+                         "WHERE status='running' AND started_at<? AND attempts>=max_attempts", (now, now - self.timeout))
+            return conn.execute("UPDATE jobs SET status='queued', error='timed out', locked_by=NULL, run_after=? "
+                                "WHERE status='running' AND started_at<?", (now, now - self.timeout)).rowcount
+
+    def purge(self, retention: float) -> int:
+        """Delete finished jobs older than `retention` seconds, with the uploads kept for failed ones."""
+        conn = self._conn()
+        cutoff = time.time() - retention
+        rows = conn.execute("SELECT id, payload FROM jobs WHERE status IN ('done', 'failed') AND finished_at<?",
+                            (cutoff,)).fetchall()
+        for row in rows:
+            files_dir = json.loads(row['payload']).get('files_dir')
+            if files_dir:
+                shutil.rmtree(files_dir, ignore_errors=True)
+        with conn:
+            conn.executemany('DELETE FROM jobs WHERE id=?', [(row['id'],) for row in rows])
+        return len(rows)
+
+    def retry(self, job_id: int) -> bool:
+        """Queue a failed job again with a fresh attempt budget."""
+        with self._conn() as conn:
+            return conn.execute("UPDATE jobs SET status='queued', attempts=0, run_after=?, finished_at=NULL "
+                                "WHERE id=? AND status='failed'", (time.time(), job_id)).rowcount > 0
+
+    def stats(self) -> Dict[str, Any]:
+        conn = self._conn()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(conn.execute('SELECT status, COUNT(*) FROM jobs GROUP BY status').fetchall())
+        oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status='queued'").fetchone()[0]
+        counts['oldest_queued_s'] = round(time.time() - oldest, 3) if oldest else 0
+        return counts
+
+
+class JobRunner:
+    """
+    Pool of job threads of one process. Idle threads poll every
+    `poll_interval` seconds; enqueue() in the same process wakes them at once.
+    """
+
+    def __init__(self, app, queue: JobQueue, threads: int = 2, poll_interval: float = 1.0,
+                 retention: float = 7 * 86400):
+        self.app = app
+        self.queue = queue
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._next_maintenance = 0.0
+
+    def ensure_running(self, threads: Optional[int] = None):
+        pid = os.getpid()
+        threads = self.threads if threads is None else threads
+        if threads <= 0 or self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            for i in range(threads):
+                threading.Thread(target=self._run, args=(f'{os.uname().nodename}:{pid}:{i}',),
+                                 name=f'job-worker-{i}', daemon=True).start()
+            self._pid = pid
+
+    def wake(self):
+        self._wake.set()
+
+    def _maintain(self):
+        now = time.monotonic()
+        if now < self._next_maintenance:
+            return
+        self._next_maintenance = now + 60
+        try:
+            requeued = self.queue.requeue_stale()
+            if requeued:
+                print(f"Requeued {requeued} stale job(s)")
+            self.queue.purge(self.retention)
+        except Exception as e:  # a locked/busy database must not kill the thread
+            print(f"Job queue maintenance failed: {e}")
+
+    def _run(self, worker: str):
+        while True:
+            try:
+                job = self.queue.claim(worker)
+            except Exception as e:
+                print(f"Job claim failed: {e}")
+                job = None
+            if job is None:
+                self._maintain()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self.run_job(job)
+
+    def run_job(self, job: Dict[str, Any]):
+        handler = getattr(import_module('.tasks', __package__), job['kind'])
+        metrics = self.app.extensions.get('metrics')
+        started = time.perf_counter()
+        try:
+            with self.app.app_context():
+                result = handler(job['payload'], job)
+            self.queue.complete(job, result)
+            outcome = 'done'
+        except Exception as e:
+            permanent = isinstance(e, PermanentJobError)
+            final = not self.queue.fail(job, str(e) or type(e).__name__, permanent)
+            outcome = 'failed' if final else 'retry'
+            print(f"Job {job['id']} ({job['kind']}) failed, attempt {job['attempts']}/{job['max_attempts']}"
+                  f"{'' if final else ', will retry'}: {e}")
+        if metrics is not None:
+            metrics.inc('jobs_processed_total', (job['kind'], outcome))
+            metrics.observe('job_duration_seconds', (job['kind'],), time.perf_counter() - started)
+        if outcome == 'done' and job['payload'].get('files_dir'):
+            # Uploads of failed jobs stay until purged, so they can be retried
+            shutil.rmtree(job['payload']['files_dir'], ignore_errors=True)
+
+    def run_forever(self, threads: int):
+        """Blocking loop for a dedicated worker process (`flask jobs-worker`)."""
+        self.ensure_running(threads)
+        while True:
+            time.sleep(3600)
+
+
+def job_stats(queue: JobQueue) -> List[Tuple[str, str, str, float]]:
+    """Scrape-time queue gauges (shared by all processes: read from the jobs table)."""
+    stats = queue.stats()
+    return [('job_queue_depth', 'gauge', 'Jobs waiting to run (incl. retries in backoff)', stats['queued']),
+            ('jobs_running', 'gauge', 'Jobs being run', stats['running']),
+            ('jobs_failed', 'gauge', 'Jobs that exhausted their retries (kept JOB_RETENTION_HOURS)', stats['failed']),
+            ('job_queue_oldest_seconds', 'gauge', 'Age of the oldest queued job', stats['oldest_queued_s'])]
+
+
+def get_job_queue() -> JobQueue:
+    from flask import current_app
+    return current_app.extensions['job_queue']
+
+
+def wake_job_runner():
+    """Start/wake this process's job threads so new work starts without waiting for a poll."""
+    from flask import current_app
+    runner = current_app.extensions.get('job_runner')
+    if runner is not None:
+        runner.ensure_running()
+        runner.wake()
+
+
+def enqueue_job(kind: str, payload: Dict[str, Any], idempotency_key: Optional[str] = None,
+                lock_key: Optional[str] = None) -> Tuple[Dict[str, Any], bool]:
+    """Enqueue from a request (see JobQueue.enqueue) and wake this process's job threads."""
+    job, created = get_job_queue().enqueue(kind, payload, idempotency_key, lock_key)
+    if not created and payload.get('files_dir'):
+        # A replayed request: its uploads are not needed, the first request's job has its own
+        shutil.rmtree(payload['files_dir'], ignore_errors=True)
+    wake_job_runner()
+    return job, created
@@ -0,0 +1,146 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Optional
+
+from .blobs import file_digest
+from .publishing import VERSIONS_DIR, _site_lock, list_sites, site_dir
+
+MANIFESTS_DIR = '.manifests'
+# A file or dir changed less than this long ago may change again within the same mtime tick
+MTIME_SETTLE_NS = 1_000_000_000
+
+# One manifest per landing, rewritten (under the publish lock) whenever its tree changes:
+#   published/.manifests/<subdomain>.json
+#   {"subdomain": ..., "files": {"<path in site dir>": [sha256, size, mtime_ns]},
+#    "links": {"current": ".v/3"}, "dirs": {"<dir>": mtime_ns}}
+# Replication (app/replication.py) diffs these instead of walking trees; a file
+# whose path inside its version, size and mtime match the previous manifest is
+# not hashed again (versions inherit unchanged files as hardlinks).
+
+_VERSION_PREFIX_RE = re.compile(rf'^{re.escape(VERSIONS_DIR)}/\d+/')
+
+
+def manifests_root(pub_root: str) -> str:
+    return os.path.join(pub_root, MANIFESTS_DIR)
+
+
+def manifest_path(pub_root: str, subdomain: str) -> str:
+    return os.path.join(manifests_root(pub_root), subdomain + '.json')
+
+
+def load_manifest(pub_root: str, subdomain: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(pub_root, subdomain), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def write_manifest(pub_root: str, subdomain: str, manifest: Dict[str, Any]):
+    path = manifest_path(pub_root, subdomain)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp, path)
+
+
+def remove_manifest(pub_root: str, subdomain: str):
+    try:
+        os.remove(manifest_path(pub_root, subdomain))
+    except FileNotFoundError:
+        pass
+
+
+def _skip(name: str) -> bool:
+    # Publish lock, temp files and scratch dirs of publishes/optimizations in progress
+    return name == '.lock' or name.endswith('.tmp') or name.startswith(('.staging-', '.images-'))
+
+
+def scan_site(site: str, previous: Optional[Dict[str, Any]] = None,
+              known: Optional[Dict[str, str]] = None, verify: bool = False) -> Dict[str, Any]:
+    """
+    {'files': {path: [sha256, size, mtime_ns]}, 'links': {path: target},
+    'dirs': {path: mtime_ns}} of a site dir. Hashes come from `known`
+    ({path: sha256}), else from `previous` when the file is unchanged, else the
+    file is read. A dir whose mtime matches `previous` is taken as recorded
+    without listing it (files of a version are never rewritten in place), so
+    an unchanged tree costs one stat per dir. `verify` reads every file again.
+    """
+    if verify or not previous:
+        previous = {'files': {}, 'links': {}}
+    recorded_dirs = previous.get('dirs', {})
+    cache, children = {}, {}
+    for path, (digest, size, mtime) in previous['files'].items():
+        cache[(_VERSION_PREFIX_RE.sub('', path), size, mtime)] = digest
+        children.setdefault(path.rpartition('/')[0], ([], [], []))[0].append(path)
+    for path in previous['links']:
+        children.setdefault(path.rpartition('/')[0], ([], [], []))[1].append(path)
+    for path in recorded_dirs:
+        if path:
+            children.setdefault(path.rpartition('/')[0], ([], [], []))[2].append(path)
+    known = known or {}
+    files, links, dirs = {}, {}, {}
+    now = time.time_ns()
+
+    def walk(directory: str, rel: str):
+        mtime = os.stat(directory).st_mtime_ns
+        # Recorded once settled: a change within the same mtime tick would go unnoticed
+        dirs[rel] = mtime if now - mtime > MTIME_SETTLE_NS else 0
+        if mtime and recorded_dirs.get(rel) == mtime:
+            sub_files, sub_links, sub_dirs = children.get(rel, ((), (), ()))
+            files.update((path, previous['files'][path]) for path in sub_files)
+            links.update((path, previous['links'][path]) for path in sub_links)
+            for path in sub_dirs:
+                walk(os.path.join(site, *path.split('/')), path)
+            return
+        prefix = rel + '/' if rel else ''
+        for entry in os.scandir(directory):
+            if _skip(entry.name):
+                continue
+            path = prefix + entry.name
+            if entry.is_symlink():
+                links[path] = os.readlink(entry.path)
+            elif entry.is_dir():
+                walk(entry.path, path)
+            elif entry.is_file():
+                st = entry.stat()
+                digest = known.get(path) or cache.get((_VERSION_PREFIX_RE.sub('', path), st.st_size, st.st_mtime_ns))
+                files[path] = [digest or file_digest(entry.path), st.st_size, st.st_mtime_ns]
+
+    walk(site, '')
+    return {'files': files, 'links': links, 'dirs': dirs}
+
+
+def update_manifest(pub_root: str, subdomain: str, known: Optional[Dict[str, str]] = None,
+                    verify: bool = False) -> Optional[Dict[str, Any]]:
+    """Rescan a landing's tree into its manifest (removed if the tree is gone). Call with the publish lock held."""
+    site = site_dir(pub_root, subdomain)
+    if not os.path.isdir(site):
+        remove_manifest(pub_root, subdomain)
+        return None
+    manifest = {'subdomain': subdomain, **scan_site(site, load_manifest(pub_root, subdomain), known, verify)}
+    write_manifest(pub_root, subdomain, manifest)
+    return manifest
+
+
+def refresh_manifest(pub_root: str, subdomain: str, verify: bool = False) -> Optional[Dict[str, Any]]:
+    """update_manifest() taking the publish lock, for callers outside publish/rollback."""
+    if not os.path.isdir(site_dir(pub_root, subdomain)):
+        remove_manifest(pub_root, subdomain)
+        return None
+    with _site_lock(os.path.join(site_dir(pub_root, subdomain), VERSIONS_DIR)):
+        return update_manifest(pub_root, subdomain, verify=verify)
+
+
+def rebuild_manifests(pub_root: str, workers: int = 8) -> int:
+    """Refresh the manifest of every site dir (one-off for trees published before manifests). Returns the count."""
+    sites = list_sites(pub_root)
+    # hashlib releases the GIL on large buffers, so threads hash files in parallel
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        list(pool.map(lambda sub: refresh_manifest(pub_root, sub), sites))
+    return len(sites)
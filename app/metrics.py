@@ -0,0 +1,324 @@
+import bisect
+import contextlib
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Latency buckets in seconds (Prometheus `le` bounds); +Inf is implicit
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, label names)
+FAMILIES = {
+    'http_requests_total': ('counter', 'Requests handled', ('endpoint', 'method', 'status')),
+    'http_request_duration_seconds': ('histogram', 'Time until the response started', ('endpoint', 'method')),
+    'http_request_db_queries_total': ('counter', 'SQL statements executed by requests', ('endpoint',)),
+    'http_request_db_seconds_total': ('counter', 'Time spent executing SQL by requests', ('endpoint',)),
+    'db_query_duration_seconds': ('histogram', 'SQL statement execution time', ('op',)),
+    'landing_bytes_served_total': ('counter', 'Response bytes of landing pages and assets', ('subdomain',)),
+    'jobs_processed_total': ('counter', 'Background job attempts by outcome (done/retry/failed)', ('kind', 'outcome')),
+    'job_duration_seconds': ('histogram', 'Background job run time', ('kind',)),
+}
+
+# Label of bytes served for subdomains no landing has: a Host header or URL must not mint a series
+UNKNOWN_SUBDOMAIN = '_unknown'
+
+_request = threading.local()  # timings of the request running on this thread (slow-request log)
+
+
+class _Shard:
+    """Counters of one thread: only its owner writes, so no lock is needed."""
+    __slots__ = ('thread', 'counters', 'histograms')
+
+    def __init__(self, thread):
+        self.thread = thread
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+        self.histograms: Dict[Tuple[str, tuple], List[float]] = {}
+
+
+class Metrics:
+    """
+    Process-local counters and histograms cheap enough to leave on.
+
+    Every thread writes to its own shard (plain dict/list increments, no
+    lock); a scrape merges the shards. Histograms are preallocated lists of
+    bucket counts followed by the sum. Shards of finished threads are folded
+    into a base shard, so a thread-per-request server does not grow them.
+    Subdomains for which `known_subdomain` is false share one bytes-served series.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, known_subdomain: Optional[Callable[[str], bool]] = None):
+        self.buckets = tuple(buckets)
+        self.known_subdomain = known_subdomain
+        self.started = time.time()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._shards: List[_Shard] = []
+        self._retired = _Shard(None)
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, float]]]] = []
+
+    def _shard(self) -> _Shard:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = _Shard(threading.current_thread())
+            with self._lock:
+                if len(self._shards) >= 64:
+                    self._fold_dead()
+                self._shards.append(shard)
+        return shard
+
+    def _fold_dead(self):
+        alive = []
+        for shard in self._shards:
+            if shard.thread.is_alive():
+                alive.append(shard)
+            else:
+                _merge(self._retired, shard)
+        self._shards = alive
+
+    def inc(self, name: str, labels: tuple = (), value: float = 1):
+        counters = self._shard().counters
+        key = (name, labels)
+        counters[key] = counters.get(key, 0) + value
+
+    def observe(self, name: str, labels: tuple, seconds: float):
+        histograms = self._shard().histograms
+        key = (name, labels)
+        counts = histograms.get(key)
+        if counts is None:
+            counts = histograms[key] = [0] * (len(self.buckets) + 2)
+        counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        counts[-1] += seconds
+
+    def record_request(self, endpoint: str, method: str, status: int, seconds: float,
+                       subdomain: Optional[str] = None, nbytes: int = 0, timings: Optional[dict] = None):
+        self.inc('http_requests_total', (endpoint, method, str(status)))
+        self.observe('http_request_duration_seconds', (endpoint, method), seconds)
+        if subdomain and nbytes:
+            if self.known_subdomain is not None and not self.known_subdomain(subdomain):
+                subdomain = UNKNOWN_SUBDOMAIN
+            self.inc('landing_bytes_served_total', (subdomain,), nbytes)
+        if timings and timings['db_count']:
+            self.inc('http_request_db_queries_total', (endpoint,), timings['db_count'])
+            self.inc('http_request_db_seconds_total', (endpoint,), timings['db_time'])
+
+    def add_collector(self, collector: Callable[[], List[Tuple[str, str, str, float]]]):
+        """`collector()` returns (name, type, help, value) samples read at scrape time (cache stats ...)."""
+        self._collectors.append(collector)
+
+    def snapshot(self) -> _Shard:
+        merged = _Shard(None)
+        with self._lock:
+            self._fold_dead()
+            _merge(merged, self._retired)
+            for shard in self._shards:
+                # A writer may add a key while we copy; retry on the rare resize
+                for _ in range(3):
+                    try:
+                        _merge(merged, shard)
+                        break
+                    except RuntimeError:
+                        continue
+        return merged
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        data = self.snapshot()
+        lines = []
+        for name, (kind, help_text, label_names) in FAMILIES.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'counter':
+                for (metric, labels), value in sorted(data.counters.items()):
+                    if metric == name:
+                        lines.append(f'{name}{_labels(label_names, labels)} {_number(value)}')
+                continue
+            for (metric, labels), counts in sorted(data.histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float('inf'),), counts):
+                    cumulative += count
+                    le = '+Inf' if bound == float('inf') else _number(bound)
+                    lines.append(f'{name}_bucket{_labels(label_names + ("le",), labels + (le,))} {cumulative}')
+                lines.append(f'{name}_sum{_labels(label_names, labels)} {_number(counts[-1])}')
+                lines.append(f'{name}_count{_labels(label_names, labels)} {cumulative}')
+        samples = [('process_start_time_seconds', 'gauge', 'Start time of this worker', self.started)]
+        for collector in self._collectors:
+            samples += collector()
+        for name, kind, help_text, value in samples:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {_number(value)}']
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(into: _Shard, shard: _Shard):
+    for key, value in list(shard.counters.items()):
+        into.counters[key] = into.counters.get(key, 0) + value
+    for key, counts in list(shard.histograms.items()):
+        target = into.histograms.get(key)
+        if target is None:
+            into.histograms[key] = list(counts)
+        else:
+            for i, count in enumerate(counts):
+                target[i] += count
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values) -> str:
+    if not names:
+        return ''
+    return '{' + ','.join(f'{n}="{_escape(v)}"' for n, v in zip(names, values)) + '}'
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+# --- per-request timings -------------------------------------------------------------------------
+
+def begin_request() -> dict:
+    timings = {'db_count': 0, 'db_time': 0.0, 'stages': {}}
+    _request.timings = timings
+    return timings
+
+
+def end_request():
+    _request.timings = None
+
+
+@contextlib.contextmanager
+def stage(name: str):
+    """Time a block as one stage of the slow-request breakdown (no-op outside a request)."""
+    timings = getattr(_request, 'timings', None)
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stages = timings['stages']
+        stages[name] = stages.get(name, 0.0) + time.perf_counter() - started
+
+
+class TimedConnection:
+    """sqlite3 connection proxy timing execute/executemany/executescript (returned by get_db)."""
+    __slots__ = ('_conn', '_metrics')
+
+    def __init__(self, conn, metrics: Metrics):
+        self._conn = conn
+        self._metrics = metrics
+
+    def _timed(self, method, sql, *args):
+        started = time.perf_counter()
+        try:
+            return method(sql, *args)
+        finally:
+            elapsed = time.perf_counter() - started
+            op = sql.lstrip()[:6].upper()
+            self._metrics.observe('db_query_duration_seconds',
+                                  (op if op in ('SELECT', 'INSERT', 'UPDATE', 'DELETE') else 'OTHER',), elapsed)
+            timings = getattr(_request, 'timings', None)
+            if timings is not None:
+                timings['db_count'] += 1
+                timings['db_time'] += elapsed
+
+    def execute(self, sql, *args):
+        return self._timed(self._conn.execute, sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._timed(self._conn.executemany, sql, *args)
+
+    def executescript(self, sql):
+        return self._timed(self._conn.executescript, sql)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._conn.__exit__(*exc)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class MetricsMiddleware:
+    """
+    Outermost WSGI middleware: request count/latency per endpoint, bytes served
+    per landing (from Content-Length, so sendfile/file_wrapper responses are not
+    touched) and the optional slow-request log with a per-stage breakdown.
+    """
+
+    def __init__(self, wsgi_app, metrics: Metrics, slow_ms: float = 0):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+        self.slow_ms = slow_ms
+
+    def __call__(self, environ, start_response):
+        started = time.perf_counter()
+        timings = begin_request()
+        captured = []
+
+        def capture(status, headers, exc_info=None):
+            captured.append((status, headers))
+            return start_response(status, headers, exc_info) if exc_info else start_response(status, headers)
+
+        try:
+            return self.wsgi_app(environ, capture)
+        finally:
+            end_request()
+            status, headers = captured[-1] if captured else ('500 INTERNAL SERVER ERROR', [])
+            nbytes = next((int(v) for k, v in headers if k.lower() == 'content-length' and v.isdigit()), 0)
+            finish_request(self.metrics, environ, status, nbytes, time.perf_counter() - started, timings, self.slow_ms)
+
+
+def finish_request(metrics: Metrics, environ, status: str, nbytes: int, elapsed: float, timings: dict,
+                   slow_ms: float = 0):
+    """Record one request labelled from environ (`metrics.endpoint`, `landing.subdomain`); also used by asgi.py."""
+    method = environ.get('REQUEST_METHOD', 'GET')
+    metrics.record_request(environ.get('metrics.endpoint', 'unmatched'), method, int(status.split(' ', 1)[0]),
+                           elapsed, environ.get('landing.subdomain'), 0 if method == 'HEAD' else nbytes, timings)
+    if slow_ms and elapsed * 1000 >= slow_ms:
+        log_slow_request(environ, status, elapsed, timings)
+
+
+def log_slow_request(environ, status: str, elapsed: float, timings: dict):
+    parts = [f"db={timings['db_time'] * 1000:.1f}ms/{timings['db_count']}q"]
+    parts += [f"{name}={seconds * 1000:.1f}ms" for name, seconds in timings['stages'].items()]
+    accounted = timings['db_time'] + sum(timings['stages'].values())
+    parts.append(f"other={max(elapsed - accounted, 0) * 1000:.1f}ms")
+    path = environ.get('PATH_INFO', '')
+    if environ.get('QUERY_STRING'):
+        path += '?' + environ['QUERY_STRING']
+    print(f"SLOW {elapsed * 1000:.1f}ms pid={os.getpid()} {environ.get('REQUEST_METHOD')} {path} "
+          f"host={environ.get('HTTP_HOST', '')} endpoint={environ.get('metrics.endpoint', 'unmatched')} "
+          f"status={status.split(' ', 1)[0]} " + ' '.join(parts))
+
+
+def app_stats(extensions) -> List[Tuple[str, str, str, float]]:
+    """Scrape-time gauges/counters of this worker's caches, event buffer and routing table."""
+    samples = []
+    page = extensions['page_cache'].stats()
+    samples += [('page_cache_hits_total', 'counter', 'Page cache hits', page['hits']),
+                ('page_cache_misses_total', 'counter', 'Page cache misses (index.html read from disk)', page['misses']),
+                ('page_cache_entries', 'gauge', 'Pages held in the page cache', page['entries']),
+                ('page_cache_bytes', 'gauge', 'Bytes held in the page cache', page['bytes'])]
+    users = extensions['user_cache'].stats()
+    samples += [('user_cache_hits_total', 'counter', 'User loader cache hits', users['hits']),
+                ('user_cache_misses_total', 'counter', 'User loader cache misses', users['misses'])]
+    events = extensions['event_buffer'].stats()
+    samples += [('events_buffered', 'gauge', 'Beacon events waiting to be flushed', events['buffered']),
+                ('events_recorded_total', 'counter', 'Beacon events accepted', events['recorded']),
+                ('events_written_total', 'counter', 'Beacon events written to SQLite', events['written']),
+                ('events_dropped_total', 'counter', 'Beacon events dropped (buffer full)', events['dropped'])]
+    samples.append(('routing_table_landings', 'gauge', 'Landings in the routing table', len(extensions['routing_table'])))
+    return samples
+
+
+def get_metrics() -> Optional[Metrics]:
+    from flask import current_app
+    return current_app.extensions.get('metrics')
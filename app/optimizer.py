@@ -0,0 +1,240 @@
+import base64
+import binascii
+import gzip
+import hashlib
+import os
+import re
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import unquote, urlsplit
+
+from .blobs import BLOB_URL_PREFIX, blob_name, blob_url, intern_file
+from .publishing import INDEX_FILENAME, write_index
+from .utils import TRACKING_TOKEN_RE
+
+# Optional publish-time page optimization (HTML_OPTIMIZE=1):
+#   - inline `data:image/...;base64` images become files in <landing>/_inline/ and are
+#     referenced by their immutable blob URL (/_b/<sha256>.<ext>), so the page shrinks by
+#     the base64 text and the image is cached by browsers/CDN and shared between landings;
+#   - local <script src> / <link rel=stylesheet> files are referenced by their blob URL too;
+#   - HTML whitespace and comments and inline <style> CSS are minified. Tracking markers
+#     (<!-- Global Site Tag --> etc., </head>, </body>) and conditional comments are kept,
+#     and <script>/<pre>/<textarea> contents are left untouched.
+# Uploaded anhN images are not fingerprinted: the image pipeline (app/images.py) replaces
+# them in later versions under the same names.
+
+INLINE_DIR = '_inline'
+# Smaller images stay inline (a separate request costs more than their base64 text)
+INLINE_MIN_BYTES = 1024
+FINGERPRINT_EXTENSIONS = {'.css', '.js', '.mjs'}
+
+DATA_URI_RE = re.compile(
+    r"data:image/(?P<type>png|jpe?g|gif|webp|avif|svg\+xml|x-icon|vnd\.microsoft\.icon);base64,"
+    r"(?P<data>[A-Za-z0-9+/]+={0,2})(?![A-Za-z0-9+/=])",
+    re.IGNORECASE,
+)
+IMAGE_EXTENSIONS = {'png': '.png', 'jpeg': '.jpg', 'jpg': '.jpg', 'gif': '.gif', 'webp': '.webp', 'avif': '.avif',
+                    'svg+xml': '.svg', 'x-icon': '.ico', 'vnd.microsoft.icon': '.ico'}
+
+_ATTR = r"""(?:"[^"]*"|'[^']*'|[^'">])*"""
+HTML_TOKEN_RE = re.compile(
+    r"(?P<comment><!--.*?-->)"
+    rf"|(?P<raw_open><(?P<raw_tag>script|style|pre|textarea)\b{_ATTR}>)(?P<raw_body>.*?)(?P<raw_close></(?P=raw_tag)\s*>)"
+    rf"|(?P<tag></?[a-zA-Z!?]{_ATTR}>)",
+    re.IGNORECASE | re.DOTALL,
+)
+# HTML whitespace only: a no-break space (\xa0) is content
+HTML_SPACE_RE = re.compile(r"[ \t\n\r\f]+")
+TAG_SPACE_RE = re.compile(r"""("[^"]*"|'[^']*')|[ \t\n\r\f]+""")
+ATTR_RE = re.compile(r"""([ \t\n\r\f])(src|href|rel)[ \t\n\r\f]*=[ \t\n\r\f]*("[^"]*"|'[^']*'|[^ \t\n\r\f>]+)""",
+                     re.IGNORECASE)
+
+CSS_TOKEN_RE = re.compile(r"""("(?:\\.|[^"\\\n])*"|'(?:\\.|[^'\\\n])*')""")
+CSS_COMMENT_RE = re.compile(r"/\*(?!!).*?\*/", re.DOTALL)
+CSS_PUNCT_RE = re.compile(r" ?([{};,>]) ?")
+CSS_RELATIVE_REF_RE = re.compile(r"""(?:url\(\s*['"]?|@import\s+['"])(?!data:|https?:|//|/|#)""", re.IGNORECASE)
+
+
+def _keep_comment(comment: str) -> bool:
+    # Tracking markers and IE conditional comments (<!--[if IE]>...<![endif]-->)
+    return bool(TRACKING_TOKEN_RE.fullmatch(comment)) or '[if' in comment[:12] or '[endif]' in comment
+
+
+def minify_css(css: str) -> str:
+    """Drop comments (except /*! ... */) and redundant whitespace; strings are kept as-is."""
+    parts = CSS_TOKEN_RE.split(css)
+    for i in range(0, len(parts), 2):
+        code = CSS_COMMENT_RE.sub(' ', parts[i])
+        code = HTML_SPACE_RE.sub(' ', code)
+        code = CSS_PUNCT_RE.sub(r'\1', code)
+        parts[i] = code.replace(': ', ':').replace('( ', '(').replace(' )', ')').replace(';}', '}')
+    return ''.join(parts).strip()
+
+
+class _Optimizer:
+    def __init__(self, pub_root: str, directory: str):
+        self.pub_root = pub_root
+        self.directory = directory
+        self.inline_images = 0
+        self.inline_image_bytes = 0
+        self.fingerprinted = 0
+
+    def _store_inline(self, data: bytes, ext: str) -> Optional[str]:
+        name = blob_name(hashlib.sha256(data).hexdigest(), INLINE_DIR + ext)
+        path = os.path.join(self.directory, INLINE_DIR, name)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        # The file links its blob, so the /_b/ URL resolves for as long as a version holds it
+        if intern_file(self.pub_root, path) is None:
+            os.remove(path)
+            return None
+        return name
+
+    def _extract(self, match: re.Match) -> str:
+        try:
+            data = base64.b64decode(match.group('data'), validate=True)
+        except (binascii.Error, ValueError):
+            return match.group(0)
+        if len(data) < INLINE_MIN_BYTES:
+            return match.group(0)
+        name = self._store_inline(data, IMAGE_EXTENSIONS[match.group('type').lower()])
+        if name is None:
+            return match.group(0)
+        self.inline_images += 1
+        self.inline_image_bytes += len(data)
+        return blob_url(name)
+
+    def extract_images(self, text: str) -> str:
+        return DATA_URI_RE.sub(self._extract, text) if 'data:image/' in text.lower() else text
+
+    def _fingerprint(self, url: str) -> Optional[str]:
+        """Blob URL of a local script/stylesheet referenced by a relative URL, if it is safe to move."""
+        parts = urlsplit(url)
+        if parts.scheme or parts.netloc or parts.query or url.startswith(('/', '#')):
+            return None
+        rel = os.path.normpath(unquote(parts.path))
+        if rel.startswith('..') or os.path.isabs(rel) or os.path.splitext(rel)[1].lower() not in FINGERPRINT_EXTENSIONS:
+            return None
+        path = os.path.join(self.directory, rel)
+        if not os.path.isfile(path):
+            return None
+        if rel.lower().endswith('.css'):
+            # Relative url()/@import inside the stylesheet would resolve against /_b/
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                if CSS_RELATIVE_REF_RE.search(f.read()):
+                    return None
+        name = intern_file(self.pub_root, path)
+        if name is None:
+            return None
+        self.fingerprinted += 1
+        return blob_url(name) + (f'#{parts.fragment}' if parts.fragment else '')
+
+    def tag(self, tag: str) -> str:
+        tag = TAG_SPACE_RE.sub(lambda m: m.group(1) or ' ', tag)
+        if tag.endswith(' >'):
+            tag = tag[:-2] + '>'
+        tag = self.extract_images(tag)
+        name = tag[1:].split(' ', 1)[0].rstrip('/>').lower()
+        if name not in ('script', 'link'):
+            return tag
+        attrs = {m.group(2).lower(): m for m in ATTR_RE.finditer(tag)}
+        ref = attrs.get('src' if name == 'script' else 'href')
+        if ref is None or (name == 'link' and 'stylesheet' not in (attrs['rel'].group(3) if 'rel' in attrs else '').lower()):
+            return tag
+        url = self._fingerprint(ref.group(3).strip('"\'').strip())
+        if url is None:
+            return tag
+        start, end = ref.span(3)
+        return f'{tag[:start]}"{url}"{tag[end:]}'
+
+    def html(self, html: str) -> str:
+        out = []
+        text = []
+        pos = 0
+
+        def flush():
+            if text:
+                out.append(HTML_SPACE_RE.sub(lambda m: '\n' if '\n' in m.group(0) else ' ', ''.join(text)))
+                text.clear()
+
+        for m in HTML_TOKEN_RE.finditer(html):
+            text.append(html[pos:m.start()])
+            pos = m.end()
+            if m.group('comment') is not None:
+                if _keep_comment(m.group('comment')):
+                    flush()
+                    out.append(m.group('comment'))
+                continue  # a dropped comment joins the text around it
+            flush()
+            if m.group('tag') is not None:
+                out.append(self.tag(m.group('tag')))
+                continue
+            body = m.group('raw_body')
+            if m.group('raw_tag').lower() == 'style':
+                body = minify_css(self.extract_images(body))
+            out.append(self.tag(m.group('raw_open')) + body + m.group('raw_close'))
+        text.append(html[pos:])
+        flush()
+        return ''.join(out)
+
+
+def _gzip_size(data: bytes) -> int:
+    return len(gzip.compress(data, compresslevel=6, mtime=0))
+
+
+def optimize_html(html: str, pub_root: str, directory: str) -> Tuple[str, Dict[str, Any]]:
+    """
+    Optimize a page published in `directory` (a staging dir of publish()).
+    Returns the new HTML and a before/after weight report. If the tracking
+    markers would not survive unchanged, the page is returned as it was.
+    """
+    started = time.perf_counter()
+    optimizer = _Optimizer(pub_root, directory)
+    optimized = optimizer.html(html)
+    markers = [m.group(0).lower() for m in TRACKING_TOKEN_RE.finditer(html)]
+    if [m.group(0).lower() for m in TRACKING_TOKEN_RE.finditer(optimized)] != markers:
+        optimized = html
+        optimizer = _Optimizer(pub_root, directory)
+    before, after = html.encode('utf-8'), optimized.encode('utf-8')
+    report = {
+        'bytes_before': len(before),
+        'bytes_after': len(after),
+        'gzip_before': _gzip_size(before),
+        'gzip_after': _gzip_size(after),
+        'inline_images': optimizer.inline_images,
+        'inline_image_bytes': optimizer.inline_image_bytes,
+        'fingerprinted': optimizer.fingerprinted,
+        'ms': round((time.perf_counter() - started) * 1000, 2),
+    }
+    report['saved_pct'] = round((1 - report['bytes_after'] / report['bytes_before']) * 100, 1) if before else 0.0
+    return optimized, report
+
+
+def optimize_landing(pub_root: str, directory: str, filename: str = INDEX_FILENAME) -> Dict[str, Any]:
+    """
+    Optimize directory/<filename> in place (from a publish() populate callback)
+    and drop _inline/ images the page no longer references. Returns the report.
+    """
+    page = os.path.join(directory, filename)
+    with open(page, 'r', encoding='utf-8') as f:
+        html = f.read()
+    optimized, report = optimize_html(html, pub_root, directory)
+    if optimized != html:
+        write_index(directory, optimized, filename)
+    inline_dir = os.path.join(directory, INLINE_DIR)
+    if os.path.isdir(inline_dir):
+        for name in os.listdir(inline_dir):
+            if BLOB_URL_PREFIX + name not in optimized:
+                os.remove(os.path.join(inline_dir, name))
+    return report
+
+
+def page_weight_fields(report: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """landing_pages columns recording the last optimization of a landing."""
+    if not report:
+        return {}
+    return {'page_bytes_original': report['bytes_before'], 'page_bytes': report['bytes_after']}
@@ -0,0 +1,140 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+from flask import current_app
+from werkzeug.wrappers import Response
+
+from .metrics import stage
+from .precompress import ENCODING_SUFFIXES, accepted_encodings
+
+
+class CachedPage:
+    """Rendered bytes of one published index.html plus its validators and precompressed variants."""
+    __slots__ = ('body', 'etag', 'last_modified', 'stamp', 'variants')
+
+    def __init__(self, body: bytes, stamp, last_modified: float, variants=None):
+        self.body = body
+        self.stamp = stamp
+        self.last_modified = last_modified
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.variants = variants or {}
+
+    @property
+    def size(self) -> int:
+        return len(self.body) + sum(len(v) for v in self.variants.values())
+
+
+class PageCache:
+    """
+    Bounded LRU cache of published landing pages keyed by subdomain.
+
+    Entries are validated against (inode, mtime, size) of index.html on every
+    lookup, so a page rewritten by another worker is picked up on the next hit;
+    the write paths in this process also call invalidate() explicitly.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, CachedPage]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, subdomain: str, index_file: str) -> Optional[CachedPage]:
+        try:
+            st = os.stat(index_file)
+        except (FileNotFoundError, NotADirectoryError):
+            self.invalidate(subdomain)
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+
+        with self._lock:
+            entry = self._entries.get(subdomain)
+            if entry is not None and entry.stamp == stamp:
+                self._entries.move_to_end(subdomain)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        with stage('page_read'):
+            with open(index_file, 'rb') as f:
+                body = f.read()
+            entry = CachedPage(body, stamp, st.st_mtime, _read_variants(index_file, st.st_mtime_ns))
+        if entry.size <= self.max_bytes:
+            self._store(subdomain, entry)
+        return entry
+
+    def invalidate(self, subdomain: str):
+        with self._lock:
+            entry = self._entries.pop(subdomain, None)
+            if entry is not None:
+                self._bytes -= entry.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': len(self._entries), 'bytes': self._bytes}
+
+    def _store(self, subdomain: str, entry: CachedPage):
+        with self._lock:
+            old = self._entries.pop(subdomain, None)
+            if old is not None:
+                self._bytes -= old.size
+            self._entries[subdomain] = entry
+            self._bytes += entry.size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.size
+
+
+def _read_variants(index_file: str, index_mtime_ns: int) -> dict:
+    variants = {}
+    for encoding, suffix in ENCODING_SUFFIXES:
+        try:
+            with open(index_file + suffix, 'rb') as f:
+                if os.fstat(f.fileno()).st_mtime_ns < index_mtime_ns:
+                    continue  # stale sibling from a previous version of the page
+                variants[encoding] = f.read()
+        except FileNotFoundError:
+            continue
+    return variants
+
+
+def get_page_cache() -> PageCache:
+    return current_app.extensions['page_cache']
+
+
+def page_response(entry: CachedPage, environ) -> Response:
+    """
+    Build a 200/304 response for a cached page honouring If-None-Match /
+    If-Modified-Since, using a precompressed variant when Accept-Encoding allows.
+    """
+    body, etag, encoding = entry.body, entry.etag, None
+    if entry.variants:
+        accepted = accepted_encodings(environ.get('HTTP_ACCEPT_ENCODING'))
+        for candidate, _ in ENCODING_SUFFIXES:
+            if candidate in entry.variants and (candidate in accepted or '*' in accepted):
+                encoding = candidate
+                body = entry.variants[candidate]
+                etag = f'{entry.etag}-{candidate}'
+                break
+
+    response = Response(body, mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    if entry.variants:
+        response.vary.add('Accept-Encoding')
+    response.set_etag(etag)
+    response.last_modified = entry.last_modified
+    # Pages change on update/pause, so let browsers keep a copy but always revalidate
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(environ)
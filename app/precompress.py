@@ -0,0 +1,152 @@
+import os
+import zlib
+from typing import Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; .gz siblings are still produced
+    brotli = None
+
+# Raster images/fonts are already compressed, re-compressing them only wastes disk
+COMPRESSIBLE_EXTENSIONS = {
+    '.html', '.htm', '.css', '.js', '.mjs', '.json', '.svg', '.txt', '.xml', '.ico', '.map',
+}
+ENCODING_SUFFIXES = (('br', '.br'), ('gzip', '.gz'))
+
+
+def is_compressible(path: str) -> bool:
+    return os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS
+
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def _compressors():
+    """(encoding, suffix, compressor) triples; each compressor has .compress(chunk) and .flush()."""
+    gz = zlib.compressobj(9, zlib.DEFLATED, 31)  # wbits 31 = gzip container, mtime 0
+    compressors = [('gzip', '.gz', gz)]
+    if brotli is not None:
+        compressors.insert(0, ('br', '.br', _BrotliCompressor()))
+    return compressors
+
+
+class _BrotliCompressor:
+    def __init__(self):
+        self._c = brotli.Compressor(quality=11)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._c.process(data)
+
+    def flush(self) -> bytes:
+        return self._c.finish()
+
+
+def _chunks(path: str, data: Optional[bytes]):
+    if data is not None:
+        yield data
+        return
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def precompress(path: str, data: Optional[bytes] = None, source: Optional[str] = None) -> list:
+    """
+    Write .gz (and .br when brotli is installed) siblings next to `path`.
+
+    `data` may be passed when the caller already holds the file content, or
+    `source` when it is still in a temp file about to be renamed to `path`;
+    otherwise `path` is read. Files are compressed in chunks, so memory stays
+    flat whatever their size. Siblings that would not be smaller than the
+    original are removed instead, so their presence always means "serve me".
+    Returns the encodings written.
+    """
+    compressors = _compressors()
+    outputs = []
+    for _, suffix, _ in compressors:
+        tmp = path + suffix + '.tmp'
+        outputs.append((tmp, open(tmp, 'wb')))
+    size = 0
+    try:
+        for chunk in _chunks(source or path, data):
+            size += len(chunk)
+            for (_, _, compressor), (_, out) in zip(compressors, outputs):
+                out.write(compressor.compress(chunk))
+        for (_, _, compressor), (_, out) in zip(compressors, outputs):
+            out.write(compressor.flush())
+    finally:
+        for _, out in outputs:
+            out.close()
+
+    written = []
+    for (encoding, suffix, _), (tmp, _) in zip(compressors, outputs):
+        sibling = path + suffix
+        if os.path.getsize(tmp) < size:
+            os.replace(tmp, sibling)
+            written.append(encoding)
+        else:
+            os.remove(tmp)
+            if os.path.exists(sibling):
+                os.remove(sibling)
+    return written
+
+
+def precompress_if_compressible(path: str) -> list:
+    return precompress(path) if is_compressible(path) else []
+
+
+def remove_siblings(path: str):
+    for _, suffix in ENCODING_SUFFIXES:
+        try:
+            os.remove(path + suffix)
+        except FileNotFoundError:
+            pass
+
+
+def accepted_encodings(accept_encoding: Optional[str]) -> set:
+    """Parse an Accept-Encoding header into the set of codings with q > 0."""
+    accepted = set()
+    for part in (accept_encoding or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        if q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def negotiate(path: str, accept_encoding: Optional[str]) -> Tuple[str, Optional[str]]:
+    """
+    Pick the best precompressed sibling of `path` the client accepts.
+
+    Returns (path_to_send, content_encoding). Siblings older than the original
+    are ignored so a page rewritten without precompression is never served stale.
+    """
+    accepted = accepted_encodings(accept_encoding)
+    if not accepted:
+        return path, None
+    try:
+        original_mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return path, None
+    for encoding, suffix in ENCODING_SUFFIXES:
+        if encoding not in accepted and '*' not in accepted:
+            continue
+        try:
+            st = os.stat(path + suffix)
+        except OSError:
+            continue
+        if st.st_mtime_ns >= original_mtime:
+            return path + suffix, encoding
+    return path, None
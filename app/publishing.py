@@ -0,0 +1,295 @@
+import contextlib
+import os
+import shutil
+import tempfile
+import threading
+from typing import Callable, Iterable, List, Optional, Union
+
+try:
+    import fcntl
+except ImportError:  # Windows dev machines: no cross-process publish lock
+    fcntl = None
+
+from .blobs import intern_tree
+from .metrics import stage
+from .precompress import ENCODING_SUFFIXES, precompress
+
+INDEX_FILENAME = 'index.html'
+PAUSED_FILENAME = 'index.paused.html'
+VERSIONS_DIR = '.v'
+CURRENT_LINK = 'current'
+
+# Layout of a versioned landing:
+#   published/<subdomain>/.v/1/ .v/2/ ...   immutable snapshots (files are only ever added
+#                                            to a staging dir, never rewritten in place)
+#   published/<subdomain>/current -> .v/2    swapped atomically on publish/rollback (a file
+#                                            holding ".v/2" where symlinks are not allowed)
+#   published/.blobs/                        content-addressed store every published file is
+#                                            a hardlink of (app/blobs.py)
+# Landings published before versioning keep their files directly in published/<subdomain>/
+# until their next publish.
+
+
+def write_index(target_dir: str, html: Union[str, Iterable[str]], filename: str = INDEX_FILENAME) -> str:
+    """
+    Publish `html` as target_dir/<filename> together with its .gz/.br siblings.
+
+    `html` is a str or an iterable of str chunks (streamed to disk as they
+    come). The page is written to a temp file and renamed into place after the
+    siblings exist, so readers (and Nginx gzip_static) never see a truncated
+    page or a compressed variant older than the page it belongs to.
+    """
+    os.makedirs(target_dir, exist_ok=True)
+    target_file = os.path.join(target_dir, filename)
+    # Unique per writer so concurrent publishes of the same page never share a temp file
+    tmp = f"{target_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        if isinstance(html, str):
+            data = html.encode('utf-8')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            precompress(target_file, data)
+        else:
+            with open(tmp, 'w', encoding='utf-8', newline='') as f:
+                for chunk in html:
+                    f.write(chunk)
+            precompress(target_file, source=tmp)
+        os.replace(tmp, target_file)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return target_file
+
+
+def site_dir(pub_root: str, subdomain: str) -> str:
+    return os.path.join(pub_root, subdomain)
+
+
+def list_sites(pub_root: str) -> List[str]:
+    """Subdomains with a dir under pub_root (store dirs such as .blobs start with a dot, subdomains cannot)."""
+    try:
+        return sorted(e.name for e in os.scandir(pub_root) if e.is_dir(follow_symlinks=False) and not e.name.startswith('.'))
+    except FileNotFoundError:
+        return []
+
+
+def remove_site(pub_root: str, subdomain: str) -> bool:
+    """Delete the published tree and manifest of a deleted landing (its blobs go with the next gc). Returns True if it existed."""
+    from .manifests import remove_manifest
+
+    path = site_dir(pub_root, subdomain)
+    existed = os.path.isdir(path)
+    if existed:
+        shutil.rmtree(path)
+    remove_manifest(pub_root, subdomain)
+    return existed
+
+
+def resolve_landing_dir(pub_root: str, subdomain: str) -> str:
+    """Directory holding the live files of a landing (current version, or the legacy flat dir)."""
+    site = os.path.join(pub_root, subdomain)
+    current = os.path.join(site, CURRENT_LINK)
+    if os.path.isdir(current):
+        return current
+    target = current_target(site)
+    return os.path.join(site, *target.split('/')) if target else site
+
+
+def current_target(site: str) -> Optional[str]:
+    """Where `current` of a site dir points ('.v/3'), from the symlink or the pointer file replacing it."""
+    current = os.path.join(site, CURRENT_LINK)
+    try:
+        return os.readlink(current)
+    except OSError:
+        pass
+    try:
+        with open(current, 'r', encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+def version_dir(pub_root: str, subdomain: str, version: int) -> str:
+    return os.path.join(pub_root, subdomain, VERSIONS_DIR, str(version))
+
+
+def source_page(target_dir: str) -> str:
+    """The file holding the real page: index.paused.html while a landing is paused."""
+    paused = os.path.join(target_dir, PAUSED_FILENAME)
+    return paused if os.path.exists(paused) else os.path.join(target_dir, INDEX_FILENAME)
+
+
+def list_versions(pub_root: str, subdomain: str) -> List[int]:
+    try:
+        names = os.listdir(os.path.join(pub_root, subdomain, VERSIONS_DIR))
+    except FileNotFoundError:
+        return []
+    return sorted(int(n) for n in names if n.isdigit())
+
+
+def current_version(pub_root: str, subdomain: str) -> Optional[int]:
+    target = current_target(site_dir(pub_root, subdomain))
+    if target is None:
+        return None
+    name = os.path.basename(target.rstrip('/'))
+    return int(name) if name.isdigit() else None
+
+
+@contextlib.contextmanager
+def _site_lock(path: str):
+    """Serialize publishes of one landing across threads and worker processes."""
+    os.makedirs(path, exist_ok=True)
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(path, '.lock'), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _link_tree(src: str, dst: str, skip: set):
+    """Hardlink every file of `src` into `dst` (falling back to a copy across filesystems)."""
+    for entry in os.scandir(src):
+        if entry.name in skip or entry.name in (VERSIONS_DIR, CURRENT_LINK, '.lock') or entry.name.endswith('.tmp'):
+            continue
+        target = os.path.join(dst, entry.name)
+        if entry.is_dir(follow_symlinks=False):
+            os.makedirs(target, exist_ok=True)
+            _link_tree(entry.path, target, set())
+        elif entry.is_file(follow_symlinks=False):
+            try:
+                os.link(entry.path, target)
+            except OSError:
+                shutil.copy2(entry.path, target)
+
+
+def _update_manifest(pub_root: str, subdomain: str, known: Optional[dict] = None):
+    from .manifests import update_manifest  # manifests imports this module
+    update_manifest(pub_root, subdomain, known)
+
+
+def _swap_current(site: str, version: int):
+    link = os.path.join(site, CURRENT_LINK)
+    tmp = f"{link}.{os.getpid()}.{threading.get_ident()}.tmp"
+    target = f'{VERSIONS_DIR}/{version}'
+    try:
+        os.symlink(target, tmp)
+    except (OSError, NotImplementedError):  # Windows without admin/developer mode: pointer file
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(target)
+    os.replace(tmp, link)
+
+
+def publish(pub_root: str, subdomain: str, html: Optional[str] = None,
+            populate: Optional[Callable[[str], None]] = None,
+            remove: Iterable[str] = (),
+            transform: Optional[Callable[[str], str]] = None,
+            keep: Optional[int] = None, inherit: bool = True) -> int:
+    """
+    Publish a new immutable version of a landing and make it current.
+
+    The new version starts as hardlinks of the current one (so unchanged assets
+    cost neither disk nor copy time), then:
+      - `populate(staging_dir)` adds/replaces files. It must replace paths
+        (write a new file or os.replace) and never write through an existing
+        one, since that inode is shared with older versions;
+      - names in `remove` are dropped;
+      - `transform(html)` rewrites the current page (index.paused.html of a
+        landing paused on disk, else index.html), or `html` replaces index.html.
+    New files are then deduplicated against the blob store, the staging dir
+    is renamed to .v/<n> and the `current` symlink swapped atomically.
+    Returns the new version number. With `inherit=False` the version starts
+    empty (a full replacement, e.g. a re-import).
+    """
+    site = site_dir(pub_root, subdomain)
+    versions = os.path.join(site, VERSIONS_DIR)
+    with stage('publish'), _site_lock(versions):
+        base = resolve_landing_dir(pub_root, subdomain)
+        staging = tempfile.mkdtemp(prefix='.staging-', dir=versions)
+        try:
+            if inherit and os.path.isdir(base):
+                skip = ({INDEX_FILENAME} | {INDEX_FILENAME + s for _, s in ENCODING_SUFFIXES}) if html is not None else set()
+                _link_tree(base, staging, skip)
+            if populate is not None:
+                populate(staging)
+            for name in remove:
+                for path in [name] + [name + s for _, s in ENCODING_SUFFIXES]:
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(os.path.join(staging, path))
+            page = source_page(staging)
+            if html is None and transform is not None and os.path.exists(page):
+                # Read under the lock: a page edited meanwhile is transformed, not overwritten
+                with open(page, 'r', encoding='utf-8') as f:
+                    current_html = f.read()
+                new_html = transform(current_html)
+                if new_html != current_html:
+                    write_index(staging, new_html, os.path.basename(page))
+            if html is not None:
+                write_index(staging, html)
+            # Files new in this version become links of their blob: identical bytes are stored once
+            digests = {}
+            intern_tree(pub_root, staging, digests=digests)
+            os.chmod(staging, 0o755)
+
+            version = (list_versions(pub_root, subdomain) or [0])[-1] + 1
+            os.rename(staging, os.path.join(versions, str(version)))
+        except BaseException:
+            shutil.rmtree(staging, ignore_errors=True)
+            raise
+        _swap_current(site, version)
+        if keep:
+            prune_versions(pub_root, subdomain, keep)
+        # The files just interned are not hashed again for the manifest
+        prefix = f'{VERSIONS_DIR}/{version}/'
+        _update_manifest(pub_root, subdomain, {
+            prefix + os.path.relpath(path, staging).replace(os.sep, '/'): name[:64] for path, name in digests.items()
+        })
+    return version
+
+
+def restore_paused_page(pub_root: str, subdomain: str, keep: Optional[int] = None) -> Optional[int]:
+    """
+    Undo the on-disk pause of landings paused before pause became a status
+    check at serve time (placeholder in index.html, page in index.paused.html).
+    Returns the new version, or None if there was nothing to restore.
+    """
+    if not os.path.exists(os.path.join(resolve_landing_dir(pub_root, subdomain), PAUSED_FILENAME)):
+        return None
+
+    def restore(staging):
+        index_file = os.path.join(staging, INDEX_FILENAME)
+        os.replace(os.path.join(staging, PAUSED_FILENAME), index_file)
+        precompress(index_file)
+    return publish(pub_root, subdomain, populate=restore, keep=keep)
+
+
+def rollback(pub_root: str, subdomain: str, version: Optional[int] = None) -> int:
+    """Point `current` at an older version (default: the one before current)."""
+    site = site_dir(pub_root, subdomain)
+    with _site_lock(os.path.join(site, VERSIONS_DIR)):
+        versions = list_versions(pub_root, subdomain)
+        if version is None:
+            current = current_version(pub_root, subdomain)
+            older = [v for v in versions if current is None or v < current]
+            if not older:
+                raise ValueError('Không có phiên bản cũ hơn để khôi phục')
+            version = older[-1]
+        elif version not in versions:
+            raise ValueError(f'Phiên bản {version} không tồn tại')
+        _swap_current(site, version)
+        _update_manifest(pub_root, subdomain)
+    return version
+
+
+def prune_versions(pub_root: str, subdomain: str, keep: int) -> List[int]:
+    """Delete all but the newest `keep` versions, never the current one. Returns removed versions."""
+    current = current_version(pub_root, subdomain)
+    versions = list_versions(pub_root, subdomain)
+    doomed = [v for v in versions[:-keep] if v != current] if keep > 0 else []
+    for v in doomed:
+        shutil.rmtree(version_dir(pub_root, subdomain, v), ignore_errors=True)
+    return doomed
@@ -0,0 +1,260 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set
+from urllib.parse import urlsplit
+
+from .blobs import blob_name, blob_path
+from .manifests import MTIME_SETTLE_NS, load_manifest, manifests_root, remove_manifest, write_manifest
+from .precompress import CHUNK_SIZE, is_compressible
+
+# Push replication of PUBLISHED_ROOT to serving nodes (`flask replicate`):
+#   - every publish/rollback/delete rewrites published/.manifests/<subdomain>.json (app/manifests.py);
+#   - a sync lists that one dir and only looks at manifests changed since the last sync
+#     to a target (state in .manifests/.sync/), so idle rounds cost one stat;
+#   - for a changed landing the primary and replica manifests are diffed: files with a new
+#     hash are sent (zlib-compressed if compressible) unless the replica's blob store
+#     already holds those bytes, then `current` links are set, then files gone on the
+#     primary are removed and finally the manifest is written. A replica serves the old
+#     version until the new one is complete; an interrupted sync is simply redone.
+# Landings are synced in parallel. Replicas keep the same layout (.blobs, <sub>/.v/<n>,
+# <sub>/current), so the Nginx config and `flask gc-blobs` work on them unchanged.
+
+SYNC_STATE_DIR = '.sync'
+
+
+class LocalTransport:
+    """
+    Replica in a local directory: another disk, an NFS/sshfs mount of the
+    serving node, or tests. Other transports implement the same methods and
+    are registered in TRANSPORTS under their URL scheme.
+    """
+
+    def __init__(self, url: str):
+        parts = urlsplit(url)
+        self.root = parts.path if parts.scheme == 'file' else url
+
+    def _path(self, subdomain: str, path: str) -> str:
+        return os.path.join(self.root, subdomain, *path.split('/'))
+
+    def read_manifest(self, subdomain: str) -> Optional[Dict[str, Any]]:
+        return load_manifest(self.root, subdomain)
+
+    def write_manifest(self, subdomain: str, manifest: Dict[str, Any]):
+        write_manifest(self.root, subdomain, manifest)
+
+    def has_blob(self, name: str) -> bool:
+        return os.path.exists(blob_path(self.root, name))
+
+    def put_blob(self, name: str, chunks: Iterator[bytes], compressed: bool, mtime_ns: int):
+        target = blob_path(self.root, name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        decompressor = zlib.decompressobj() if compressed else None
+        try:
+            with open(tmp, 'wb') as f:
+                for chunk in chunks:
+                    f.write(decompressor.decompress(chunk) if decompressor else chunk)
+                if decompressor:
+                    f.write(decompressor.flush())
+            os.utime(tmp, ns=(mtime_ns, mtime_ns))
+            try:
+                os.link(tmp, target)  # never replace a blob: its inode is shared by the files linking it
+            except FileExistsError:
+                pass
+        finally:
+            os.remove(tmp)
+
+    def link_blob(self, name: str, subdomain: str, path: str):
+        target = self._path(subdomain, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.link(blob_path(self.root, name), tmp)
+        os.replace(tmp, target)
+
+    def symlink(self, subdomain: str, path: str, target: str):
+        link = self._path(subdomain, path)
+        os.makedirs(os.path.dirname(link), exist_ok=True)
+        tmp = f"{link}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.symlink(target, tmp)
+        os.replace(tmp, link)
+
+    def remove(self, subdomain: str, path: str):
+        """Remove a file or link of a landing, and the dirs it leaves empty (pruned versions)."""
+        target = self._path(subdomain, path)
+        try:
+            os.remove(target)
+        except FileNotFoundError:
+            pass
+        site = os.path.join(self.root, subdomain)
+        parent = os.path.dirname(target)
+        while parent != site and parent.startswith(site):
+            try:
+                os.rmdir(parent)
+            except OSError:
+                break
+            parent = os.path.dirname(parent)
+
+    def remove_site(self, subdomain: str):
+        shutil.rmtree(os.path.join(self.root, subdomain), ignore_errors=True)
+        remove_manifest(self.root, subdomain)
+
+
+TRANSPORTS = {'file': LocalTransport}
+
+
+def open_transport(url: str):
+    scheme = urlsplit(url).scheme or 'file'  # plain paths are local directories
+    if scheme not in TRANSPORTS:
+        raise ValueError(f'Không hỗ trợ transport: {scheme}://')
+    return TRANSPORTS[scheme](url)
+
+
+def _file_chunks(path: str, compress: bool) -> Iterator[bytes]:
+    compressor = zlib.compressobj(6) if compress else None
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield compressor.compress(chunk) if compressor else chunk
+    if compressor:
+        yield compressor.flush()
+
+
+def sync_landing(pub_root: str, transport, subdomain: str, sent_blobs: Set[str]) -> Dict[str, int]:
+    """Bring one landing on the replica in line with the primary's manifest (None = deleted)."""
+    stats = {'files': 0, 'sent': 0, 'bytes': 0, 'wire_bytes': 0, 'removed': 0}
+    manifest = load_manifest(pub_root, subdomain)
+    if manifest is None:
+        transport.remove_site(subdomain)
+        stats['removed'] = 1
+        return stats
+    replica = transport.read_manifest(subdomain) or {'files': {}, 'links': {}}
+    site = os.path.join(pub_root, subdomain)
+
+    for path, (digest, size, mtime_ns) in manifest['files'].items():
+        entry = replica['files'].get(path)
+        if entry and entry[0] == digest:
+            continue
+        name = blob_name(digest, path)
+        if name not in sent_blobs and not transport.has_blob(name):
+            # The primary's blob outlives pruned versions; files outside the store are read in place
+            source = blob_path(pub_root, name)
+            if not os.path.exists(source):
+                source = os.path.join(site, *path.split('/'))
+            wire = [0]
+
+            def counted(chunks):
+                for chunk in chunks:
+                    wire[0] += len(chunk)
+                    yield chunk
+
+            compressed = is_compressible(path)
+            transport.put_blob(name, counted(_file_chunks(source, compressed)), compressed, mtime_ns)
+            stats['sent'] += 1
+            stats['bytes'] += size
+            stats['wire_bytes'] += wire[0]
+        sent_blobs.add(name)
+        transport.link_blob(name, subdomain, path)
+        stats['files'] += 1
+
+    # Only once the new version's files are in place
+    for path, target in manifest['links'].items():
+        if replica['links'].get(path) != target:
+            transport.symlink(subdomain, path, target)
+    for path in set(replica['files']).difference(manifest['files']) | set(replica['links']).difference(manifest['links']):
+        transport.remove(subdomain, path)
+        stats['removed'] += 1
+    transport.write_manifest(subdomain, manifest)
+    return stats
+
+
+class Replicator:
+    """Incremental sync of PUBLISHED_ROOT to one target (URL of a registered transport)."""
+
+    def __init__(self, pub_root: str, target: str, workers: int = 8):
+        self.pub_root = pub_root
+        self.target = target
+        self.transport = open_transport(target)
+        self.workers = max(1, workers)
+        key = hashlib.sha1(target.encode('utf-8')).hexdigest()[:16]
+        self.state_file = os.path.join(manifests_root(pub_root), SYNC_STATE_DIR, key + '.json')
+        self._dir_mtime = None
+
+    def _load_state(self) -> Dict[str, List[int]]:
+        try:
+            with open(self.state_file, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, state: Dict[str, List[int]]):
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp = f"{self.state_file}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp, self.state_file)
+
+    def sync(self, full: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Sync the landings whose manifest changed since the last sync (all of them
+        with `full`). Returns totals, or None when nothing changed.
+        """
+        root = manifests_root(self.pub_root)
+        try:
+            dir_mtime = os.stat(root).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if not full and dir_mtime == self._dir_mtime:
+            return None
+        started = time.perf_counter()
+        state = {} if full else self._load_state()
+        now = time.time_ns()
+        current = {}
+        for entry in os.scandir(root):
+            if entry.name.endswith('.json') and not entry.name.startswith('.'):
+                st = entry.stat()
+                # Not settled yet: checked again next round
+                current[entry.name[:-5]] = [st.st_mtime_ns, st.st_size] if now - st.st_mtime_ns > MTIME_SETTLE_NS else [0, 0]
+        changed = [sub for sub, stamp in current.items() if state.get(sub) != stamp or stamp == [0, 0]]
+        changed += [sub for sub in state if sub not in current]
+
+        totals = {'landings': 0, 'failed': 0, 'files': 0, 'sent': 0, 'bytes': 0, 'wire_bytes': 0, 'removed': 0,
+                  'errors': []}
+        sent_blobs = set()
+
+        def run(subdomain):
+            try:
+                return subdomain, sync_landing(self.pub_root, self.transport, subdomain, sent_blobs), None
+            except Exception as e:
+                return subdomain, None, e
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for subdomain, stats, error in pool.map(run, changed):
+                if error is not None:
+                    totals['failed'] += 1
+                    totals['errors'].append(f'{subdomain}: {error}')
+                    state.pop(subdomain, None)  # retried next round
+                    continue
+                totals['landings'] += 1
+                for key, value in stats.items():
+                    totals[key] += value
+                if subdomain in current:
+                    state[subdomain] = current[subdomain]
+                else:
+                    state.pop(subdomain, None)
+        if changed or full:
+            self._save_state(state)
+        # Skip the next round's listing only if the dir is settled and everything went through
+        settled = now - dir_mtime > MTIME_SETTLE_NS and not totals['failed'] and [0, 0] not in current.values()
+        self._dir_mtime = dir_mtime if settled else None
+        if not changed:
+            return None
+        totals['ms'] = round((time.perf_counter() - started) * 1000, 1)
+        return totals
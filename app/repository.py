@@ -1,11 +1,14 @@
-from typing import List, Optional, Dict, Any
-from .db import get_db
+import base64
+import json
+from typing import List, Optional, Dict, Any, Tuple
+from .db import get_db, has_search_index
 
 FIELDS = [
     'id','subdomain','agent','global_site_tag',
     'phone_tracking','zalo_tracking','form_tracking',
     'hotline_phone','zalo_phone','google_form_link',
-    'status','original_filename','created_at','updated_at'
+    'status','original_filename','page_bytes_original','page_bytes',
+    'created_at','updated_at'
 ]
 
 
@@ -46,26 +49,158 @@ def get_by_subdomain(subdomain: str) -> Optional[Dict[str, Any]]:
     return row_to_dict(row) if row else None
 
 
-def list_landings(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
-    db = get_db()
+def _filter_clauses(filters: Dict[str, Any]) -> Tuple[List[str], List[Any]]:
     clauses = []
     params = []
-    if 'agent' in filters and filters['agent']:
-        clauses.append('agent LIKE ?')
-        params.append(f"%{filters['agent']}%")
+    use_index = has_search_index()
+    for key, col in (('agent', 'agent'), ('q', 'subdomain')):
+        term = filters.get(key)
+        if not term:
+            continue
+        # Trigram index needs >= 3 chars; shorter terms are cheap to LIKE-scan anyway
+        if use_index and len(term) >= 3:
+            clauses.append(f'id IN (SELECT rowid FROM landing_search WHERE {col} LIKE ?)')
+        else:
+            clauses.append(f'{col} LIKE ?')
+        params.append(f"%{term}%")
     if 'status' in filters and filters['status']:
         clauses.append('status=?')
         params.append(filters['status'])
-    if 'q' in filters and filters['q']:
-        clauses.append('subdomain LIKE ?')
-        params.append(f"%{filters['q']}%")
+    return clauses, params
+
+
+def list_landings(filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+    db = get_db()
+    clauses, params = _filter_clauses(filters)
     where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
-    sql = f"SELECT * FROM landing_pages {where} ORDER BY created_at DESC"
+    sql = f"SELECT * FROM landing_pages {where} ORDER BY created_at DESC, id DESC"
     rows = db.execute(sql, params).fetchall()
     return [row_to_dict(r) for r in rows]
 
 
+def encode_cursor(landing: Dict[str, Any]) -> str:
+    raw = json.dumps([landing['created_at'], landing['id']]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[str, int]]:
+    try:
+        created_at, landing_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return str(created_at), int(landing_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def list_landings_page(filters: Dict[str, Any], limit: int = 50,
+                       cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    One page of landings, newest first, using keyset pagination on (created_at, id).
+
+    Returns (items, next_cursor); next_cursor is None on the last page. Cost is
+    O(limit) regardless of how deep the page is.
+    """
+    db = get_db()
+    clauses, params = _filter_clauses(filters)
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend(after)
+    where = ('WHERE ' + ' AND '.join(clauses)) if clauses else ''
+    sql = f"SELECT * FROM landing_pages {where} ORDER BY created_at DESC, id DESC LIMIT ?"
+    rows = db.execute(sql, params + [limit + 1]).fetchall()
+    items = [row_to_dict(r) for r in rows[:limit]]
+    next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+    return items, next_cursor
+
+
 def delete_landing(landing_id: int):
     db = get_db()
     db.execute("DELETE FROM landing_pages WHERE id=?", (landing_id,))
     db.commit()
+
+
+def _selection_clauses(agent: str = '', status: str = '', subdomain_glob: str = '') -> Tuple[str, List[Any]]:
+    clauses = []
+    params = []
+    if agent:
+        clauses.append('agent=?')
+        params.append(agent)
+    if status:
+        clauses.append('status=?')
+        params.append(status)
+    if subdomain_glob:
+        clauses.append('subdomain GLOB ?')
+        params.append(subdomain_glob)
+    return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+
+def find_landings(agent: str = '', status: str = '', subdomain_glob: str = '') -> List[Dict[str, Any]]:
+    """Exact-match selection used by bulk operations (subdomain accepts shell-style globs)."""
+    db = get_db()
+    where, params = _selection_clauses(agent, status, subdomain_glob)
+    rows = db.execute(f"SELECT * FROM landing_pages {where} ORDER BY id", params).fetchall()
+    return [row_to_dict(r) for r in rows]
+
+
+def landings_by_subdomain(subdomains: List[str]) -> List[Dict[str, Any]]:
+    """Current rows of the given subdomains (those deleted are left out), ordered by id."""
+    db = get_db()
+    rows = []
+    for i in range(0, len(subdomains), 500):
+        chunk = subdomains[i:i + 500]
+        rows += db.execute(f"SELECT * FROM landing_pages WHERE subdomain IN ({','.join('?' * len(chunk))})",
+                           chunk).fetchall()
+    return sorted((row_to_dict(r) for r in rows), key=lambda r: r['id'])
+
+
+def landing_index() -> Dict[str, Dict[str, Any]]:
+    """{subdomain: {'id', 'status'}} of every landing in one query (consistency scan)."""
+    rows = get_db().execute("SELECT id, subdomain, status FROM landing_pages").fetchall()
+    return {r['subdomain']: {'id': r['id'], 'status': r['status']} for r in rows}
+
+
+def bulk_set_status(new_status: str, agent: str = '', subdomain_glob: str = '') -> List[Dict[str, Any]]:
+    """Set the status of every matching landing in one transaction. Returns the landings that changed."""
+    db = get_db()
+    where, params = _selection_clauses(agent, '', subdomain_glob)
+    where = (where + ' AND' if where else 'WHERE') + ' status<>?'
+    params.append(new_status)
+    with db:
+        # Take the write lock before reading so the returned rows are exactly the ones updated
+        db.execute('BEGIN IMMEDIATE')
+        rows = db.execute(f"SELECT * FROM landing_pages {where} ORDER BY id", params).fetchall()
+        db.execute(f"UPDATE landing_pages SET status=?, updated_at=CURRENT_TIMESTAMP {where}", [new_status] + params)
+    return [row_to_dict(r) for r in rows]
+
+
+def bulk_update_landings(updates: List[Dict[str, Any]]):
+    """Apply many per-landing updates ({'id': ..., col: value}) in a single transaction."""
+    if not updates:
+        return
+    db = get_db()
+    cols = [c for c in updates[0].keys() if c in FIELDS and c not in ('id', 'created_at')]
+    if not cols:
+        return
+    set_clause = ', '.join([f"{c}=?" for c in cols] + ["updated_at=CURRENT_TIMESTAMP"])
+    sql = f"UPDATE landing_pages SET {set_clause} WHERE id=?"
+    with db:
+        db.executemany(sql, [[u[c] for c in cols] + [u['id']] for u in updates])
+
+
+def upsert_landings(rows: List[Dict[str, Any]]) -> int:
+    """
+    Insert-or-update many landings by subdomain in one transaction (bulk import).
+    Existing rows keep their status and created_at, and any column given as ''
+    keeps its current value. Returns the number of rows written.
+    """
+    if not rows:
+        return 0
+    db = get_db()
+    cols = [c for c in FIELDS if c not in ('id', 'status', 'created_at', 'updated_at') and c in rows[0]]
+    updates = ', '.join([f"{c}=COALESCE(NULLIF(excluded.{c}, ''), {c})" for c in cols if c != 'subdomain']
+                        + ["updated_at=CURRENT_TIMESTAMP"])
+    sql = (f"INSERT INTO landing_pages ({','.join(cols)}) VALUES ({','.join('?' * len(cols))}) "
+           f"ON CONFLICT(subdomain) DO UPDATE SET {updates}")
+    with db:
+        db.executemany(sql, [[r.get(c) for c in cols] for r in rows])
+    return len(rows)
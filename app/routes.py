@@ -1,18 +1,43 @@
-
+import hmac
 import os
-from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app, send_from_directory
+import shutil
+import tempfile
+import time
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify, current_app
 from flask_login import login_user, logout_user, login_required, current_user
+from werkzeug.security import safe_join
 from werkzeug.utils import secure_filename
-from .utils import sanitize_subdomain, inject_tracking
+from .utils import TRACKING_FIELDS, sanitize_subdomain
+from .page_cache import get_page_cache, page_response
+from .precompress import precompress_if_compressible
+from .serving import asset_response, blob_response, get_asset_delivery, is_page_file, paused_response
+from .events import beacon_response, get_event_buffer, parse_beacon
+from .host_routing import get_routing_table
+from .publishing import (INDEX_FILENAME, PAUSED_FILENAME, list_versions, current_version, resolve_landing_dir,
+                         rollback, version_dir)
+from .blobs import blob_urls
+from .metrics import get_metrics, stage
+from .jobs import enqueue_job, get_job_queue, wake_job_runner
+from .uploads import copy_upload, file_sha256, upload_sha256, upload_size
 from . import repository
 from . import agents_repository as agents
 from .auth import User
-from .forms import LoginForm
 
 bp = Blueprint('main', __name__)
 
-TRACKING_TEMPLATE_HEAD = """<!-- Global Site Tag -->\n{global_site_tag}\n<!-- /Global Site Tag -->"""
-TRACKING_TEMPLATE_BODY = """<!-- Tracking Codes -->\n<script>window.PHONE_TRACKING={phone_tracking!r};</script>\n<script>window.ZALO_TRACKING={zalo_tracking!r};</script>\n<script>window.FORM_TRACKING={form_tracking!r};</script>\n<!-- /Tracking Codes -->"""
+MAX_IMAGES = 7
+# Form fields stored on the landing row (the page and images are files)
+LANDING_FORM_FIELDS = ('agent',) + TRACKING_FIELDS + ('hotline_phone', 'zalo_phone', 'google_form_link')
+
+
+def routing_changed(subdomain, status=None):
+    """Keep this worker's status map in step with a write (status None = removed)."""
+    table = get_routing_table()
+    if status is None:
+        table.discard(subdomain)
+    else:
+        table.upsert(subdomain, status)
+
 
 def save_uploaded_images(images, target_dir):
     """Save uploaded images with naming convention: anh1.jpg, anh2.png, etc. (max 7 images)"""
@@ -20,8 +45,8 @@ def save_uploaded_images(images, target_dir):
         return []
     
     # Limit to 7 images
-    if len(images) > 7:
-        raise ValueError('Tối đa 7 ảnh được phép upload')
+    if len(images) > MAX_IMAGES:
+        raise ValueError(f'Tối đa {MAX_IMAGES} ảnh được phép upload')
     
     saved_files = []
     for i, image in enumerate(images, 1):
@@ -36,43 +61,126 @@ def save_uploaded_images(images, target_dir):
             filepath = os.path.join(target_dir, new_filename)
             
             try:
-                image.save(filepath)
+                # Never write through a hardlink shared with an older published version
+                if os.path.exists(filepath):
+                    if os.path.getsize(filepath) == upload_size(image) and file_sha256(filepath) == upload_sha256(image):
+                        saved_files.append(new_filename)  # unchanged: keep sharing the inode
+                        continue
+                    os.remove(filepath)
+                copy_upload(image, filepath)
+                precompress_if_compressible(filepath)
                 saved_files.append(new_filename)
             except Exception as e:
                 raise Exception(f'Lỗi lưu ảnh {new_filename}: {str(e)}')
     
     return saved_files
 
+
+def stash_uploads(file=None, images=()):
+    """
+    Copy the request's page/images into a job dir under UPLOAD_FOLDER/jobs
+    (werkzeug's temp files are gone once the request returns). Returns the
+    job payload part referencing them; the dir is removed when the job is done.
+    """
+    jobs_dir = os.path.join(current_app.config['UPLOAD_FOLDER'], 'jobs')
+    os.makedirs(jobs_dir, exist_ok=True)
+    files_dir = tempfile.mkdtemp(prefix='job-', dir=jobs_dir)
+    payload = {'files_dir': files_dir, 'images': []}
+    if file is not None:
+        payload['page'] = os.path.join(files_dir, 'page.html')
+        copy_upload(file, payload['page'])
+    for i, image in enumerate(images, 1):
+        path = None
+        if image.filename:
+            path = os.path.join(files_dir, f'image{i}')
+            copy_upload(image, path)
+        payload['images'].append([path, image.filename or ''])
+    return payload
+
+
+def idempotency_key():
+    """Client-chosen Idempotency-Key header: a retried request returns the job of the first one."""
+    return request.headers.get('Idempotency-Key', '').strip()[:200] or None
+
+
+def job_accepted(job, message):
+    body = {'job_id': job['id'], 'status': job['status'], 'message': message}
+    return jsonify(body), 202, {'Location': url_for('main.api_job', job_id=job['id'])}
+
+
+def public_job(job):
+    # The payload holds upload paths and tracking codes; status, result and error are what clients need
+    return {k: v for k, v in job.items() if k not in ('payload', 'idempotency_key')}
+
+
+def _is_paused(subdomain):
+    route = get_routing_table().lookup(subdomain)
+    return route is not None and route.status == 'paused'
+
 # Serve published landing pages - Simple approach
 @bp.route('/landing/<subdomain>')
 def serve_landing_simple(subdomain):
     """Serve published landing pages via /landing/<subdomain> URL"""
+    if _is_paused(subdomain):
+        return paused_response(request.environ)
+
     pub_root = current_app.config['PUBLISHED_ROOT']
-    landing_dir = os.path.join(pub_root, subdomain)
-    index_file = os.path.join(landing_dir, 'index.html')
-    
-    # Check if landing page exists
-    if not os.path.exists(index_file):
-        return f"<h1>Landing page '{subdomain}' not found</h1><p>Please check if the landing page has been uploaded correctly.</p>", 404
+    landing_dir = resolve_landing_dir(pub_root, subdomain)
+    index_file = os.path.join(landing_dir, INDEX_FILENAME)
     
     try:
-        with open(index_file, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return content
+        entry = get_page_cache().get(subdomain, index_file)
     except Exception as e:
         return f"<h1>Error loading landing page: {str(e)}</h1>", 500
 
+    # Check if landing page exists
+    if entry is None:
+        return f"<h1>Landing page '{subdomain}' not found</h1><p>Please check if the landing page has been uploaded correctly.</p>", 404
+
+    return page_response(entry, request.environ)
+
+# Click/conversion beacon posted by the script injected into every landing
+@bp.route('/_e', methods=['POST'])
+def landing_event_beacon():
+    subdomain, event = parse_beacon(request.environ)
+    if get_routing_table().lookup(subdomain) is None:
+        subdomain = None
+    return beacon_response(get_event_buffer(), subdomain, event)
+
 # Serve static assets for landing pages
 @bp.route('/landing/<subdomain>/<path:filename>')  
 def serve_landing_assets_simple(subdomain, filename):
     """Serve static assets (images, etc.) for landing pages"""
+    # The page stays on disk while paused: /index.html must not bypass the placeholder
+    if is_page_file(filename) and _is_paused(subdomain):
+        return paused_response(request.environ)
     pub_root = current_app.config['PUBLISHED_ROOT']
-    landing_dir = os.path.join(pub_root, subdomain)
+    landing_dir = resolve_landing_dir(pub_root, subdomain)
     
-    if not os.path.exists(os.path.join(landing_dir, filename)):
+    response = asset_response(landing_dir, filename, request.environ, delivery=get_asset_delivery())
+    if response is None:
+        return "File not found", 404
+    return response
+
+# Assets of one published version: immutable, so browsers/CDNs may cache them forever
+@bp.route('/landing/<subdomain>/_v/<int:version>/<path:filename>')
+def serve_landing_versioned_asset(subdomain, version, filename):
+    if is_page_file(filename) and _is_paused(subdomain):
+        return paused_response(request.environ)
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    response = asset_response(version_dir(pub_root, subdomain, version), filename, request.environ, immutable=True,
+                              delivery=get_asset_delivery())
+    if response is None:
         return "File not found", 404
-        
-    return send_from_directory(landing_dir, filename)
+    return response
+
+# Content-addressed assets shared by all landings (see app/blobs.py)
+@bp.route('/_b/<name>')
+def serve_blob(name):
+    response = blob_response(current_app.config['PUBLISHED_ROOT'], name, request.environ, get_asset_delivery())
+    if response is None:
+        return "File not found", 404
+    return response
 
 # Company homepage (public)
 @bp.route('/')
@@ -85,6 +193,7 @@ def login():
     if current_user.is_authenticated:
         return redirect(url_for('main.admin_dashboard'))
     
+    from .forms import LoginForm  # WTForms is only needed by this view
     form = LoginForm()
     if form.validate_on_submit():
         user = User.get_by_username(form.username.data)
@@ -108,6 +217,20 @@ def logout():
     flash('Đã đăng xuất thành công', 'info')
     return redirect(url_for('main.company_home'))
 
+# Prometheus scrape endpoint: METRICS_TOKEN (Bearer or ?token=) for scrapers, or a logged-in admin
+@bp.route('/metrics')
+def metrics_endpoint():
+    metrics = get_metrics()
+    if metrics is None:
+        return "Not found", 404
+    token = current_app.config['METRICS_TOKEN']
+    auth = request.headers.get('Authorization', '')
+    supplied = auth[7:] if auth.startswith('Bearer ') else request.args.get('token', '')
+    if not (token and hmac.compare_digest(supplied.encode(), token.encode())) and not current_user.is_authenticated:
+        return "Unauthorized", 401, {'WWW-Authenticate': 'Bearer'}
+    return metrics.render(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8',
+                                   'Cache-Control': 'no-store'}
+
 # Admin dashboard (protected with secret URL)
 @bp.route('/admin-panel-xyz123/')
 @login_required
@@ -117,9 +240,20 @@ def admin_dashboard():
         'status': request.args.get('status','').strip(),
         'q': request.args.get('q','').strip(),
     }
-    landings = repository.list_landings(filters)
+    cursor = request.args.get('cursor') or None
+    landings, next_cursor = repository.list_landings_page(
+        filters, limit=current_app.config['DASHBOARD_PAGE_SIZE'], cursor=cursor
+    )
     agents_list = agents.list_agents()
-    return render_template('index.html', landings=landings, filters=filters, agents_list=agents_list)
+    # Last 7 days of beacon events for the landings on this page, straight from the rollups
+    from . import analytics
+    from .db import get_db
+    now = int(time.time())
+    stats = analytics.landing_totals(get_db(), now - 7 * 86400, now,
+                                     analytics.finest_available(now - 7 * 86400, current_app.config, now),
+                                     subdomains=[l['subdomain'] for l in landings])
+    return render_template('index.html', landings=landings, filters=filters, agents_list=agents_list,
+                           cursor=cursor, next_cursor=next_cursor, stats=stats)
 
 # Admin agents page  
 @bp.route('/admin-panel-xyz123/agents')
@@ -144,80 +278,90 @@ def api_list():
         'status': request.args.get('status','').strip(),
         'q': request.args.get('q','').strip(),
     }
-    return jsonify(repository.list_landings(filters))
+    try:
+        limit = min(int(request.args.get('limit', current_app.config['API_PAGE_SIZE'])), 500)
+    except ValueError:
+        return jsonify({'error': 'limit không hợp lệ'}), 400
+    items, next_cursor = repository.list_landings_page(filters, limit=max(limit, 1), cursor=request.args.get('cursor'))
+    response = jsonify(items)
+    if next_cursor:
+        # Body stays a plain list; the next page is advertised GitHub-style
+        response.headers['X-Next-Cursor'] = next_cursor
+        next_url = url_for('main.api_list', **{k: v for k, v in filters.items() if v}, limit=limit, cursor=next_cursor)
+        response.headers['Link'] = f'<{next_url}>; rel="next"'
+    return response
+
+@bp.route('/api/landingpages/stats', methods=['GET'])
+@login_required
+def api_stats():
+    """
+    Event totals over [from, to) from the rollup tables (default: last 7 days).
+    ?group=landing|agent, ?agent=, ?subdomain=, ?interval=minute|hour|day adds a series.
+    """
+    from . import analytics
+    from .db import get_db
+
+    now = int(time.time())
+    try:
+        start = analytics.parse_time(request.args.get('from'), now - 7 * 86400)
+        end = analytics.parse_time(request.args.get('to'), now)
+    except ValueError:
+        return jsonify({'error': 'Thời gian không hợp lệ (dùng unix time hoặc ISO 8601)'}), 400
+    group = request.args.get('group', 'landing')
+    interval = request.args.get('interval', '')
+    if end <= start or group not in ('landing', 'agent') or (interval and interval not in analytics.BUCKET_SECONDS):
+        return jsonify({'error': 'Tham số không hợp lệ'}), 400
+
+    db = get_db()
+    finest = analytics.finest_available(start, current_app.config, now)
+    subdomain = request.args.get('subdomain', '').strip()
+    agent = request.args.get('agent', '').strip()
+    if group == 'agent':
+        items = analytics.agent_totals(db, start, end, finest)
+        if agent:
+            items = [i for i in items if i['agent'] == agent]
+    else:
+        totals = analytics.landing_totals(db, start, end, finest, subdomains=[subdomain] if subdomain else None,
+                                          agent=agent)
+        items = sorted(({'subdomain': s, **counts} for s, counts in totals.items()),
+                       key=lambda i: -sum(i[e] for e in analytics.EVENT_TYPES))
+    result = {
+        'from': start,
+        'to': end,
+        'group': group,
+        'totals': {e: sum(i[e] for i in items) for e in analytics.EVENT_TYPES},
+        'items': items,
+    }
+    if interval:
+        result['series'] = analytics.series(db, start, end, interval, subdomain)
+    return jsonify(result)
 
 @bp.route('/api/landingpages', methods=['POST'])
 @login_required
 def api_create():
+    """Validate and save the uploads, then publish in the background: 202 + job (see /api/jobs/<id>)."""
     subdomain = sanitize_subdomain(request.form.get('subdomain',''))
     if not subdomain:
         return jsonify({'error':'Subdomain không hợp lệ'}), 400
     if repository.get_by_subdomain(subdomain):
         return jsonify({'error':'Subdomain đã tồn tại'}), 400
 
-    agent = request.form.get('agent','').strip()
-    global_site_tag = request.form.get('global_site_tag','').strip()
-    phone_tracking = request.form.get('phone_tracking','').strip()
-    zalo_tracking = request.form.get('zalo_tracking','').strip()
-    form_tracking = request.form.get('form_tracking','').strip()
-    hotline_phone = request.form.get('hotline_phone','').strip()
-    zalo_phone = request.form.get('zalo_phone','').strip()
-    google_form_link = request.form.get('google_form_link','').strip()
-
     file = request.files.get('file')
     if not file or file.filename == '':
         return jsonify({'error':'Chưa chọn file index.html'}), 400
-    filename = secure_filename(file.filename)
-    html_content = file.read().decode('utf-8', errors='ignore')
-
-    # Process uploaded images
     images = request.files.getlist('images')
-    
-    head_snippet = TRACKING_TEMPLATE_HEAD.format(global_site_tag=global_site_tag)
-    body_snippet = TRACKING_TEMPLATE_BODY.format(
-        phone_tracking=phone_tracking,
-        zalo_tracking=zalo_tracking,
-        form_tracking=form_tracking,
-    )
-    final_html = inject_tracking(html_content, head_snippet, body_snippet)
+    if len(images) > MAX_IMAGES:
+        return jsonify({'error': f'Tối đa {MAX_IMAGES} ảnh được phép upload'}), 400
 
-    pub_root = current_app.config['PUBLISHED_ROOT']
-    target_dir = os.path.join(pub_root, subdomain)
-    os.makedirs(target_dir, exist_ok=True)
-    
-    # Save HTML file
-    target_file = os.path.join(target_dir, 'index.html')
-    with open(target_file, 'w', encoding='utf-8') as f:
-        f.write(final_html)
-    
-    # Save uploaded images
-    try:
-        saved_images = save_uploaded_images(images, target_dir)
-    except ValueError as e:
-        return jsonify({'error': str(e)}), 400
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-    landing_id = repository.create_landing({
+    with stage('spool'):
+        payload = stash_uploads(file, images)
+    payload.update({
         'subdomain': subdomain,
-        'agent': agent,
-        'global_site_tag': global_site_tag,
-        'phone_tracking': phone_tracking,
-        'zalo_tracking': zalo_tracking,
-        'form_tracking': form_tracking,
-        'hotline_phone': hotline_phone,
-        'zalo_phone': zalo_phone,
-        'google_form_link': google_form_link,
-        'status': 'active',
-        'original_filename': filename
-    })
-
-    return jsonify({
-        'id': landing_id, 
-        'message': f'Tạo thành công! Đã upload {len(saved_images)} ảnh: {", ".join(saved_images)}' if saved_images else 'Tạo thành công!',
-        'images_uploaded': len(saved_images),
-        'image_files': saved_images
+        'fields': {k: request.form.get(k, '').strip() for k in LANDING_FORM_FIELDS},
+        'filename': secure_filename(file.filename),
     })
+    job, _ = enqueue_job('create_landing', payload, idempotency_key(), lock_key=subdomain)
+    return job_accepted(job, 'Đang tạo landing page...')
 
 @bp.route('/api/landingpages/<int:landing_id>', methods=['PUT'])
 @login_required
@@ -225,73 +369,35 @@ def api_update(landing_id):
     landing = repository.get_landing(landing_id)
     if not landing:
         return jsonify({'error':'Không tồn tại'}), 404
-
-    agent = request.form.get('agent', landing['agent']).strip()
-    global_site_tag = request.form.get('global_site_tag', landing['global_site_tag'] or '').strip()
-    phone_tracking = request.form.get('phone_tracking', landing['phone_tracking'] or '').strip()
-    zalo_tracking = request.form.get('zalo_tracking', landing['zalo_tracking'] or '').strip()
-    form_tracking = request.form.get('form_tracking', landing['form_tracking'] or '').strip()
-    hotline_phone = request.form.get('hotline_phone', landing.get('hotline_phone') or '').strip()
-    zalo_phone = request.form.get('zalo_phone', landing.get('zalo_phone') or '').strip()
-    google_form_link = request.form.get('google_form_link', landing.get('google_form_link') or '').strip()
+    images = request.files.getlist('images')
+    if len(images) > MAX_IMAGES:
+        return jsonify({'error': f'Tối đa {MAX_IMAGES} ảnh được phép upload'}), 400
 
     file = request.files.get('file')
-    if file and file.filename:
-        filename = secure_filename(file.filename)
-        html_content = file.read().decode('utf-8', errors='ignore')
-    else:
-        # Re-read current file from disk
-        pub_root = current_app.config['PUBLISHED_ROOT']
-        target_dir = os.path.join(pub_root, landing['subdomain'])
-        with open(os.path.join(target_dir,'index.html'), 'r', encoding='utf-8') as f:
-            html_content = f.read()
-        filename = landing['original_filename']
-
-    # Process uploaded images if any
-    pub_root = current_app.config['PUBLISHED_ROOT']
-    target_dir = os.path.join(pub_root, landing['subdomain'])
-    
-    images = request.files.getlist('images')
-    saved_images = []
-    if images and any(img.filename for img in images):
-        try:
-            saved_images = save_uploaded_images(images, target_dir)
-        except ValueError as e:
-            return jsonify({'error': str(e)}), 400
-        except Exception as e:
-            return jsonify({'error': str(e)}), 500
-
-    head_snippet = TRACKING_TEMPLATE_HEAD.format(global_site_tag=global_site_tag)
-    body_snippet = TRACKING_TEMPLATE_BODY.format(
-        phone_tracking=phone_tracking,
-        zalo_tracking=zalo_tracking,
-        form_tracking=form_tracking,
-    )
-    final_html = inject_tracking(html_content, head_snippet, body_snippet)
-
-    os.makedirs(target_dir, exist_ok=True)
-    target_file = os.path.join(target_dir, 'index.html')
-    with open(target_file, 'w', encoding='utf-8') as f:
-        f.write(final_html)
-
-    repository.update_landing(landing_id, {
-        'agent': agent,
-        'global_site_tag': global_site_tag,
-        'phone_tracking': phone_tracking,
-        'zalo_tracking': zalo_tracking,
-        'form_tracking': form_tracking,
-        'hotline_phone': hotline_phone,
-        'zalo_phone': zalo_phone,
-        'google_form_link': google_form_link,
-        'original_filename': filename
+    if not (file and file.filename):
+        file = None  # the job re-injects the current page
+    with stage('spool'):
+        payload = stash_uploads(file, images)
+    payload.update({
+        'id': landing_id,
+        # Only what the client sent: the job fills in the rest from the row as it is when it runs
+        'fields': {k: request.form[k].strip() for k in LANDING_FORM_FIELDS if k in request.form},
+        'filename': secure_filename(file.filename) if file else None,
     })
+    job, _ = enqueue_job('update_landing', payload, idempotency_key(), lock_key=landing['subdomain'])
+    return job_accepted(job, 'Đang cập nhật landing page...')
 
-    result = {'message':'Cập nhật thành công'}
-    if saved_images:
-        result['images_uploaded'] = len(saved_images)
-        result['image_files'] = saved_images
-    
-    return jsonify(result)
+@bp.route('/api/landingpages/bulk-reinject', methods=['POST'])
+@login_required
+def api_bulk_reinject():
+    """Re-inject new tracking codes into every landing matching {agent, status, subdomain glob} (background job)."""
+    payload = request.get_json(silent=True) or {}
+    filters = {k: str(v).strip() for k, v in (payload.get('filter') or {}).items() if k in ('agent', 'status', 'subdomain')}
+    new_values = {k: str(v).strip() for k, v in (payload.get('tracking') or {}).items() if k in TRACKING_FIELDS}
+    if not new_values:
+        return jsonify({'error': 'Chưa nhập mã tracking mới'}), 400
+    job, _ = enqueue_job('reinject', {'filters': filters, 'tracking': new_values}, idempotency_key())
+    return job_accepted(job, 'Đang cập nhật mã tracking...')
 
 @bp.route('/api/landingpages/<int:landing_id>/status', methods=['PATCH'])
 @login_required
@@ -303,25 +409,68 @@ def api_change_status(landing_id):
     if new_status not in ('active','paused'):
         return jsonify({'error':'Trạng thái không hợp lệ'}), 400
 
-    pub_root = current_app.config['PUBLISHED_ROOT']
-    target_dir = os.path.join(pub_root, landing['subdomain'])
-    index_file = os.path.join(target_dir, 'index.html')
-    paused_file = os.path.join(target_dir, 'index.paused.html')
-
-    if new_status == 'paused' and landing['status'] != 'paused':
-        if os.path.exists(index_file):
-            os.replace(index_file, paused_file)
-            with open(index_file, 'w', encoding='utf-8') as f:
-                f.write('<html><head><meta charset="utf-8"><title>Tạm dừng</title></head><body><h3>Landing page đang tạm dừng.</h3></body></html>')
-    elif new_status == 'active' and landing['status'] == 'paused':
-        if os.path.exists(paused_file):
-            if os.path.exists(index_file):
-                os.remove(index_file)
-            os.replace(paused_file, index_file)
-
+    # Pause is enforced at serve time from the status map; the page itself is not touched
     repository.update_landing(landing_id, {'status': new_status})
+    routing_changed(landing['subdomain'], new_status)
+    landing_dir = resolve_landing_dir(current_app.config['PUBLISHED_ROOT'], landing['subdomain'])
+    if new_status == 'active' and os.path.exists(os.path.join(landing_dir, PAUSED_FILENAME)):
+        # Landings paused by the old file shuffle get their page back in a background publish
+        job, _ = enqueue_job('restore_paused', {'subdomain': landing['subdomain']}, lock_key=landing['subdomain'])
+        return job_accepted(job, 'Đổi trạng thái thành công')
     return jsonify({'message':'Đổi trạng thái thành công'})
 
+@bp.route('/api/landingpages/import', methods=['POST'])
+@login_required
+def api_import_zip():
+    """
+    Bulk import a ZIP of site folders (background job). Send the archive as
+    the raw body (Content-Type: application/zip, up to IMPORT_MAX_BYTES,
+    streamed to disk) or as multipart field 'archive' (subject to MAX_CONTENT_LENGTH).
+    """
+    from .importer import save_stream
+
+    config = current_app.config
+    if request.mimetype in ('application/zip', 'application/octet-stream'):
+        length = request.content_length
+        if length is not None and length > config['IMPORT_MAX_BYTES']:
+            return jsonify({'error': 'File ZIP quá lớn'}), 413
+        payload = stash_uploads()
+        # Read wsgi.input directly: the request body limit is MAX_CONTENT_LENGTH, far below an export archive
+        try:
+            payload['archive'] = save_stream(request.environ['wsgi.input'], payload['files_dir'],
+                                             config['IMPORT_MAX_BYTES'], length=length)
+        except ValueError as e:
+            shutil.rmtree(payload['files_dir'], ignore_errors=True)
+            return jsonify({'error': str(e)}), 413
+    else:
+        upload = request.files.get('archive')
+        if not upload or not upload.filename:
+            return jsonify({'error': 'Chưa chọn file ZIP'}), 400
+        payload = stash_uploads()
+        payload['archive'] = save_stream(upload.stream, payload['files_dir'], config['IMPORT_MAX_BYTES'])
+
+    values = request.args if request.mimetype != 'multipart/form-data' else request.form
+    payload['defaults'] = {k: values.get(k, '').strip() for k in ('agent',) + TRACKING_FIELDS}
+    job, _ = enqueue_job('import_zip', payload, idempotency_key())
+    return job_accepted(job, 'Đang nhập file ZIP...')
+
+@bp.route('/api/landingpages/bulk-status', methods=['POST'])
+@login_required
+def api_bulk_status():
+    """Pause/resume every landing of an agent (and/or subdomain glob) in one transaction."""
+    from .bulk import run_set_status
+
+    payload = request.get_json(silent=True) or {}
+    new_status = payload.get('status')
+    if new_status not in ('active', 'paused'):
+        return jsonify({'error':'Trạng thái không hợp lệ'}), 400
+    filters = {k: str(v).strip() for k, v in (payload.get('filter') or {}).items() if k in ('agent', 'subdomain')}
+    if not any(filters.values()):
+        return jsonify({'error': 'Cần chọn đại lý hoặc subdomain'}), 400
+    summary = run_set_status(filters, new_status)
+    summary['message'] = f"Đã đổi trạng thái {summary['changed']} landing page"
+    return jsonify(summary)
+
 @bp.route('/api/landingpages/<int:landing_id>', methods=['DELETE'])
 @login_required
 def api_delete(landing_id):
@@ -329,7 +478,104 @@ def api_delete(landing_id):
     if not landing:
         return jsonify({'error':'Không tồn tại'}), 404
     repository.delete_landing(landing_id)
-    return jsonify({'message':'Đã xóa'})
+    routing_changed(landing['subdomain'])
+    # The published tree is removed in the background (after any publish of it still queued)
+    job, _ = enqueue_job('cleanup_landing', {'subdomain': landing['subdomain']}, lock_key=landing['subdomain'])
+    return jsonify({'message':'Đã xóa', 'cleanup_job_id': job['id']})
+
+@bp.route('/api/consistency', methods=['GET'])
+@login_required
+def api_consistency():
+    """Drift between landing_pages and the published tree (?verify=1 re-hashes every file, ?top=N usage rows)."""
+    from .consistency import run_scan
+
+    try:
+        top = max(0, min(int(request.args.get('top', 50)), 10000))
+    except ValueError:
+        return jsonify({'error': 'top không hợp lệ'}), 400
+    report = run_scan(verify=request.args.get('verify', '').lower() in ('1', 'true'),
+                      workers=current_app.config['BULK_WORKERS'])
+    report['usage'] = report['usage'][:top]
+    return jsonify(report)
+
+@bp.route('/api/consistency/reclaim', methods=['POST'])
+@login_required
+def api_consistency_reclaim():
+    """Remove orphan dirs, restore stale paused pages and collect blobs (background job)."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        grace = max(0, int(payload.get('grace', 3600)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'grace không hợp lệ'}), 400
+    job, _ = enqueue_job('reclaim_space', {'grace': grace}, idempotency_key())
+    return job_accepted(job, 'Đang dọn dữ liệu thừa...')
+
+@bp.route('/api/jobs', methods=['GET'])
+@login_required
+def api_jobs():
+    """Recent background jobs (?status=queued|running|done|failed, ?kind=) and queue depth."""
+    queue = get_job_queue()
+    try:
+        limit = max(1, min(int(request.args.get('limit', 50)), 500))
+    except ValueError:
+        return jsonify({'error': 'limit không hợp lệ'}), 400
+    jobs = queue.list(request.args.get('status', ''), request.args.get('kind', ''), limit)
+    return jsonify({'jobs': [public_job(job) for job in jobs], 'stats': queue.stats()})
+
+@bp.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+def api_job(job_id):
+    job = get_job_queue().get(job_id)
+    if not job:
+        return jsonify({'error':'Không tồn tại'}), 404
+    return jsonify(public_job(job))
+
+@bp.route('/api/jobs/<int:job_id>/retry', methods=['POST'])
+@login_required
+def api_job_retry(job_id):
+    queue = get_job_queue()
+    if not queue.retry(job_id):
+        return jsonify({'error': 'Chỉ chạy lại được job đã thất bại'}), 400
+    wake_job_runner()
+    return job_accepted(queue.get(job_id), 'Đã xếp hàng chạy lại')
+
+@bp.route('/api/landingpages/<int:landing_id>/versions', methods=['GET'])
+@login_required
+def api_versions(landing_id):
+    landing = repository.get_landing(landing_id)
+    if not landing:
+        return jsonify({'error':'Không tồn tại'}), 404
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    return jsonify({
+        'current': current_version(pub_root, landing['subdomain']),
+        'versions': list_versions(pub_root, landing['subdomain']),
+    })
+
+@bp.route('/api/landingpages/<int:landing_id>/assets', methods=['GET'])
+@login_required
+def api_assets(landing_id):
+    """Immutable /_b/ URLs of the current files, for linking assets shared between landings."""
+    landing = repository.get_landing(landing_id)
+    if not landing:
+        return jsonify({'error':'Không tồn tại'}), 404
+    pub_root = current_app.config['PUBLISHED_ROOT']
+    return jsonify({'assets': blob_urls(pub_root, resolve_landing_dir(pub_root, landing['subdomain']))})
+
+@bp.route('/api/landingpages/<int:landing_id>/rollback', methods=['POST'])
+@login_required
+def api_rollback(landing_id):
+    landing = repository.get_landing(landing_id)
+    if not landing:
+        return jsonify({'error':'Không tồn tại'}), 404
+    payload = request.get_json(silent=True) or {}
+    version = payload.get('version', request.form.get('version'))
+    try:
+        version = rollback(current_app.config['PUBLISHED_ROOT'], landing['subdomain'],
+                           int(version) if version not in (None, '') else None)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    get_page_cache().invalidate(landing['subdomain'])
+    return jsonify({'message': f'Đã khôi phục phiên bản {version}', 'version': version})
 
 # Basic HTML pages (reuse API via JS later if needed)
 @bp.route('/admin-panel-xyz123/create', methods=['GET'])
@@ -349,15 +595,21 @@ def edit_page(landing_id):
 # Serve published (dev helper only – in production Nginx will serve)
 @bp.route('/_dev_published/<path:sub>/<path:filename>')
 def dev_published(sub, filename):
-    root = current_app.config['PUBLISHED_ROOT']
-    return send_from_directory(os.path.join(root, sub), filename)
+    site = safe_join(current_app.config['PUBLISHED_ROOT'], sub)
+    response = asset_response(site, filename, request.environ, delivery=get_asset_delivery()) if site else None
+    if response is None:
+        return "File not found", 404
+    return response
 
 # Serve assets for subdomains  
 @bp.route('/_dev_published/<path:sub>/assets/<path:filename>')
 def dev_published_assets(sub, filename):
-    root = current_app.config['PUBLISHED_ROOT']
-    assets_dir = os.path.join(root, sub, 'assets')
-    return send_from_directory(assets_dir, filename)
+    site = safe_join(current_app.config['PUBLISHED_ROOT'], sub)
+    response = asset_response(os.path.join(site, 'assets'), filename, request.environ,
+                              delivery=get_asset_delivery()) if site else None
+    if response is None:
+        return "File not found", 404
+    return response
 
 # ---------------- Agents UI & API -----------------
 @bp.route('/api/agents', methods=['GET'])
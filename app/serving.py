@@ -0,0 +1,179 @@
+import hashlib
+import mimetypes
+import os
+import posixpath
+import zlib
+from typing import Optional
+from urllib.parse import quote
+
+from werkzeug.exceptions import RequestedRangeNotSatisfiable
+from werkzeug.security import safe_join
+from werkzeug.wrappers import Response
+
+from .blobs import BLOB_NAME_RE, blob_path
+from .precompress import ENCODING_SUFFIXES, is_compressible, negotiate
+from .publishing import INDEX_FILENAME, PAUSED_FILENAME
+
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+PAUSED_HTML = ('<html><head><meta charset="utf-8"><title>Tạm dừng</title></head>'
+               '<body><h3>Landing page đang tạm dừng.</h3></body></html>').encode('utf-8')
+PAUSED_ETAG = 'paused-' + hashlib.sha1(PAUSED_HTML).hexdigest()
+# A landing's pages and their .gz/.br siblings, in any dir: answered with the placeholder while it is
+# paused, whichever route (/, /index.html, /_v/<n>/..., host dispatch) asks for them
+PAGE_FILENAMES = frozenset(name + suffix for name in (INDEX_FILENAME, PAUSED_FILENAME)
+                           for suffix in ('',) + tuple(s for _, s in ENCODING_SUFFIXES))
+
+
+DELIVERY_MODES = ('sendfile', 'x-accel-redirect', 'x-sendfile')
+FILE_BLOCK_SIZE = 256 * 1024
+
+
+class AssetDelivery:
+    """
+    How asset bytes leave the worker once the file has been looked up.
+
+    'sendfile' answers conditional and Range/If-Range requests here and hands
+    the open file (positioned at the range start) to the server's
+    wsgi.file_wrapper, which gunicorn/uWSGI turn into sendfile(2). The
+    'x-accel-redirect' (Nginx) and 'x-sendfile' (Apache/lighttpd) modes only
+    return a header naming the file; the front server then does conditional,
+    ranges and .gz/.br siblings (gzip_static) itself.
+    """
+
+    def __init__(self, mode: str = 'sendfile', pub_root: Optional[str] = None, accel_prefix: str = '/_published/'):
+        if mode not in DELIVERY_MODES:
+            raise ValueError(f"ASSET_DELIVERY must be one of {', '.join(DELIVERY_MODES)}")
+        self.mode = mode
+        self.pub_root = os.path.abspath(pub_root) if pub_root else None
+        self.accel_prefix = accel_prefix.rstrip('/') + '/'
+
+    def offload_header(self, path: str) -> Optional[tuple]:
+        """(header, value) handing `path` to the front server, or None to send it from here."""
+        if self.mode == 'x-sendfile':
+            return 'X-Sendfile', os.path.abspath(path)
+        if self.mode == 'x-accel-redirect' and self.pub_root:
+            relative = os.path.relpath(os.path.abspath(path), self.pub_root)
+            if not relative.startswith('..'):
+                return 'X-Accel-Redirect', self.accel_prefix + quote(relative.replace(os.sep, '/'))
+        return None
+
+
+DEFAULT_DELIVERY = AssetDelivery()
+
+
+class FileRange:
+    """Body for servers without wsgi.file_wrapper (dev server, test client): `length` bytes from the current offset."""
+
+    def __init__(self, file, length: int, block_size: int = FILE_BLOCK_SIZE):
+        self.file = file
+        self.remaining = length
+        self.block_size = block_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        if self.remaining <= 0:
+            raise StopIteration
+        chunk = self.file.read(min(self.block_size, self.remaining))
+        if not chunk:
+            raise StopIteration
+        self.remaining -= len(chunk)
+        return chunk
+
+    def close(self):
+        self.file.close()
+
+
+def file_response(path: str, environ, mimetype: str) -> Response:
+    """
+    Conditional/Range response for a file without reading it in Python.
+
+    Same ETag/Last-Modified as werkzeug's send_file (caches stay valid), but a
+    206 keeps the real file as the body: it is seeked to the range start and
+    the server sends Content-Length bytes from there, as PEP 3333 specifies
+    for wsgi.file_wrapper, instead of werkzeug copying the range through a
+    Python iterator.
+    """
+    st = os.stat(path)
+    response = Response(mimetype=mimetype, direct_passthrough=True)
+    response.content_length = st.st_size
+    response.accept_ranges = 'bytes'  # video/hero assets: players seek with Range requests
+    response.last_modified = st.st_mtime
+    response.cache_control.no_cache = True
+    response.set_etag(f"{st.st_mtime}-{st.st_size}-{zlib.adler32(path.encode()) & 0xFFFFFFFF}")
+    try:
+        response.make_conditional(environ, accept_ranges=True, complete_length=st.st_size)
+    except RequestedRangeNotSatisfiable:
+        return Response(status=416, headers={'Content-Range': f'bytes */{st.st_size}', 'Accept-Ranges': 'bytes'})
+    if response.status_code not in (200, 206) or environ.get('REQUEST_METHOD') == 'HEAD':
+        response.response = []
+        return response
+
+    start = response.content_range.start if response.status_code == 206 else 0
+    length = response.content_length
+    f = open(path, 'rb')
+    if start:
+        f.seek(start)
+    wrapper = environ.get('wsgi.file_wrapper')
+    response.response = wrapper(f, FILE_BLOCK_SIZE) if wrapper is not None else FileRange(f, length)
+    return response
+
+
+def asset_response(landing_dir: str, filename: str, environ, immutable: bool = False,
+                   delivery: Optional[AssetDelivery] = None) -> Optional[Response]:
+    """
+    Response for a published asset, or None if it does not exist.
+
+    Framework-neutral (plain WSGI environ) so the blueprint routes and the host
+    dispatcher share it. Prefers a .br/.gz sibling produced at publish time.
+    `immutable` is for files under a version dir (/_v/<n>/...), whose content
+    never changes once published. Python only does the lookup: the bytes go
+    out through `delivery` (sendfile by default).
+    """
+    path = safe_join(landing_dir, filename)
+    if path is None or not os.path.isfile(path):
+        return None
+
+    mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+    offload = (delivery or DEFAULT_DELIVERY).offload_header(path)
+    if offload is not None:
+        # The front server negotiates .gz/.br siblings and answers Range/conditional requests
+        response = Response(mimetype=mimetype, headers=[offload])
+    else:
+        send_path, encoding = negotiate(path, environ.get('HTTP_ACCEPT_ENCODING'))
+        response = file_response(send_path, environ, mimetype)
+        if encoding is not None:
+            response.headers['Content-Encoding'] = encoding
+        if is_compressible(filename):
+            response.vary.add('Accept-Encoding')
+    if immutable:
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+
+def blob_response(pub_root: str, name: str, environ, delivery: Optional[AssetDelivery] = None) -> Optional[Response]:
+    """A blob of the content-addressed store (/_b/<sha256><ext>): the URL names the bytes, so it is immutable."""
+    if not BLOB_NAME_RE.match(name):
+        return None
+    path = blob_path(pub_root, name)
+    return asset_response(os.path.dirname(path), name, environ, immutable=True, delivery=delivery)
+
+
+def is_page_file(filename: str) -> bool:
+    return posixpath.basename(filename) in PAGE_FILENAMES
+
+
+def paused_response(environ) -> Response:
+    """Placeholder served instead of a paused landing; the real page stays untouched on disk."""
+    response = Response(PAUSED_HTML, mimetype='text/html')
+    response.set_etag(PAUSED_ETAG)
+    # Must not outlive a resume in any cache
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(environ)
+
+
+def get_asset_delivery() -> AssetDelivery:
+    from flask import current_app
+    return current_app.extensions.get('asset_delivery', DEFAULT_DELIVERY)
@@ -0,0 +1,169 @@
+import os
+import zipfile
+from typing import Any, Dict, List, Optional
+
+from flask import current_app
+from werkzeug.datastructures import FileStorage
+
+from . import repository
+from .images import schedule_optimization
+from .jobs import PermanentJobError, get_job_queue
+from .optimizer import optimize_landing, page_weight_fields
+from .page_cache import get_page_cache
+from .publishing import INDEX_FILENAME, publish, remove_site, restore_paused_page, source_page, write_index
+from .routes import LANDING_FORM_FIELDS, routing_changed, save_uploaded_images
+from .uploads import spool_text
+from .utils import TRACKING_FIELDS, iter_inject_tracking, render_tracking_snippets
+
+# Job handlers run by app/jobs.JobRunner inside an app context: handler(payload, job) -> JSON-able result.
+# Raise PermanentJobError for failures a retry cannot fix; any other exception is retried with backoff.
+
+
+def _uploaded_images(payload: Dict[str, Any]) -> List[FileStorage]:
+    """The request's images as saved by routes.stash_uploads (empty form slots keep their numbering)."""
+    return [FileStorage(open(path, 'rb') if path else None, filename=name) for path, name in payload.get('images', [])]
+
+
+def _publish_page(subdomain: str, source_path: Optional[str], fields: Dict[str, str], images: List[FileStorage],
+                  filename: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Inject tracking into the page at `source_path` and publish it with `images` as a new version.
+    Without `source_path` the current page is re-injected, read inside publish()'s lock so a
+    version published meanwhile (bulk re-inject, image rewrite) is built on rather than lost.
+    The page is written as `filename`, by default the file it replaces (see source_page).
+    """
+    config = current_app.config
+    pub_root = config['PUBLISHED_ROOT']
+    head_snippet, body_snippet = render_tracking_snippets(*(fields[k] for k in TRACKING_FIELDS))
+    saved_images, optimization = [], {}
+
+    def spool(path):
+        with open(path, 'rb') as source:
+            return spool_text(source, config['UPLOAD_FOLDER'])
+
+    def populate(staging):
+        page = source_page(staging)
+        name = filename or os.path.basename(page)
+        # The page goes source -> spool file -> injected page without being held in memory
+        with (doc if doc is not None else spool(page)) as text:
+            write_index(staging, iter_inject_tracking(text, head_snippet, body_snippet, tokens=text.tokens), name)
+        if any(image.filename for image in images):
+            saved_images.extend(save_uploaded_images(images, staging))
+        if config['HTML_OPTIMIZE']:
+            optimization.update(optimize_landing(pub_root, staging, name))
+
+    doc = None
+    try:
+        # A new upload is spooled before taking the lock
+        doc = spool(source_path) if source_path else None
+        version = publish(pub_root, subdomain, populate=populate, keep=config['PUBLISH_KEEP_VERSIONS'])
+    except FileNotFoundError as e:
+        raise PermanentJobError(f'Không tìm thấy file: {e.filename}')
+    except ValueError as e:
+        raise PermanentJobError(str(e))
+    finally:
+        if doc is not None:
+            doc.close()
+        for image in images:
+            image.close()
+    get_page_cache().invalidate(subdomain)
+    # Resize/re-encode in the process pool; the job does not wait for it
+    schedule_optimization(config, subdomain, version, saved_images)
+    return {'version': version, 'saved_images': saved_images, 'optimization': optimization}
+
+
+def create_landing(payload: Dict[str, Any], job: Dict[str, Any]) -> Dict[str, Any]:
+    subdomain = payload['subdomain']
+    if repository.get_by_subdomain(subdomain):
+        raise PermanentJobError('Subdomain đã tồn tại')
+    published = _publish_page(subdomain, payload['page'], payload['fields'], _uploaded_images(payload), INDEX_FILENAME)
+    landing_id = repository.create_landing({
+        'subdomain': subdomain,
+        **payload['fields'],
+        'status': 'active',
+        'original_filename': payload['filename'],
+        **page_weight_fields(published['optimization'])
+    })
+    routing_changed(subdomain, 'active')
+    saved_images = published['saved_images']
+    result = {
+        'id': landing_id,
+        'version': published['version'],
+        'message': f'Tạo thành công! Đã upload {len(saved_images)} ảnh: {", ".join(saved_images)}' if saved_images else 'Tạo thành công!',
+        'images_uploaded': len(saved_images),
+        'image_files': saved_images
+    }
+    if published['optimization']:
+        result['optimization'] = published['optimization']
+    return result
+
+
+def update_landing(payload: Dict[str, Any], job: Dict[str, Any]) -> Dict[str, Any]:
+    landing = repository.get_landing(payload['id'])
+    if not landing:
+        raise PermanentJobError('Không tồn tại')
+    # Without a new upload the current page is re-injected; landings paused by the old file
+    # shuffle keep the real page in index.paused.html
+    fields = {k: payload['fields'][k] if k in payload['fields'] else (landing.get(k) or '') for k in LANDING_FORM_FIELDS}
+    published = _publish_page(landing['subdomain'], payload.get('page'), fields, _uploaded_images(payload))
+    repository.update_landing(landing['id'], {
+        **payload['fields'],
+        'original_filename': payload.get('filename') or landing['original_filename'],
+        **page_weight_fields(published['optimization'])
+    })
+    result = {'id': landing['id'], 'message': 'Cập nhật thành công', 'version': published['version']}
+    if published['saved_images']:
+        result['images_uploaded'] = len(published['saved_images'])
+        result['image_files'] = published['saved_images']
+    if published['optimization']:
+        result['optimization'] = published['optimization']
+    return result
+
+
+def restore_paused(payload: Dict[str, Any], job: Dict[str, Any]) -> Dict[str, Any]:
+    version = restore_paused_page(current_app.config['PUBLISHED_ROOT'], payload['subdomain'],
+                                  current_app.config['PUBLISH_KEEP_VERSIONS'])
+    get_page_cache().invalidate(payload['subdomain'])
+    return {'version': version}
+
+
+def reinject(payload: Dict[str, Any], job: Dict[str, Any]) -> Dict[str, Any]:
+    from .bulk import run_reinject
+
+    summary = run_reinject(payload['filters'], payload['tracking'], current_app.config['BULK_WORKERS'],
+                           hold=lambda keys: get_job_queue().hold_locks(job, keys))
+    summary['message'] = f"Đã cập nhật {summary['updated']}/{summary['matched']} landing page"
+    return summary
+
+
+def import_zip(payload: Dict[str, Any], job: Dict[str, Any]) -> Dict[str, Any]:
+    from .importer import run_import
+
+    try:
+        summary = run_import(payload['archive'], payload['defaults'], current_app.config['BULK_WORKERS'])
+    except zipfile.BadZipFile:
+        raise PermanentJobError('File không phải ZIP hợp lệ')
+    summary['message'] = f"Đã nhập {summary['imported']}/{summary['sites']} landing page"
+    return summary
+
+
+def reclaim_space(payload: Dict[str, Any], job: Dict[str, Any]) -> Dict[str, Any]:
+    from .consistency import run_scan
+
+    report = run_scan(reclaim_space=True, grace=payload.get('grace', 3600), workers=current_app.config['BULK_WORKERS'])
+    reclaimed = report['reclaimed']
+    return {
+        'message': f"Đã xóa {len(reclaimed['removed'])} thư mục thừa, khôi phục {len(reclaimed['restored'])} trang",
+        **reclaimed,
+        'missing': report['missing'],
+    }
+
+
+def cleanup_landing(payload: Dict[str, Any], job: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove the published tree of a deleted landing (its blobs go with the next `flask gc-blobs`)."""
+    subdomain = payload['subdomain']
+    if repository.get_by_subdomain(subdomain):
+        return {'removed': False, 'reason': 'Subdomain đã được tạo lại'}
+    removed = remove_site(current_app.config['PUBLISHED_ROOT'], subdomain)
+    get_page_cache().invalidate(subdomain)
+    return {'removed': removed}
@@ -0,0 +1,208 @@
+import bisect
+import codecs
+import hashlib
+import os
+import shutil
+import tempfile
+from typing import List, Optional, Tuple
+
+from .utils import Token, scan_tracking_tokens
+
+CHUNK_CHARS = 1024 * 1024
+# A tracking token is '<' + no '<'/'>' + '>'; one still open after this many chars cannot be scanned in chunks
+_MAX_OPEN_TOKEN = 64 * 1024
+
+
+class SpooledText:
+    """
+    UTF-8 text spooled to a temp file that can be sliced and searched by
+    character offset like a str, holding at most a couple of chunks in memory.
+
+    Built by spool_text(), which also collects the tracking tokens in the same
+    pass, so iter_inject_tracking() can run over it without loading the page.
+    """
+
+    def __init__(self, path: str, checkpoints: List[Tuple[int, int]], length: int, tokens: Optional[List[Token]]):
+        self.path = path
+        self.tokens = tokens  # None if the chunked scan could not be trusted
+        self._chars = [c for c, _ in checkpoints]
+        self._bytes = [b for _, b in checkpoints]
+        self._length = length
+        self._file = open(path, 'rb')
+        self._cache: Tuple[int, Optional[str]] = (-1, None)
+
+    def __len__(self) -> int:
+        return self._length
+
+    def _chunk(self, i: int) -> str:
+        if self._cache[0] != i:
+            self._file.seek(self._bytes[i])
+            self._cache = (i, self._file.read(self._bytes[i + 1] - self._bytes[i]).decode('utf-8'))
+        return self._cache[1]
+
+    def _chunk_index(self, pos: int) -> int:
+        return bisect.bisect_right(self._chars, pos) - 1
+
+    def _span(self, start: int, end: int):
+        """Yield (chunk_start, text) for the chunks overlapping [start, end)."""
+        i = self._chunk_index(start)
+        while 0 <= i < len(self._chars) - 1 and self._chars[i] < end:
+            yield self._chars[i], self._chunk(i)
+            i += 1
+
+    def __getitem__(self, key) -> str:
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            raise TypeError('SpooledText only supports contiguous slices')
+        start, end, _ = key.indices(self._length)
+        if start >= end:
+            return ''
+        return ''.join(text[max(start - base, 0):end - base] for base, text in self._span(start, end))
+
+    def find(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        """Single-character find (all the injector needs)."""
+        end = self._length if end is None else min(end, self._length)
+        for base, text in self._span(start, end):
+            pos = text.find(sub, max(start - base, 0), end - base)
+            if pos != -1:
+                return base + pos
+        return -1
+
+    def rfind(self, sub: str, start: int = 0, end: Optional[int] = None) -> int:
+        end = self._length if end is None else min(end, self._length)
+        if start >= end:
+            return -1
+        for i in range(self._chunk_index(end - 1), -1, -1):
+            base = self._chars[i]
+            if base + len(self._chunk(i)) <= start:
+                break
+            pos = self._chunk(i).rfind(sub, max(start - base, 0), end - base)
+            if pos != -1:
+                return base + pos
+        return -1
+
+    def __str__(self) -> str:
+        # Only for the rare multi-pass fallback of the injector
+        return self[0:self._length]
+
+    def close(self):
+        self._file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool_text(stream, directory: str, chunk_size: int = CHUNK_CHARS) -> SpooledText:
+    """
+    Decode a byte stream as UTF-8 (invalid bytes dropped, like
+    .decode('utf-8', errors='ignore')) into a temp file chunk by chunk, and
+    find the tracking tokens on the way.
+    """
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='upload-', suffix='.html', dir=directory)
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    checkpoints = [(0, 0)]
+    chars = nbytes = 0
+    tokens: Optional[List[Token]] = []
+    carry, carry_start = '', 0  # unscanned tail of the previous chunk and its offset
+
+    def scan(text: str, base: int, final: bool) -> Tuple[str, int]:
+        nonlocal tokens
+        buf = carry + text
+        cut = len(buf)
+        if not final:
+            # Keep a possibly unfinished token ('<' with no '>' yet) for the next round
+            lt = buf.rfind('<')
+            if lt != -1 and buf.find('>', lt) == -1:
+                cut = lt
+        if tokens is not None:
+            tokens.extend(scan_tracking_tokens(buf[:cut], base))
+        rest = buf[cut:]
+        if len(rest) > _MAX_OPEN_TOKEN:
+            tokens = None
+            rest = ''
+        return rest, base + cut
+
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                raw = stream.read(chunk_size)
+                text = decoder.decode(raw or b'', final=not raw)
+                if text:
+                    encoded = text.encode('utf-8')
+                    out.write(encoded)
+                    chars += len(text)
+                    nbytes += len(encoded)
+                    checkpoints.append((chars, nbytes))
+                    carry, carry_start = scan(text, carry_start, final=False)
+                if not raw:
+                    break
+            carry, carry_start = scan('', carry_start, final=True)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledText(path, checkpoints, chars, tokens)
+
+
+def upload_size(upload) -> int:
+    stream = upload.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    return size
+
+
+def _sha256(stream) -> str:
+    # Chunked by hand: hashlib.file_digest() needs Python 3.11
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(1 << 16), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upload_sha256(upload) -> str:
+    stream = upload.stream
+    stream.seek(0)
+    digest = _sha256(stream)
+    stream.seek(0)
+    return digest
+
+
+def copy_upload(upload, target: str):
+    """
+    Copy an uploaded file (werkzeug FileStorage) to `target` without reading it
+    into Python: uploads werkzeug spooled to disk are copied in the kernel with
+    copy_file_range/sendfile, small in-memory ones with copyfileobj.
+    """
+    stream = upload.stream
+    stream.seek(0)
+    src_fd = None
+    # fileno() would force an in-memory SpooledTemporaryFile onto disk
+    if not (isinstance(stream, tempfile.SpooledTemporaryFile) and not stream._rolled):
+        try:
+            src_fd = stream.fileno()
+        except (AttributeError, OSError, ValueError):
+            src_fd = None
+    with open(target, 'wb') as dst:
+        if src_fd is None:
+            shutil.copyfileobj(stream, dst)
+        else:
+            size = os.fstat(src_fd).st_size
+            offset = 0
+            while offset < size:
+                if hasattr(os, 'copy_file_range'):
+                    copied = os.copy_file_range(src_fd, dst.fileno(), size - offset, offset, offset)
+                else:
+                    copied = os.sendfile(dst.fileno(), src_fd, offset, size - offset)
+                if copied == 0:
+                    break
+                offset += copied
+
+
+def file_sha256(path: str) -> str:
+    with open(path, 'rb') as f:
+        return _sha256(f)
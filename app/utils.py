@@ -1,5 +1,5 @@
 import re
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple, Union
 
 HEAD_CLOSE_RE = re.compile(r"</head>", re.IGNORECASE)
 BODY_CLOSE_RE = re.compile(r"</body>", re.IGNORECASE)
@@ -19,6 +19,42 @@ INJECTED_BODY_BLOCK_RE = re.compile(
     re.IGNORECASE | re.DOTALL,
 )
 
+# Every marker/close tag inject_tracking reacts to, as one alternation so a single
+# scan finds them all. Each token is '<' + no '<'/'>' + '>', so tokens never overlap.
+TRACKING_TOKEN_RE = re.compile(
+    r"<(?:(?P<head_block_open>!--\s*Global\s+Site\s+Tag\s*-->)"
+    r"|(?P<head_block_close>!--\s*/Global\s+Site\s+Tag\s*-->)"
+    r"|(?P<body_block_open>!--\s*Tracking\s+Codes\s*-->)"
+    r"|(?P<body_block_close>!--\s*/Tracking\s+Codes\s*-->)"
+    r"|(?P<ph_head>!--\s*TRACKING_HEAD\s*-->)"
+    r"|(?P<ph_body>!--\s*TRACKING_BODY\s*-->)"
+    r"|(?P<head_close>/head>)"
+    r"|(?P<body_close>/body>))",
+    re.IGNORECASE,
+)
+# Seam checks give up (and fall back to the multi-pass injector) beyond this many chars
+_SEAM_WINDOW = 4096
+
+TRACKING_TEMPLATE_HEAD = """<!-- Global Site Tag -->\n{global_site_tag}\n<!-- /Global Site Tag -->"""
+TRACKING_TEMPLATE_BODY = """<!-- Tracking Codes -->\n<script>window.PHONE_TRACKING={phone_tracking!r};</script>\n<script>window.ZALO_TRACKING={zalo_tracking!r};</script>\n<script>window.FORM_TRACKING={form_tracking!r};</script>\n{event_beacon}\n<!-- /Tracking Codes -->"""
+# Reports view/call/zalo/form events to the first-party beacon endpoint (app/events.py)
+EVENT_BEACON_SCRIPT = (
+    "<script>(function(){var u='/_e',m=location.pathname.match(/^\\/landing\\/([^\\/]+)/),"
+    "s=m?m[1]:location.hostname.split('.')[0];"
+    "function t(e){try{var d=new URLSearchParams({s:s,e:e});"
+    "if(!(navigator.sendBeacon&&navigator.sendBeacon(u,d)))fetch(u,{method:'POST',body:d,keepalive:true});}catch(x){}}"
+    "t('view');"
+    "document.addEventListener('click',function(ev){var a=ev.target.closest&&ev.target.closest('a[href]');if(!a)return;"
+    "var h=a.getAttribute('href');"
+    "if(/^tel:/i.test(h))t('call');else if(/zalo\\.me|^zalo:/i.test(h))t('zalo');"
+    "else if(/forms\\.gle|docs\\.google\\.com\\/forms/i.test(h))t('form');},true);"
+    "document.addEventListener('submit',function(){t('form');},true);})();</script>"
+)
+TRACKING_FIELDS = ('global_site_tag', 'phone_tracking', 'zalo_tracking', 'form_tracking')
+
+Piece = Union[str, Tuple[int, int]]
+Token = Tuple[str, int, int]
+
 
 def sanitize_subdomain(raw: str) -> Optional[str]:
     raw = raw.strip().lower()
@@ -27,10 +63,243 @@ def sanitize_subdomain(raw: str) -> Optional[str]:
     return None
 
 
+def render_tracking_snippets(global_site_tag: str, phone_tracking: str, zalo_tracking: str,
+                             form_tracking: str) -> Tuple[str, str]:
+    """Build the (head, body) snippets injected into every published page."""
+    head_snippet = TRACKING_TEMPLATE_HEAD.format(global_site_tag=global_site_tag)
+    body_snippet = TRACKING_TEMPLATE_BODY.format(
+        phone_tracking=phone_tracking,
+        zalo_tracking=zalo_tracking,
+        form_tracking=form_tracking,
+        event_beacon=EVENT_BEACON_SCRIPT,
+    )
+    return head_snippet, body_snippet
+
+
 def inject_tracking(html: str, head_snippet: str, body_end_snippet: str) -> str:
     """
     Inject tracking snippets into HTML with support for placeholders.
 
+    Insertion order:
+    1) Remove any previously injected tracking blocks (bounded by comment markers)
+    2) If placeholder <!-- TRACKING_HEAD --> exists, replace its first occurrence
+       Else insert before </head> or prepend if no head tag
+    3) If placeholder <!-- TRACKING_BODY --> exists, replace its first occurrence
+       Else insert before </body> or append if no body tag
+
+    All markers are located in one scan and the output is assembled with a
+    single join; the result is byte-identical to the step-by-step regex version.
+    """
+    return ''.join(iter_inject_tracking(html, head_snippet, body_end_snippet))
+
+
+def iter_inject_tracking(html, head_snippet: str, body_end_snippet: str,
+                         chunk_size: int = 1 << 20, tokens: Optional[List[Token]] = None) -> Iterator[str]:
+    """
+    Same as inject_tracking but yields the output in chunks (for writing straight to a file).
+
+    `html` may also be a str-like document that is not held in memory (see
+    app/uploads.SpooledText) with its `tokens` found while it was spooled.
+    """
+    pieces = _plan_tracking(html, head_snippet, body_end_snippet, tokens)
+    if pieces is None:
+        # A removal glued a new marker together; let the regex passes decide
+        yield _inject_tracking_multipass(str(html), head_snippet, body_end_snippet)
+        return
+    for piece in pieces:
+        if isinstance(piece, str):
+            yield piece
+            continue
+        start, end = piece
+        for pos in range(start, end, chunk_size):
+            yield html[pos:min(pos + chunk_size, end)]
+
+
+def _plan_tracking(html, head_snippet: str, body_end_snippet: str,
+                   tokens: Optional[List[Token]] = None) -> Optional[List[Piece]]:
+    """
+    Compute the injected document as a list of pieces: (start, end) spans of
+    `html` or literal strings. Returns None when the single-scan model cannot
+    guarantee the multi-pass result (a marker formed across a removal seam or
+    inside the inserted head snippet).
+    """
+    if tokens is None:
+        tokens = scan_tracking_tokens(str(html))
+    else:
+        tokens = list(tokens)
+    pieces: List[Piece] = [(0, len(html))] if html else []
+
+    # 1) Remove previously injected blocks: head blocks first, then body blocks
+    for open_kind, close_kind in (('head_block_open', 'head_block_close'),
+                                  ('body_block_open', 'body_block_close')):
+        spans = _block_spans(tokens, open_kind, close_kind)
+        if spans:
+            pieces = _remove_spans(pieces, spans)
+            tokens = [t for t in tokens if not _in_spans(t, spans)]
+            if _has_seam_token(html, pieces):
+                return None
+
+    # 2) Head: placeholder > before </head> > prepend
+    ph = _first(tokens, 'ph_head')
+    close = _first(tokens, 'head_close')
+    if ph:
+        literal = _expand(PH_HEAD_RE, html, ph, head_snippet)
+        pieces = _replace_token(pieces, ph, literal)
+        tokens.remove(ph)
+    elif close:
+        literal = _expand(HEAD_CLOSE_RE, html, close, head_snippet + "\n</head>")
+        pieces = _replace_token(pieces, close, literal)
+        tokens.remove(close)
+    else:
+        literal = head_snippet + "\n"
+        pieces.insert(0, literal)
+    if any(m.lastgroup in ('ph_body', 'body_close') for m in TRACKING_TOKEN_RE.finditer(literal)):
+        return None
+    if _has_seam_token(html, pieces):
+        return None
+
+    # 3) Body: placeholder > before </body> > append
+    ph = _first(tokens, 'ph_body')
+    close = _first(tokens, 'body_close')
+    if ph:
+        pieces = _replace_token(pieces, ph, _expand(PH_BODY_RE, html, ph, body_end_snippet))
+    elif close:
+        pieces = _replace_token(pieces, close, _expand(BODY_CLOSE_RE, html, close, body_end_snippet + "\n</body>"))
+    else:
+        pieces.append("\n" + body_end_snippet)
+    return pieces
+
+
+def scan_tracking_tokens(html: str, offset: int = 0) -> List[Token]:
+    return [(m.lastgroup, m.start() + offset, m.end() + offset) for m in TRACKING_TOKEN_RE.finditer(html)]
+
+
+def _block_spans(tokens: List[Token], open_kind: str, close_kind: str) -> List[Tuple[int, int]]:
+    """Spans matched by `open.*?close` (DOTALL), scanning left to right like re.sub."""
+    spans = []
+    i, n = 0, len(tokens)
+    while i < n:
+        if tokens[i][0] != open_kind:
+            i += 1
+            continue
+        j = i + 1
+        while j < n and tokens[j][0] != close_kind:
+            j += 1
+        if j == n:
+            break  # no closing marker after this opener, so none after later ones either
+        spans.append((tokens[i][1], tokens[j][2]))
+        i = j + 1
+    return spans
+
+
+def _in_spans(token: Token, spans: List[Tuple[int, int]]) -> bool:
+    return any(start <= token[1] and token[2] <= end for start, end in spans)
+
+
+def _remove_spans(pieces: List[Piece], spans: List[Tuple[int, int]]) -> List[Piece]:
+    result: List[Piece] = []
+    for piece in pieces:
+        if isinstance(piece, str):
+            result.append(piece)
+            continue
+        start, end = piece
+        for span_start, span_end in spans:
+            if span_end <= start or span_start >= end:
+                continue
+            if span_start > start:
+                result.append((start, span_start))
+            start = max(start, span_end)
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def _replace_token(pieces: List[Piece], token: Token, literal: str) -> List[Piece]:
+    _, tok_start, tok_end = token
+    for i, piece in enumerate(pieces):
+        if isinstance(piece, str) or not (piece[0] <= tok_start and tok_end <= piece[1]):
+            continue
+        replacement = [p for p in ((piece[0], tok_start), literal, (tok_end, piece[1]))
+                       if isinstance(p, str) or p[0] < p[1]]
+        return pieces[:i] + replacement + pieces[i + 1:]
+    raise ValueError('token is not part of the document')
+
+
+def _first(tokens: List[Token], kind: str) -> Optional[Token]:
+    return next((t for t in tokens if t[0] == kind), None)
+
+
+def _expand(pattern, html, token: Token, template: str) -> str:
+    # re.sub treats the replacement as a template; keep its escape handling identical
+    if '\\' not in template:
+        return template
+    return pattern.match(html[token[1]:token[2]]).expand(template)
+
+
+def _has_seam_token(html: str, pieces: List[Piece]) -> bool:
+    """True if a marker/close tag straddles the boundary of two non-contiguous pieces."""
+    for k in range(1, len(pieces)):
+        prev, cur = pieces[k - 1], pieces[k]
+        if not isinstance(prev, str) and not isinstance(cur, str) and prev[1] == cur[0]:
+            continue
+        straddles = _seam_candidate(html, pieces, k)
+        if straddles is None or TRACKING_TOKEN_RE.match(straddles):
+            return True
+    return False
+
+
+def _seam_candidate(html: str, pieces: List[Piece], k: int) -> Optional[str]:
+    """
+    Text from the last '<' before seam k to the first '>' after it, i.e. the
+    only string that could be a token crossing the seam. Returns '' when no
+    token can cross and None when the window is too large to decide cheaply.
+    """
+    def text(piece):
+        return piece if isinstance(piece, str) else html[piece[0]:piece[1]]
+
+    left = ''
+    for piece in reversed(pieces[:k]):
+        if isinstance(piece, str):
+            lt, gt = piece.rfind('<'), piece.rfind('>')
+        else:
+            lt, gt = html.rfind('<', *piece), html.rfind('>', *piece)
+        if gt > lt:
+            return ''
+        if lt != -1:
+            left = (piece[lt:] if isinstance(piece, str) else html[lt:piece[1]]) + left
+            break
+        if (len(piece) if isinstance(piece, str) else piece[1] - piece[0]) + len(left) > _SEAM_WINDOW:
+            return None
+        left = text(piece) + left
+    else:
+        return ''
+
+    right = ''
+    for piece in pieces[k:]:
+        if isinstance(piece, str):
+            gt, lt = piece.find('>'), piece.find('<')
+        else:
+            gt, lt = html.find('>', *piece), html.find('<', *piece)
+        if lt != -1 and (gt == -1 or lt < gt):
+            return ''
+        if gt != -1:
+            right += piece[:gt + 1] if isinstance(piece, str) else html[piece[0]:gt + 1]
+            break
+        if (len(piece) if isinstance(piece, str) else piece[1] - piece[0]) + len(right) > _SEAM_WINDOW:
+            return None
+        right += text(piece)
+    else:
+        return ''
+
+    if len(left) + len(right) > _SEAM_WINDOW:
+        return None
+    return left + right
+
+
+def _inject_tracking_multipass(html: str, head_snippet: str, body_end_snippet: str) -> str:
+    """
+    Inject tracking snippets into HTML with support for placeholders.
+
     Insertion order:
     1) Remove any previously injected tracking blocks (bounded by comment markers)
     2) If placeholder <!-- TRACKING_HEAD --> exists, replace its first occurrence
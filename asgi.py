@@ -0,0 +1,12 @@
+"""
+ASGI entry point: public landing traffic is served on the event loop, the
+admin app runs on a thread pool behind it.
+
+    pip install uvicorn
+    uvicorn asgi:app --host 0.0.0.0 --port 5000 --workers 4
+"""
+from app import create_app
+from app.asgi import LandingASGI
+
+flask_app = create_app()
+app = LandingASGI(flask_app)
@@ -212,6 +212,14 @@ server {
         expires 30d;
         add_header Cache-Control "public, immutable";
     }
+
+    # ASSET_DELIVERY=x-accel-redirect: the app only looks the asset up, Nginx sends the file
+    # (Range, conditional requests and .gz siblings included)
+    location ^~ /_published/ {
+        internal;
+        alias $PUBLISHED_DIR/;
+        gzip_static on;
+    }
 }
 
 # Wildcard subdomains for landing pages
@@ -221,10 +229,61 @@ server {
     root $PUBLISHED_DIR;
     index index.html;
 
+    # Serve the .gz siblings written at publish time (no on-the-fly compression)
+    gzip_static on;
+    # brotli_static on;  # requires ngx_brotli; .br siblings are written when the 'brotli' package is installed
+
+    set \$subdomain "";
+    if (\$host ~* "^([^.]+)\\.$DOMAIN\$") { set \$subdomain \$1; }
+
+    # Each publish is a directory <sub>/.v/<n>, <sub>/current points at the live one;
+    # landings not republished since versioning still live directly in <sub>/.
+    # The page itself goes through the app, which answers a paused landing with the placeholder
+    # (pausing leaves the page on disk) and keeps pages in memory; other files come from disk.
+    # No Host header: the app sees /landing/<sub>/... whether or not HOST_DISPATCH is on
+    location = / {
+        proxy_pass http://127.0.0.1:5000/landing/\$subdomain\$is_args\$args;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+    }
+    location ~ "(^|/)index(\.paused)?\.html(\.gz|\.br)?\$" {
+        proxy_pass http://127.0.0.1:5000/landing/\$subdomain\$uri\$is_args\$args;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+    }
     location / {
-        set \$subdomain "";
-        if (\$host ~* "^([^.]+)\\.$DOMAIN\$") { set \$subdomain \$1; }
-        try_files /\$subdomain/index.html /\$subdomain/index.html @fallback;
+        try_files /\$subdomain/current\$uri /\$subdomain\$uri @page;
+    }
+    location @page {
+        proxy_pass http://127.0.0.1:5000/landing/\$subdomain\$is_args\$args;
+        proxy_set_header X-Real-IP \$remote_addr;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+    }
+
+    # Page responses with ASSET_DELIVERY=x-accel-redirect
+    location ^~ /_published/ {
+        internal;
+        alias $PUBLISHED_DIR/;
+        gzip_static on;
+    }
+
+    # Click/conversion beacons from the injected tracking script
+    location = /_e {
+        proxy_pass http://127.0.0.1:5000;
+        proxy_set_header Host \$host;
+        proxy_set_header X-Forwarded-For \$proxy_add_x_forwarded_for;
+    }
+
+    # Files of one published version never change: cache forever
+    location ~ ^/_v/([0-9]+)/(.+)$ {
+        try_files /\$subdomain/.v/\$1/\$2 =404;
+        add_header Cache-Control "public, max-age=31536000, immutable";
+    }
+
+    # Content-addressed blobs shared by all landings (/_b/<sha256>.<ext>)
+    location ~ "^/_b/(([0-9a-f]{2})[0-9a-f]{62}(\.[a-z0-9]+)?)\$" {
+        try_files /.blobs/\$2/\$1 =404;
+        add_header Cache-Control "public, max-age=31536000, immutable";
     }
 
     location ~* ^/([^/]+)/images/(.+\.(jpg|jpeg|png|gif|svg|webp|ico))$ {
@@ -234,8 +293,6 @@ server {
         add_header Access-Control-Allow-Origin "*";
     }
 
-    location @fallback { return 404 "Landing page không tồn tại"; }
-
     add_header X-Frame-Options SAMEORIGIN;
     add_header X-Content-Type-Options nosniff;
     add_header X-XSS-Protection "1; mode=block";
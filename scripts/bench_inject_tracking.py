@@ -0,0 +1,88 @@
+"""
+Benchmark: single-scan inject_tracking vs the previous multi-pass regex version.
+
+Builds synthetic LadiPage-like exports (inline base64 images, large inline CSS,
+many sections) of several sizes, checks both implementations produce identical
+output and prints the timings as JSON.
+
+Usage:
+    python scripts/bench_inject_tracking.py [--sizes 1,4,16] [--repeat 5]
+"""
+import argparse
+import base64
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.utils import inject_tracking, _inject_tracking_multipass  # noqa: E402
+
+HEAD = "<!-- Global Site Tag -->\n<script async src=\"https://www.googletagmanager.com/gtag/js?id=G-XXXX\"></script>\n<!-- /Global Site Tag -->"
+BODY = "<!-- Tracking Codes -->\n<script>window.PHONE_TRACKING='0900';</script>\n<!-- /Tracking Codes -->"
+
+
+def make_page(size_mb: float, injected: bool, seed: int = 0) -> str:
+    rnd = random.Random(seed)
+    css = ''.join(f".ladi-section-{i}{{position:relative;width:{rnd.randint(1, 1200)}px;height:auto;color:#{i % 0xffffff:06x};}}\n"
+                  for i in range(2000))
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>LadiPage</title>',
+             f'<style>{css}</style>']
+    if injected:
+        parts.append(HEAD)
+    parts.append('</head><body>')
+    target = int(size_mb * 1024 * 1024)
+    size = sum(len(p) for p in parts)
+    i = 0
+    while size < target:
+        blob = base64.b64encode(rnd.randbytes(24 * 1024)).decode()
+        section = (f'<div id="SECTION{i}" class="ladi-section"><div class="ladi-container">'
+                   f'<img src="data:image/png;base64,{blob}"><p>Nội dung {i}</p></div></div>\n')
+        parts.append(section)
+        size += len(section)
+        i += 1
+    if injected:
+        parts.append(BODY)
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def timed(fn, html, repeat):
+    best = float('inf')
+    out = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        out = fn(html, HEAD, BODY)
+        best = min(best, time.perf_counter() - t0)
+    return best, out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,4,16', help='page sizes in MB, comma separated')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    results = []
+    for size in [float(s) for s in args.sizes.split(',')]:
+        for injected in (False, True):
+            html = make_page(size, injected)
+            legacy_s, legacy_out = timed(_inject_tracking_multipass, html, args.repeat)
+            single_s, single_out = timed(inject_tracking, html, args.repeat)
+            if legacy_out != single_out:
+                raise SystemExit(f'output mismatch for {size}MB injected={injected}')
+            results.append({
+                'size_mb': size,
+                'reinjection': injected,
+                'bytes': len(html),
+                'multipass_ms': round(legacy_s * 1000, 3),
+                'single_scan_ms': round(single_s * 1000, 3),
+                'speedup': round(legacy_s / single_s, 2) if single_s else None,
+            })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""
+Benchmark: public serving and admin API hot paths.
+
+Seeds N synthetic landings (configurable HTML size and image count) into a
+temp PUBLISHED_ROOT and database, then measures requests/sec and
+p50/p95/p99 latency under concurrency for:
+
+  page          GET /landing/<sub>                 (Accept-Encoding: gzip, br)
+  page_304      GET /landing/<sub> with If-None-Match
+  host_page     GET / with Host: <sub>.<domain>    (HostDispatcher)
+  asset         GET /landing/<sub>/anhN.jpg
+  api_list      GET /api/landingpages              (keyset pagination, agent filter)
+  api_create    POST /api/landingpages             (multipart upload)
+  api_update    PUT /api/landingpages/<id>         (tracking change, re-inject + publish)
+
+plus single-threaded inject_tracking timings. Requests go through the Flask
+test client (default) or a threaded werkzeug server started on localhost
+(--target server). Results are printed (or written with --output) as JSON;
+--compare prints the change against an earlier run.
+
+Usage:
+    python scripts/bench_serving.py [--landings 200] [--html-kb 64] [--images 3] [--image-kb 100]
+                                    [--requests 2000] [--concurrency 16] [--target testclient|server]
+                                    [--scenarios page,asset,...] [--output run.json] [--compare base.json]
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DOMAIN = 'bench.local'
+SCENARIOS = ('page', 'page_304', 'host_page', 'asset', 'api_list', 'api_create', 'api_update')
+WRITE_SCENARIOS = ('api_create', 'api_update')
+
+
+def make_html(size_kb: int, images: int, seed: int) -> str:
+    rnd = random.Random(seed)
+    parts = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>LadiPage</title>',
+             '<style>' + ''.join(f'.ladi-{i}{{width:{rnd.randint(1, 1200)}px}}' for i in range(200)) + '</style>',
+             '</head><body>']
+    parts += [f'<img src="anh{i}.jpg">' for i in range(1, images + 1)]
+    size = sum(len(p) for p in parts)
+    i = 0
+    while size < size_kb * 1024:
+        section = f'<div id="SECTION{i}" class="ladi-section"><p>Nội dung {i} {rnd.random()}</p></div>\n'
+        parts.append(section)
+        size += len(section)
+        i += 1
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+
+def seed(app, landings: int, html_kb: int, images: int, image_kb: int):
+    """Publish landings straight through publish() and register them in one batched upsert."""
+    from app import repository
+    from app.publishing import publish
+    from app.utils import inject_tracking, render_tracking_snippets
+
+    pub_root = app.config['PUBLISHED_ROOT']
+    head, body = render_tracking_snippets('<script>gtag()</script>', '', '', '')
+    image_bytes = [os.urandom(image_kb * 1024) for _ in range(images)]
+    rows = []
+    for n in range(landings):
+        sub = f'bench{n}'
+        html = inject_tracking(make_html(html_kb, images, n), head, body)
+
+        def populate(staging):
+            for i, data in enumerate(image_bytes, 1):
+                with open(os.path.join(staging, f'anh{i}.jpg'), 'wb') as f:
+                    f.write(data)
+        publish(pub_root, sub, html=html, populate=populate, inherit=False)
+        rows.append({'subdomain': sub, 'agent': f'agent{n % 10}', 'original_filename': 'index.html'})
+    with app.app_context():
+        repository.upsert_landings(rows)
+    app.extensions['routing_table'].load()
+
+
+class TestClientTarget:
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, data=None, content_type=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers or {}, data=data, content_type=content_type)
+        body = response.get_data()
+        return response.status_code, response.headers, body
+
+
+class ServerTarget:
+    """Threaded werkzeug server on localhost; one keep-alive connection per benchmark thread."""
+
+    def __init__(self, app):
+        from werkzeug.serving import WSGIRequestHandler, make_server
+
+        class QuietHandler(WSGIRequestHandler):
+            def log_request(self, *args, **kwargs):
+                pass
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=QuietHandler)
+        self.port = self.server.server_port
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None, data=None, content_type=None):
+        from werkzeug.test import EnvironBuilder
+        headers = dict(headers or {})
+        body = None
+        if data is not None:
+            # Let werkzeug encode form/multipart bodies exactly like the test client does
+            env = EnvironBuilder(method=method, data=data, content_type=content_type).get_environ()
+            body = env['wsgi.input'].read()
+            headers['Content-Type'] = env['CONTENT_TYPE']
+        for attempt in range(2):
+            conn = getattr(self._local, 'conn', None)
+            if conn is None:
+                conn = self._local.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                payload = response.read()
+                if response.getheader('Connection', '').lower() == 'close':
+                    conn.close()
+                    self._local.conn = None
+                return response.status, response.headers, payload
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self._local.conn = None
+                if attempt:
+                    raise
+
+    def close(self):
+        self.server.shutdown()
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * pct / 100
+    lo, hi = int(k), min(int(k) + 1, len(sorted_values) - 1)
+    return sorted_values[lo] + (sorted_values[hi] - sorted_values[lo]) * (k - lo)
+
+
+def run_scenario(name, target, make_request, requests, concurrency):
+    """Fire `requests` calls from `concurrency` threads; returns throughput and latency stats."""
+    latencies, errors, nbytes = [], [0], [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker():
+        local, local_bytes, local_errors = [], 0, 0
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                break
+            method, path, kwargs, expected = make_request(i)
+            started = time.perf_counter()
+            status, _, body = target.request(method, path, **kwargs)
+            local.append(time.perf_counter() - started)
+            local_bytes += len(body)
+            if status not in expected:
+                local_errors += 1
+        with lock:
+            latencies.extend(local)
+            nbytes[0] += local_bytes
+            errors[0] += local_errors
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+    latencies.sort()
+    ms = [v * 1000 for v in latencies]
+    return {
+        'scenario': name,
+        'requests': len(ms),
+        'errors': errors[0],
+        'concurrency': concurrency,
+        'wall_s': round(wall, 3),
+        'rps': round(len(ms) / wall, 1) if wall else None,
+        'mb_per_s': round(nbytes[0] / wall / 1e6, 2) if wall else None,
+        'mean_ms': round(statistics.fmean(ms), 3) if ms else None,
+        'p50_ms': round(percentile(ms, 50), 3) if ms else None,
+        'p95_ms': round(percentile(ms, 95), 3) if ms else None,
+        'p99_ms': round(percentile(ms, 99), 3) if ms else None,
+        'max_ms': round(ms[-1], 3) if ms else None,
+    }
+
+
+def request_factories(app, target, args):
+    landings = args.landings
+    rnd = random.Random(42)
+    subs = [f'bench{rnd.randrange(landings)}' for _ in range(4096)]
+    accept = {'Accept-Encoding': 'gzip, br'}
+    etags = {}
+    for sub in set(subs[:256]):
+        _, headers, _ = target.request('GET', f'/landing/{sub}', headers=accept)
+        etags[sub] = headers.get('ETag')
+    etag_subs = list(etags)
+    html = make_html(args.html_kb, args.images, 10**6).encode()
+    image = os.urandom(args.image_kb * 1024)
+    with app.app_context():
+        from app import repository
+        ids = [r['id'] for r in repository.find_landings(subdomain_glob='bench*')]
+    run_id = int(time.time() * 1000) % 10**8
+
+    def create(i):
+        data = {'subdomain': f'new{run_id}-{i}', 'agent': 'bench', 'phone_tracking': f'<script>p{i}</script>',
+                'file': (io.BytesIO(html), 'index.html'),
+                'images': [(io.BytesIO(image), f'a{k}.jpg') for k in range(args.images)]}
+        return 'POST', '/api/landingpages', {'data': data, 'content_type': 'multipart/form-data'}, (200,)
+
+    def update(i):
+        data = {'phone_tracking': f'<script>u{i}</script>'}
+        return ('PUT', f'/api/landingpages/{ids[i % len(ids)]}',
+                {'data': data, 'content_type': 'multipart/form-data'}, (200,))
+
+    return {
+        'page': lambda i: ('GET', f'/landing/{subs[i % len(subs)]}', {'headers': accept}, (200,)),
+        'page_304': lambda i: ('GET', f'/landing/{etag_subs[i % len(etag_subs)]}',
+                               {'headers': {**accept, 'If-None-Match': etags[etag_subs[i % len(etag_subs)]]}},
+                               (304,)),
+        'host_page': lambda i: ('GET', '/', {'headers': {**accept, 'Host': f'{subs[i % len(subs)]}.{DOMAIN}'}},
+                                (200,)),
+        'asset': lambda i: ('GET', f'/landing/{subs[i % len(subs)]}/anh{i % max(args.images, 1) + 1}.jpg',
+                            {}, (200,) if args.images else (404,)),
+        'api_list': lambda i: ('GET', '/api/landingpages?limit=50' + (f'&agent=agent{i % 10}' if i % 2 else ''),
+                               {}, (200,)),
+        'api_create': create,
+        'api_update': update,
+    }
+
+
+def bench_inject(args):
+    from app.utils import inject_tracking, render_tracking_snippets
+    head, body = render_tracking_snippets('<script>gtag()</script>', '<script>p</script>', '', '')
+    html = make_html(args.html_kb, args.images, 7)
+    reinjected = inject_tracking(html, head, body)
+    results = []
+    for label, doc in (('fresh', html), ('reinject', reinjected)):
+        timings = []
+        for _ in range(50):
+            started = time.perf_counter()
+            inject_tracking(doc, head, body)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results.append({'scenario': f'inject_tracking_{label}', 'bytes': len(doc.encode('utf-8')),
+                        'p50_ms': round(percentile(timings, 50), 3), 'p99_ms': round(percentile(timings, 99), 3)})
+    return results
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r['scenario']: r for r in json.load(f)['results']}
+    lines = []
+    for result in current['results']:
+        base = baseline.get(result['scenario'])
+        if not base:
+            continue
+        deltas = []
+        for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+            if result.get(key) and base.get(key):
+                deltas.append(f"{key} {base[key]} -> {result[key]} ({(result[key] / base[key] - 1) * 100:+.1f}%)")
+        lines.append(f"{result['scenario']:24} " + ', '.join(deltas))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--landings', type=int, default=200)
+    parser.add_argument('--html-kb', type=int, default=64)
+    parser.add_argument('--images', type=int, default=3)
+    parser.add_argument('--image-kb', type=int, default=100)
+    parser.add_argument('--requests', type=int, default=2000, help='requests per read scenario')
+    parser.add_argument('--write-requests', type=int, default=100, help='requests per create/update scenario')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--target', choices=('testclient', 'server'), default='testclient')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='earlier JSON output to compare against')
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='bench-serving-')
+    templates = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'templates')
+    os.symlink(templates, os.path.join(work, 'templates'))
+    os.environ.update(PUBLISHED_ROOT=os.path.join(work, 'published'), UPLOAD_FOLDER=os.path.join(work, 'uploads'),
+                      HOST_DISPATCH='true', WILDCARD_DOMAIN=DOMAIN, IMAGE_OPTIMIZE='false',
+                      ROLLUP_INTERVAL='0', EVENT_FLUSH_INTERVAL_MS='1000')
+    os.chdir(work)  # database.db is created in the working directory
+    from app import create_app
+    app = create_app()
+    app.config.update(LOGIN_DISABLED=True, WTF_CSRF_ENABLED=False)
+
+    started = time.perf_counter()
+    seed(app, args.landings, args.html_kb, args.images, args.image_kb)
+    seed_s = time.perf_counter() - started
+
+    target = TestClientTarget(app) if args.target == 'testclient' else ServerTarget(app)
+    factories = request_factories(app, target, args)
+    results = []
+    for name in [s.strip() for s in args.scenarios.split(',') if s.strip()]:
+        if name not in factories:
+            raise SystemExit(f'unknown scenario {name}')
+        count = args.write_requests if name in WRITE_SCENARIOS else args.requests
+        results.append(run_scenario(name, target, factories[name], count, args.concurrency))
+    results += bench_inject(args)
+    if isinstance(target, ServerTarget):
+        target.close()
+
+    report = {
+        'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'seed_s': round(seed_s, 3),
+        'page_cache': {'hits': app.extensions['page_cache'].hits, 'misses': app.extensions['page_cache'].misses},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    if args.compare:
+        print(compare(report, args.compare), file=sys.stderr)
+    if any(r.get('errors') for r in results):
+        raise SystemExit('some requests returned an unexpected status')
+
+
+if __name__ == '__main__':
+    main()
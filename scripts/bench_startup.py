@@ -0,0 +1,124 @@
+"""
+Benchmark: worker boot time.
+
+Starts fresh Python processes the way a gunicorn worker (re)starts and
+measures, inside each child:
+
+  import_ms         `from app import create_app`
+  create_app_ms     create_app() (config, extensions, schema check, blueprint)
+  first_request_ms  the first GET /landing/<sub> (lazy imports land here)
+  boot_ms           interpreter start -> first response
+  modules           sys.modules size after create_app()
+
+for two scenarios: `fresh_db` (new working directory: the schema is
+created/migrated) and `existing_db` (the database from a previous boot, the
+common case on restarts and worker recycling). Results are printed (or written
+with --output) as JSON; --compare prints the change against an earlier run.
+
+Usage:
+    python scripts/bench_startup.py [--runs 10] [--output run.json] [--compare base.json]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ('fresh_db', 'existing_db')
+
+
+def child():
+    """Runs inside the measured process; prints one JSON line."""
+    started = float(os.environ['BENCH_STARTED'])
+    sys.path.insert(0, ROOT)
+    t0 = time.perf_counter()
+    from app import create_app
+    t1 = time.perf_counter()
+    app = create_app()
+    t2 = time.perf_counter()
+    modules = len(sys.modules)
+    response = app.test_client().get('/landing/bench-missing')
+    t3 = time.perf_counter()
+    print(json.dumps({'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000,
+                      'first_request_ms': (t3 - t2) * 1000, 'boot_ms': (time.time() - started) * 1000,
+                      'modules': modules, 'status': response.status_code}))
+
+
+def run_child(work: str) -> dict:
+    env = dict(os.environ, BENCH_STARTED=repr(time.time()), PUBLISHED_ROOT=os.path.join(work, 'published'),
+               UPLOAD_FOLDER=os.path.join(work, 'uploads'), ROLLUP_INTERVAL='0')
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=work, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def make_workdir() -> str:
+    work = tempfile.mkdtemp(prefix='bench-startup-')
+    os.symlink(os.path.join(ROOT, 'templates'), os.path.join(work, 'templates'))
+    return work
+
+
+def summarize(name: str, runs: list) -> dict:
+    result = {'scenario': name, 'runs': len(runs), 'modules': runs[-1]['modules']}
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'boot_ms'):
+        values = sorted(r[key] for r in runs)
+        result[key] = round(statistics.median(values), 2)
+        result[key.replace('_ms', '_min_ms')] = round(values[0], 2)
+    return result
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {r['scenario']: r for r in json.load(f)['results']}
+    lines = []
+    for result in current['results']:
+        base = baseline.get(result['scenario'])
+        if not base:
+            continue
+        deltas = []
+        for key in ('import_ms', 'create_app_ms', 'first_request_ms', 'boot_ms', 'modules'):
+            if result.get(key) and base.get(key):
+                deltas.append(f"{key} {base[key]} -> {result[key]} ({(result[key] / base[key] - 1) * 100:+.1f}%)")
+        lines.append(f"{result['scenario']:12} " + ', '.join(deltas))
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10, help='processes started per scenario')
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--compare', help='earlier JSON output to compare against')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child()
+
+    results = []
+    fresh = [run_child(make_workdir()) for _ in range(args.runs)]
+    results.append(summarize('fresh_db', fresh))
+    work = make_workdir()
+    run_child(work)  # creates the database
+    results.append(summarize('existing_db', [run_child(work) for _ in range(args.runs)]))
+
+    report = {
+        'params': {'runs': args.runs},
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                        'cpus': os.cpu_count()},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    if args.compare:
+        print(compare(report, args.compare), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
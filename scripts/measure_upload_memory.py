@@ -0,0 +1,121 @@
+"""
+Measure the peak Python memory of publishing a landing through the upload API.
+
+Writes multipart request bodies (index.html of several sizes plus images) to
+disk, feeds each one to the app as wsgi.input so the request itself is not in
+memory, and records the tracemalloc peak of POST /api/landingpages and of a
+tracking-only PUT (page re-read from disk). With streaming uploads the peak
+should stay flat as the page grows. Exits non-zero if the largest page peaks
+at more than --max-ratio times the smallest.
+
+Usage:
+    python scripts/measure_upload_memory.py [--sizes 1,4,16] [--images 3] [--image-mb 4]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHUNK = 1024 * 1024
+
+
+def write_multipart(path, boundary, fields, files):
+    """Write a multipart/form-data body chunk by chunk; `files` is [(field, filename, size_bytes, kind)]."""
+    with open(path, 'wb') as f:
+        for name, value in fields.items():
+            f.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+        for field, filename, size, kind in files:
+            f.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                    f'Content-Type: {"text/html" if kind == "html" else "image/jpeg"}\r\n\r\n'.encode())
+            if kind == 'html':
+                f.write(b'<!DOCTYPE html><html><head><meta charset="utf-8"><title>LadiPage</title></head><body>\n')
+                written = 0
+                section = ('<div class="ladi-section"><p>Nội dung landing page ' + 'x' * 200 + '</p></div>\n').encode()
+                while written < size:
+                    f.write(section * 256)
+                    written += len(section) * 256
+                f.write(b'</body></html>')
+            else:
+                for _ in range(max(size // CHUNK, 1)):
+                    f.write(os.urandom(CHUNK))
+            f.write(b'\r\n')
+        f.write(f'--{boundary}--\r\n'.encode())
+
+
+def call(app, method, path, body_path, boundary):
+    with open(body_path, 'rb') as body:
+        environ = {
+            'REQUEST_METHOD': method, 'PATH_INFO': path, 'SCRIPT_NAME': '', 'QUERY_STRING': '',
+            'SERVER_NAME': 'localhost', 'SERVER_PORT': '80', 'SERVER_PROTOCOL': 'HTTP/1.1',
+            'wsgi.url_scheme': 'http', 'wsgi.input': body, 'wsgi.errors': sys.stderr,
+            'wsgi.multithread': False, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+            'CONTENT_TYPE': f'multipart/form-data; boundary={boundary}',
+            'CONTENT_LENGTH': str(os.path.getsize(body_path)),
+        }
+        status = []
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        chunks = app(environ, lambda s, h, e=None: status.append(s))
+        b''.join(chunks)
+        peak = tracemalloc.get_traced_memory()[1] - base
+    return status[0], peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,4,16', help='index.html sizes in MB, comma separated')
+    parser.add_argument('--images', type=int, default=3)
+    parser.add_argument('--image-mb', type=int, default=4)
+    parser.add_argument('--max-ratio', type=float, default=2.0)
+    args = parser.parse_args()
+
+    work = tempfile.mkdtemp(prefix='upload-mem-')
+    os.environ.update(PUBLISHED_ROOT=os.path.join(work, 'published'), UPLOAD_FOLDER=os.path.join(work, 'uploads'),
+                      IMAGE_OPTIMIZE='false', ROLLUP_INTERVAL='0', MAX_CONTENT_LENGTH=str(1 << 31))
+    os.chdir(work)  # database.db is created in the working directory
+    from app import create_app
+    app = create_app()
+    app.config.update(LOGIN_DISABLED=True, WTF_CSRF_ENABLED=False)
+
+    tracemalloc.start()
+    results = []
+    for size in [float(s) for s in args.sizes.split(',')]:
+        subdomain = f'mem{str(size).replace(".", "")}'
+        boundary = uuid.uuid4().hex
+        body = os.path.join(work, f'{subdomain}.body')
+        images = [('images', f'anh{i}.jpg', args.image_mb * CHUNK, 'image') for i in range(1, args.images + 1)]
+        write_multipart(body, boundary, {'subdomain': subdomain},
+                        [('file', 'index.html', int(size * CHUNK), 'html')] + images)
+        create_status, create_peak = call(app, 'POST', '/api/landingpages', body, boundary)
+
+        write_multipart(body, boundary, {'phone_tracking': '<script>window.x=1</script>'}, [])
+        with app.app_context():
+            from app import repository
+            landing_id = repository.get_by_subdomain(subdomain)['id']
+        update_status, update_peak = call(app, 'PUT', f'/api/landingpages/{landing_id}', body, boundary)
+        os.remove(body)
+        results.append({
+            'html_mb': size,
+            'images_mb': args.images * args.image_mb,
+            'create_status': create_status,
+            'create_peak_kb': round(create_peak / 1024, 1),
+            'update_status': update_status,
+            'update_peak_kb': round(update_peak / 1024, 1),
+        })
+    tracemalloc.stop()
+    print(json.dumps(results, indent=2))
+
+    peaks = [max(r['create_peak_kb'], r['update_peak_kb']) for r in results]
+    if any(not r['create_status'].startswith('200') or not r['update_status'].startswith('200') for r in results):
+        raise SystemExit('upload request failed')
+    if peaks[-1] > args.max_ratio * peaks[0]:
+        raise SystemExit(f'peak memory grows with page size: {peaks}')
+
+
+if __name__ == '__main__':
+    main()